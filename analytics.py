@@ -3,10 +3,135 @@
 Advanced booking analytics and reporting features
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from datetime import date as Date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List
 import json
-from collections import defaultdict
+import math
+
+from indexes import normalize_email
+
+
+@lru_cache(maxsize=4096)
+def _weekday_name(day: str) -> str:
+    """Weekday name for a YYYY-MM-DD string"""
+    return Date.fromisoformat(day).strftime("%A")
+
+
+def _route_name(train) -> str:
+    return f"{train.source} → {train.destination}"
+
+
+class BookingAggregates:
+    """Booking counts and revenue kept up to date on every booking and cancellation
+
+    Totals are bucketed per booking day, per route, per hour of day, per weekday
+    and per passenger, so reports read the buckets they need instead of
+    scanning (and re-parsing) every booking. Revenue is the ticket price at
+    the time of booking, which is remembered per confirmed booking so a
+    cancellation after a price change takes back what was counted. Bookings
+    replayed on startup count at the current prices.
+    """
+
+    def __init__(self):
+        self.totals = self._bucket()
+        self.by_day = {}
+        self.routes_by_day = {}
+        self.by_route = {}
+        self.by_hour = {}
+        self.by_weekday = {}
+        self.booked_prices = {}  # Confirmed booking ID -> price counted for it
+        self.passenger_bookings = {}
+        self.passenger_names = {}
+        self.repeat_customers = 0
+        self.most_frequent_passenger = None
+
+    @staticmethod
+    def _bucket() -> Dict:
+        return {"bookings": 0, "confirmed": 0, "cancelled": 0, "revenue": 0.0}
+
+    @classmethod
+    def from_bookings(cls, bookings: Iterable, trains: Dict) -> "BookingAggregates":
+        """Build aggregates from scratch by replaying every booking"""
+        aggregates = cls()
+        for booking in bookings:
+            train = trains.get(booking.train_id)
+            aggregates.record_booking(booking, train)
+            if booking.status == "Cancelled":
+                aggregates.record_cancellation(booking, train)
+        return aggregates
+
+    def _buckets(self, booking, train) -> List[Dict]:
+        """Buckets a booking counts towards, creating them on first use"""
+        day = booking.booking_date[:10]
+        buckets = [self.totals, self.by_day.setdefault(day, self._bucket())]
+        if train is not None:
+            buckets.append(self.by_route.setdefault(_route_name(train), self._bucket()))
+        return buckets
+
+    def record_booking(self, booking, train):
+        """Count a newly confirmed booking"""
+        price = self.booked_prices[booking.booking_id] = train.price if train is not None else 0.0
+        for bucket in self._buckets(booking, train):
+            bucket["bookings"] += 1
+            bucket["confirmed"] += 1
+            bucket["revenue"] += price
+
+        day = booking.booking_date[:10]
+        if train is not None:
+            routes = self.routes_by_day.setdefault(day, {})
+            route = _route_name(train)
+            routes[route] = routes.get(route, 0) + 1
+
+        if len(booking.booking_date) > 10:  # Date-only booking dates have no hour to count
+            hour = datetime.fromisoformat(booking.booking_date).hour
+            self.by_hour[hour] = self.by_hour.get(hour, 0) + 1
+        weekday = _weekday_name(day)
+        self.by_weekday[weekday] = self.by_weekday.get(weekday, 0) + 1
+
+        email = normalize_email(booking.passenger.email)
+        count = self.passenger_bookings.get(email, 0) + 1
+        self.passenger_bookings[email] = count
+        if count == 1:
+            self.passenger_names[email] = booking.passenger.name
+        elif count == 2:
+            self.repeat_customers += 1
+        if self.most_frequent_passenger is None or count > self.passenger_bookings[self.most_frequent_passenger]:
+            self.most_frequent_passenger = email
+
+    def record_cancellation(self, booking, train):
+        """Move a booking's contribution from confirmed to cancelled"""
+        price = self.booked_prices.pop(booking.booking_id, 0.0)
+        for bucket in self._buckets(booking, train):
+            bucket["confirmed"] -= 1
+            bucket["cancelled"] += 1
+            bucket["revenue"] -= price
+
+    def snapshot(self) -> Dict:
+        """All aggregate values, for comparing two aggregate stores"""
+        return {
+            "totals": self.totals,
+            "by_day": self.by_day,
+            "routes_by_day": self.routes_by_day,
+            "by_route": self.by_route,
+            "by_hour": self.by_hour,
+            "by_weekday": self.by_weekday,
+            "passenger_bookings": self.passenger_bookings,
+            "repeat_customers": self.repeat_customers
+        }
+
+    def matches(self, other: "BookingAggregates") -> bool:
+        """Whether two aggregate stores agree (revenue compared with a float tolerance)"""
+        return _close(self.snapshot(), other.snapshot())
+
+
+def _close(left, right) -> bool:
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(_close(left[key], right[key]) for key in left)
+    if isinstance(left, float) or isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-6)
+    return left == right
+
 
 class BookingAnalytics:
     """Advanced analytics for booking data"""
@@ -14,98 +139,81 @@ class BookingAnalytics:
     def __init__(self, booking_system):
         self.system = booking_system
     
+    @property
+    def aggregates(self) -> BookingAggregates:
+        return self.system.aggregates
+    
     def generate_daily_report(self, date: str = None) -> Dict:
         """Generate daily booking report"""
         if date is None:
             date = datetime.now().strftime("%Y-%m-%d")
         
-        daily_bookings = [
-            booking for booking in self.system.bookings.values()
-            if booking.booking_date.startswith(date)
-        ]
-        
-        total_revenue = sum(
-            self.system.trains[booking.train_id].price 
-            for booking in daily_bookings 
-            if booking.status == "Confirmed"
-        )
+        day = self.aggregates.by_day.get(date, BookingAggregates._bucket())
+        routes = self.aggregates.routes_by_day.get(date, {})
         
         return {
             "date": date,
-            "total_bookings": len(daily_bookings),
-            "confirmed_bookings": len([b for b in daily_bookings if b.status == "Confirmed"]),
-            "cancelled_bookings": len([b for b in daily_bookings if b.status == "Cancelled"]),
-            "total_revenue": total_revenue,
-            "popular_routes": self._get_popular_routes(daily_bookings)
+            "total_bookings": day["bookings"],
+            "confirmed_bookings": day["confirmed"],
+            "cancelled_bookings": day["cancelled"],
+            "total_revenue": day["revenue"],
+            "popular_routes": sorted(routes.items(), key=lambda x: x[1], reverse=True)[:5]
         }
     
     def generate_weekly_report(self) -> Dict:
         """Generate weekly booking statistics"""
         end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-        
-        weekly_bookings = [
-            booking for booking in self.system.bookings.values()
-            if start_date <= datetime.strptime(booking.booking_date.split()[0], "%Y-%m-%d") <= end_date
-        ]
+        days = [(end_date - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(6, -1, -1)]
+        week = [(day, self.aggregates.by_day[day]) for day in days if day in self.aggregates.by_day]
         
         return {
             "week_ending": end_date.strftime("%Y-%m-%d"),
-            "total_bookings": len(weekly_bookings),
-            "daily_breakdown": self._get_daily_breakdown(weekly_bookings),
+            "total_bookings": sum(bucket["bookings"] for _, bucket in week),
+            "daily_breakdown": {day: bucket["bookings"] for day, bucket in week},
             "train_utilization": self._calculate_train_utilization(),
-            "revenue_trend": self._calculate_revenue_trend(weekly_bookings)
+            "revenue_trend": [
+                {"date": day, "revenue": bucket["revenue"]}
+                for day, bucket in week if bucket["confirmed"] > 0
+            ]
         }
     
     def get_passenger_insights(self) -> Dict:
         """Analyze passenger booking patterns"""
-        passenger_data = defaultdict(list)
+        aggregates = self.aggregates
+        passengers = len(aggregates.passenger_bookings)
         
-        for booking in self.system.bookings.values():
-            passenger_data[booking.passenger.email].append(booking)
+        most_frequent = {"email": "None", "bookings": 0}
+        if aggregates.most_frequent_passenger is not None:
+            email = aggregates.most_frequent_passenger
+            most_frequent = {
+                "email": email,
+                "bookings": aggregates.passenger_bookings[email],
+                "name": aggregates.passenger_names[email]
+            }
         
-        insights = {
-            "total_unique_passengers": len(passenger_data),
-            "repeat_customers": len([p for p in passenger_data.values() if len(p) > 1]),
-            "average_bookings_per_passenger": sum(len(bookings) for bookings in passenger_data.values()) / len(passenger_data) if passenger_data else 0,
-            "most_frequent_passenger": self._get_most_frequent_passenger(passenger_data)
+        return {
+            "total_unique_passengers": passengers,
+            "repeat_customers": aggregates.repeat_customers,
+            "average_bookings_per_passenger": aggregates.totals["bookings"] / passengers if passengers else 0,
+            "most_frequent_passenger": most_frequent
         }
-        
-        return insights
     
     def get_route_performance(self) -> List[Dict]:
         """Analyze performance of different routes"""
-        route_stats = defaultdict(lambda: {"bookings": 0, "revenue": 0, "cancellations": 0})
-        
-        for booking in self.system.bookings.values():
-            train = self.system.trains[booking.train_id]
-            route = f"{train.source} → {train.destination}"
-            
-            route_stats[route]["bookings"] += 1
-            if booking.status == "Confirmed":
-                route_stats[route]["revenue"] += train.price
-            else:
-                route_stats[route]["cancellations"] += 1
-        
         return [
             {
                 "route": route,
                 "total_bookings": stats["bookings"],
                 "revenue": stats["revenue"],
-                "cancellation_rate": (stats["cancellations"] / stats["bookings"] * 100) if stats["bookings"] > 0 else 0
+                "cancellation_rate": (stats["cancelled"] / stats["bookings"] * 100) if stats["bookings"] > 0 else 0
             }
-            for route, stats in route_stats.items()
+            for route, stats in self.aggregates.by_route.items()
         ]
     
     def predict_peak_times(self) -> Dict:
         """Predict peak booking times based on historical data"""
-        hour_bookings = defaultdict(int)
-        day_bookings = defaultdict(int)
-        
-        for booking in self.system.bookings.values():
-            booking_time = datetime.strptime(booking.booking_date, "%Y-%m-%d %H:%M:%S")
-            hour_bookings[booking_time.hour] += 1
-            day_bookings[booking_time.strftime("%A")] += 1
+        hour_bookings = self.aggregates.by_hour
+        day_bookings = self.aggregates.by_weekday
         
         peak_hour = max(hour_bookings.items(), key=lambda x: x[1]) if hour_bookings else (0, 0)
         peak_day = max(day_bookings.items(), key=lambda x: x[1]) if day_bookings else ("Unknown", 0)
@@ -119,26 +227,10 @@ class BookingAnalytics:
             "daily_distribution": dict(day_bookings)
         }
     
-    def _get_popular_routes(self, bookings: List) -> List[Tuple[str, int]]:
-        """Get most popular routes from bookings"""
-        route_count = defaultdict(int)
-        
-        for booking in bookings:
-            train = self.system.trains[booking.train_id]
-            route = f"{train.source} → {train.destination}"
-            route_count[route] += 1
-        
-        return sorted(route_count.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    def _get_daily_breakdown(self, bookings: List) -> Dict:
-        """Get daily breakdown of bookings"""
-        daily_count = defaultdict(int)
-        
-        for booking in bookings:
-            date = booking.booking_date.split()[0]
-            daily_count[date] += 1
-        
-        return dict(daily_count)
+    def verify_aggregates(self) -> bool:
+        """Rebuild the aggregates from scratch and check they match the live ones"""
+        rebuilt = BookingAggregates.from_bookings(list(self.system.bookings.values()), self.system.trains)
+        return rebuilt.matches(self.aggregates)
     
     def _calculate_train_utilization(self) -> Dict:
         """Calculate utilization rate for each train"""
@@ -156,33 +248,6 @@ class BookingAnalytics:
         
         return utilization
     
-    def _calculate_revenue_trend(self, bookings: List) -> List[Dict]:
-        """Calculate revenue trend over time"""
-        daily_revenue = defaultdict(float)
-        
-        for booking in bookings:
-            if booking.status == "Confirmed":
-                date = booking.booking_date.split()[0]
-                train = self.system.trains[booking.train_id]
-                daily_revenue[date] += train.price
-        
-        return [
-            {"date": date, "revenue": revenue}
-            for date, revenue in sorted(daily_revenue.items())
-        ]
-    
-    def _get_most_frequent_passenger(self, passenger_data: Dict) -> Dict:
-        """Find the most frequent passenger"""
-        if not passenger_data:
-            return {"email": "None", "bookings": 0}
-        
-        most_frequent = max(passenger_data.items(), key=lambda x: len(x[1]))
-        return {
-            "email": most_frequent[0],
-            "bookings": len(most_frequent[1]),
-            "name": most_frequent[1][0].passenger.name if most_frequent[1] else "Unknown"
-        }
-    
     def export_analytics_report(self, filename: str = None) -> str:
         """Export comprehensive analytics report"""
         if filename is None:
@@ -237,17 +302,11 @@ class RevenueOptimizer:
     def calculate_optimal_capacity(self) -> Dict:
         """Calculate optimal capacity for each route"""
         # This is a simplified calculation
-        route_demand = defaultdict(int)
-        
-        for booking in self.system.bookings.values():
-            train = self.system.trains[booking.train_id]
-            route = f"{train.source}-{train.destination}"
-            route_demand[route] += 1
+        route_demand = self.system.aggregates.by_route
         
         recommendations = {}
         for train_id, train in self.system.trains.items():
-            route = f"{train.source}-{train.destination}"
-            demand = route_demand.get(route, 0)
+            demand = route_demand.get(_route_name(train), {}).get("bookings", 0)
             
             recommendations[train_id] = {
                 "current_capacity": train.total_seats,
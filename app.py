@@ -4,42 +4,164 @@ Web-based Train Booking System
 A beautiful, modern web interface for the train booking system with worldwide cities
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, current_app
+from werkzeug.local import LocalProxy
 from datetime import datetime, timedelta
+import hashlib
 import json
 import os
+import time
 import uuid
 import secrets
 from main import TrainBookingSystem, Train, Passenger, Booking
-from cities import (WORLD_CITIES, COUNTRIES_AND_CITIES, REGIONS, 
+from inventory import bookable_day
+from config import (DEFAULT_DATA_FILE, MIN_PASSENGER_AGE, MAX_PASSENGER_AGE, MAX_BATCH_BOOKING_SIZE,
+                    MAX_BOOKING_ADVANCE_DAYS, RESPONSE_CACHE_BYTES, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, WRITE_ACK)
+from performance import CacheManager
+import cities
+from cities import (get_all_cities, get_all_regions,
                    get_all_countries, get_cities_by_country, get_countries_by_region,
-                   search_cities_in_country, search_countries, get_country_for_city, get_region_for_country)
+                   search_cities_in_country, search_countries, search_cities as search_city_names,
+                   get_country_for_city, get_region_for_country, annotate_routes)
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+# Views and error handlers are collected here and registered on every app made by create_app
+_routes = []
+_error_handlers = []
 
-# Initialize the booking system
-booking_system = TrainBookingSystem()
+def route(rule, **options):
+    """Register a view on apps made by create_app, like app.route"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
 
-@app.route('/')
+def errorhandler(code):
+    """Register an error handler on apps made by create_app, like app.errorhandler"""
+    def decorator(handler):
+        _error_handlers.append((code, handler))
+        return handler
+    return decorator
+
+class ResponseCache:
+    """Serialized response data keyed by request and data version
+    
+    Keys include the booking system's data version, so every booking,
+    cancellation or timetable change makes older entries unreachable and
+    they simply age out of the LRU.
+    """
+    
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl_seconds: int = RESPONSE_CACHE_TTL,
+                 max_bytes: int = RESPONSE_CACHE_BYTES):
+        self.entries = CacheManager(max_size, ttl_seconds, max_bytes=max_bytes)
+    
+    def get_or_build(self, key, build):
+        """Cached value for key, building and storing it on a miss"""
+        value = self.entries.get(key)
+        if value is None:
+            value = build()
+            self.entries.set(key, value)
+        return value
+    
+    def get_stats(self) -> dict:
+        """Cache size plus hit and miss counts"""
+        return self.entries.get_stats()
+
+# The booking system and response cache of the app handling the current request
+booking_system = LocalProxy(lambda: current_app.extensions['booking_system'])
+response_cache = LocalProxy(lambda: current_app.extensions['response_cache'])
+
+def cached_json(key, build, versioned: bool = True):
+    """JSON response from the response cache, answering conditional requests with 304
+    
+    versioned responses depend on trains and bookings; the rest (city data)
+    never change while the app runs.
+    """
+    if versioned:
+        version, last_modified = booking_system.data_version, booking_system.last_modified
+    else:
+        version, last_modified = None, current_app.extensions['started_at']
+    
+    def serialize():
+        body = current_app.json.dumps(build()).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest(), last_modified
+    
+    body, etag, modified = response_cache.get_or_build((key, version), serialize)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True  # Clients revalidate, seat counts change
+    return response.make_conditional(request)
+
+def acknowledge(endpoint: str):
+    """Wait for the change just made to reach disk if the endpoint acks synchronously
+    
+    Only matters while a background writer is attached; otherwise the change
+    was written before the booking call returned.
+    """
+    if WRITE_ACK.get(endpoint, "sync") == "sync":
+        booking_system.wait_durable()
+
+def create_app(data_file: str = DEFAULT_DATA_FILE, storage_mode: str = None,
+               preload_cities: bool = True, group_commit: bool = None) -> Flask:
+    """Build the web app with its own booking system
+    
+    Importing this module does no work; with a pre-forking server, calling
+    create_app in the parent loads the city data and indexes once so workers
+    share them copy-on-write.
+    """
+    app = Flask(__name__)
+    app.secret_key = secrets.token_hex(16)
+    app.extensions['booking_system'] = TrainBookingSystem(data_file, storage_mode, group_commit)
+    app.extensions['response_cache'] = ResponseCache()
+    app.extensions['started_at'] = time.time()
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for code, handler in _error_handlers:
+        app.register_error_handler(code, handler)
+    if preload_cities:
+        cities.preload()
+    return app
+
+_default_app = None
+
+def __getattr__(name):
+    """Build a default app on first use of app.app, for scripts that import it directly"""
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@route('/')
 def index():
     """Home page with search functionality"""
     return render_template('index.html')
 
-@app.route('/search', methods=['POST'])
+@route('/search', methods=['POST'])
 def search_trains():
     """Search for trains based on source and destination"""
     source = request.form.get('source', '').strip()
     destination = request.form.get('destination', '').strip()
+    journey_date = request.form.get('journey_date', '').strip() or None
     
     if not source or not destination:
         flash('Please enter both source and destination', 'error')
         return redirect(url_for('index'))
     
-    trains = booking_system.search_trains(source, destination)
-    return render_template('search_results.html', trains=trains, source=source, destination=destination)
+    def search():
+        found = booking_system.search_trains(source, destination, journey_date)
+        return ([train.train_id for train in found],
+                {train.train_id: train.seats_on(journey_date) for train in found} if journey_date else {})
+    
+    # Cache the search itself; the page is still rendered per request for flash messages
+    key = ('search', source.lower(), destination.lower(), journey_date, booking_system.data_version)
+    train_ids, seats = response_cache.get_or_build(key, search)
+    trains = [booking_system.trains[train_id] for train_id in train_ids]
+    return render_template('search_results.html', trains=trains, source=source, destination=destination,
+                           journey_date=journey_date, seats=seats)
 
-@app.route('/book/<train_id>')
+@route('/book/<train_id>')
 def book_form(train_id):
     """Show booking form for selected train"""
     train = booking_system.trains.get(train_id)
@@ -49,7 +171,7 @@ def book_form(train_id):
     
     return render_template('booking_form.html', train=train)
 
-@app.route('/book', methods=['POST'])
+@route('/book', methods=['POST'])
 def book_ticket():
     """Process ticket booking"""
     try:
@@ -97,6 +219,9 @@ def book_ticket():
         if not journey_date:
             flash('Please select your journey date', 'error')
             return redirect(url_for('book_form', train_id=train_id))
+        if bookable_day(journey_date) is None:
+            flash(f'Journey dates can be booked from today up to {MAX_BOOKING_ADVANCE_DAYS} days ahead', 'error')
+            return redirect(url_for('book_form', train_id=train_id))
         
         # Check if train exists
         if train_id not in booking_system.trains:
@@ -108,11 +233,12 @@ def book_ticket():
         booking = booking_system.book_ticket(train_id, passenger, journey_date)
         
         if booking:
+            acknowledge('book')
             session['last_booking'] = booking.booking_id
             flash('Booking successful!', 'success')
             return redirect(url_for('booking_confirmation', booking_id=booking.booking_id))
         else:
-            flash('Booking failed. No seats available on this train.', 'error')
+            flash('Booking failed. No seats available on this train for the selected date.', 'error')
             return redirect(url_for('book_form', train_id=train_id))
             
     except Exception as e:
@@ -120,7 +246,57 @@ def book_ticket():
         flash(f'An error occurred during booking: {str(e)}', 'error')
         return redirect(url_for('index'))
 
-@app.route('/booking/<booking_id>')
+@route('/api/bookings/batch', methods=['POST'])
+def api_book_batch():
+    """API endpoint to book a group of passengers on one train in a single request"""
+    data = request.get_json(silent=True) or {}
+    train_id = str(data.get('train_id', '')).strip()
+    journey_date = str(data.get('journey_date', '')).strip()
+    passengers_data = data.get('passengers')
+    
+    if not train_id or not journey_date:
+        return jsonify({'error': 'train_id and journey_date are required'}), 400
+    if bookable_day(journey_date) is None:
+        return jsonify({'error': f'journey_date must be a YYYY-MM-DD date from today up to '
+                                 f'{MAX_BOOKING_ADVANCE_DAYS} days ahead'}), 400
+    if not isinstance(passengers_data, list) or not passengers_data:
+        return jsonify({'error': 'passengers must be a non-empty list'}), 400
+    if len(passengers_data) > MAX_BATCH_BOOKING_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_BOOKING_SIZE} passengers per request'}), 400
+    if train_id not in booking_system.trains:
+        return jsonify({'error': 'Train not found'}), 404
+    
+    passengers = []
+    for index, passenger_data in enumerate(passengers_data):
+        if not isinstance(passenger_data, dict):
+            return jsonify({'error': f'Passenger {index + 1} must be an object'}), 400
+        fields = {field: str(passenger_data.get(field, '')).strip()
+                  for field in ('name', 'gender', 'phone', 'email')}
+        missing = [field for field, value in fields.items() if not value]
+        if missing:
+            return jsonify({'error': f'Passenger {index + 1} is missing: {", ".join(missing)}'}), 400
+        try:
+            age = int(passenger_data.get('age'))
+        except (TypeError, ValueError):
+            age = 0
+        if age < MIN_PASSENGER_AGE or age > MAX_PASSENGER_AGE:
+            return jsonify({'error': f'Passenger {index + 1} needs an age between '
+                                     f'{MIN_PASSENGER_AGE} and {MAX_PASSENGER_AGE}'}), 400
+        passengers.append(Passenger(fields['name'], age, fields['gender'], fields['phone'], fields['email']))
+    
+    bookings = booking_system.book_tickets_batch(train_id, passengers, journey_date)
+    if bookings is None:
+        return jsonify({'error': f'Not enough seats for {len(passengers)} passengers on {journey_date}'}), 409
+    acknowledge('book_batch')
+    
+    return jsonify({
+        'train_id': train_id,
+        'journey_date': journey_date,
+        'booking_ids': [booking.booking_id for booking in bookings],
+        'total_price': booking_system.trains[train_id].price * len(bookings)
+    }), 201
+
+@route('/booking/<booking_id>')
 def booking_confirmation(booking_id):
     """Show booking confirmation"""
     booking = booking_system.get_booking(booking_id)
@@ -131,12 +307,12 @@ def booking_confirmation(booking_id):
     train = booking_system.trains[booking.train_id]
     return render_template('booking_confirmation.html', booking=booking, train=train)
 
-@app.route('/my-bookings')
+@route('/my-bookings')
 def my_bookings():
     """Show form to view user's bookings"""
     return render_template('my_bookings.html')
 
-@app.route('/my-bookings', methods=['POST'])
+@route('/my-bookings', methods=['POST'])
 def view_bookings():
     """View all bookings for an email"""
     email = request.form.get('email', '').strip()
@@ -147,17 +323,18 @@ def view_bookings():
     bookings = booking_system.get_passenger_bookings(email)
     return render_template('bookings_list.html', bookings=bookings, email=email, booking_system=booking_system)
 
-@app.route('/cancel/<booking_id>')
+@route('/cancel/<booking_id>')
 def cancel_booking(booking_id):
     """Cancel a booking"""
     if booking_system.cancel_booking(booking_id):
+        acknowledge('cancel')
         flash('Booking cancelled successfully', 'success')
     else:
         flash('Booking not found or already cancelled', 'error')
     
     return redirect(url_for('index'))
 
-@app.route('/system-status')
+@route('/system-status')
 def system_status():
     """Show system status page"""
     # Get system statistics
@@ -166,6 +343,7 @@ def system_status():
     confirmed_bookings = sum(1 for b in booking_system.bookings.values() if b.status == "Confirmed")
     cancelled_bookings = sum(1 for b in booking_system.bookings.values() if b.status == "Cancelled")
     total_seats = sum(train.available_seats for train in booking_system.trains.values())
+    writer = booking_system.writer
     
     stats = {
         'total_trains': total_trains,
@@ -173,50 +351,52 @@ def system_status():
         'confirmed_bookings': confirmed_bookings,
         'cancelled_bookings': cancelled_bookings,
         'total_seats': total_seats,
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'response_cache': response_cache.get_stats(),
+        'writer': writer.get_stats() if writer is not None else None
     }
     
     return render_template('system_status.html', stats=stats)
 
-@app.route('/api/trains')
+@route('/api/trains')
 def api_trains():
     """API endpoint for train data"""
-    trains_data = []
-    for train in booking_system.trains.values():
-        trains_data.append({
-            'train_id': train.train_id,
-            'name': train.name,
-            'source': train.source,
-            'destination': train.destination,
-            'departure_time': train.departure_time,
-            'arrival_time': train.arrival_time,
-            'available_seats': train.available_seats,
-            'price': train.price
-        })
-    return jsonify(trains_data)
-
-@app.route('/api/cities')
+    def build():
+        trains_data = []
+        for train in list(booking_system.trains.values()):
+            trains_data.append({
+                'train_id': train.train_id,
+                'name': train.name,
+                'source': train.source,
+                'destination': train.destination,
+                'departure_time': train.departure_time,
+                'arrival_time': train.arrival_time,
+                'available_seats': train.available_seats,
+                'price': train.price
+            })
+        return annotate_routes(trains_data)
+    return cached_json('trains', build)
+
+@route('/api/cities')
 def get_cities():
     """API endpoint to get all available cities"""
-    return jsonify(WORLD_CITIES)
+    return cached_json('cities', get_all_cities, versioned=False)
 
-@app.route('/api/cities/search')
+@route('/api/cities/search')
 def search_cities():
     """API endpoint to search cities for autocomplete"""
-    query = request.args.get('q', '').lower()
+    query = request.args.get('q', '').strip()
     if len(query) < 2:
         return jsonify([])
     
-    matching_cities = [city for city in WORLD_CITIES if query in city.lower()]
-    # Limit to 10 results for better performance
-    return jsonify(matching_cities[:10])
+    return jsonify(search_city_names(query, limit=10))
 
-@app.route('/api/countries')
+@route('/api/countries')
 def get_countries():
     """API endpoint to get all available countries"""
-    return jsonify(get_all_countries())
+    return cached_json('countries', get_all_countries, versioned=False)
 
-@app.route('/api/countries/search')
+@route('/api/countries/search')
 def search_countries_api():
     """API endpoint to search countries for autocomplete"""
     query = request.args.get('q', '').lower()
@@ -226,13 +406,13 @@ def search_countries_api():
     matching_countries = search_countries(query, limit=10)
     return jsonify(matching_countries)
 
-@app.route('/api/countries/<country>/cities')
+@route('/api/countries/<country>/cities')
 def get_cities_by_country_api(country):
     """API endpoint to get cities for a specific country"""
     cities = get_cities_by_country(country)
     return jsonify(cities)
 
-@app.route('/api/countries/<country>/cities/search')
+@route('/api/countries/<country>/cities/search')
 def search_cities_in_country_api(country):
     """API endpoint to search cities within a specific country"""
     query = request.args.get('q', '').lower()
@@ -242,20 +422,20 @@ def search_cities_in_country_api(country):
     matching_cities = search_cities_in_country(country, query, limit=10)
     return jsonify(matching_cities)
 
-@app.route('/api/regions')
+@route('/api/regions')
 def get_regions():
     """API endpoint to get countries grouped by regions"""
-    return jsonify(REGIONS)
+    return cached_json('regions', get_all_regions, versioned=False)
 
-@app.errorhandler(404)
+@errorhandler(404)
 def not_found(error):
     """404 error handler"""
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@errorhandler(500)
 def internal_error(error):
     """500 error handler"""
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
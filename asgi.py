@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the Train Booking Web Application
+Serve the existing Flask routes and templates from an ASGI server, e.g.
+
+    uvicorn asgi:app --workers 1
+    uvicorn asgi:create_asgi_app --factory
+"""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from app import create_app
+from async_booking import AsyncBookingService
+from config import ASGI_WORKER_THREADS, DEFAULT_DATA_FILE, GROUP_COMMIT_WINDOW
+
+
+def _build_environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ for an ASGI HTTP request"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue  # The body is already complete, whatever the client announced
+        if name == "CONTENT_TYPE":
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ: Dict) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    """Run a WSGI app to completion and return status, headers and body"""
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(" ", 1)[0]),
+                       [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]]
+
+    chunks = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return response[0], response[1], body
+
+
+class BookingAsgiApp:
+    """ASGI app serving the Flask booking app with group-committed writes
+
+    Flask views stay synchronous and run on a thread pool, so requests are
+    handled concurrently instead of one at a time. On lifespan startup an
+    AsyncBookingService takes over persistence: bookings and cancellations
+    allocate seats in memory, queue their change for the writer task, and
+    the view waits for the group commit before answering. Servers without
+    lifespan support keep the app's normal synchronous persistence.
+    """
+
+    def __init__(self, flask_app, commit_window: float = GROUP_COMMIT_WINDOW,
+                 threads: int = ASGI_WORKER_THREADS):
+        self.flask_app = flask_app
+        self.service = AsyncBookingService(flask_app.extensions['booking_system'], commit_window)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-view")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.service.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.stop()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        environ = _build_environ(scope, body)
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            self.executor, _call_wsgi, self.flask_app, environ)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+
+def create_asgi_app(data_file: str = DEFAULT_DATA_FILE, storage_mode: str = None,
+                    commit_window: float = GROUP_COMMIT_WINDOW) -> BookingAsgiApp:
+    """Build the Flask app and wrap it for an ASGI server"""
+    return BookingAsgiApp(create_app(data_file, storage_mode), commit_window)
+
+
+_default_app = None
+
+
+def __getattr__(name):
+    """Build the default ASGI app on first use of asgi.app"""
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_asgi_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Async booking service for Train Booking System
+Awaitable booking operations with group-committed persistence
+"""
+
+import asyncio
+from typing import List, Optional
+
+from config import GROUP_COMMIT_WINDOW
+from group_commit import GroupCommit
+from main import Booking, Passenger, Train, TrainBookingSystem
+
+
+class AsyncBookingService(GroupCommit):
+    """Awaitable front end to a TrainBookingSystem with a single writer task
+
+    Searches and seat allocation work on in-memory state and run inline, so
+    any number of them are served concurrently. Their changes are not written
+    by the caller: while the service runs it is attached as the system's
+    writer, and one task on the event loop collects every change made within
+    commit_window seconds and persists the group with a single snapshot or
+    journal sync. Booking operations return once their group is durable.
+
+    Threads (such as Flask views run by the ASGI bridge) can submit changes
+    too and block in wait() until they are durable.
+    """
+
+    def __init__(self, system: TrainBookingSystem, commit_window: float = GROUP_COMMIT_WINDOW):
+        super().__init__(system, commit_window)
+        self.loop = None
+        self._task = None
+        self._wakeup = None
+        self._async_waiters = []
+
+    async def start(self):
+        """Start the writer task on the running loop and take over persistence"""
+        if self._task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self.loop.create_task(self._run())
+        self.system.writer = self
+
+    async def stop(self):
+        """Write everything still queued and hand persistence back to the system"""
+        if self._task is None:
+            return
+        if self.system.writer is self:
+            self.system.writer = None
+        with self._durable_changed:
+            self._closed = True
+        try:
+            await self.wait_async()
+        finally:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait_async(self, seq: int = None):
+        """Wait until change seq (default: every change so far) is durable"""
+        with self._durable_changed:
+            if seq is None:
+                seq = self._submitted
+            if self._durable >= seq:
+                self._raise_failure(seq)
+                return
+            future = self.loop.create_future()
+            self._async_waiters.append((seq, future))
+        await future
+
+    def _wake(self):
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let the changes arriving in the next few milliseconds join this group
+            await asyncio.sleep(self.commit_window)
+            self._wakeup.clear()
+            first, last, records = self._take()
+            if records:
+                error = await self.loop.run_in_executor(None, self._write, records)
+                self._committed(first, last, error)
+
+    def _committed(self, first: int, last: int, error: Optional[Exception]):
+        super()._committed(first, last, error)
+        with self._durable_changed:
+            waiters, self._async_waiters = self._async_waiters, []
+            for seq, future in waiters:
+                if seq > last:
+                    self._async_waiters.append((seq, future))
+                elif future.done():
+                    continue
+                elif first <= seq and error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    async def search_trains(self, source: str, destination: str, date: str = None,
+                            departure_after: str = None, departure_before: str = None) -> List[Train]:
+        """Search trains; reads never wait for the writer"""
+        return self.system.search_trains(source, destination, date, departure_after, departure_before)
+
+    async def get_passenger_bookings(self, email: str) -> List[Booking]:
+        """All bookings for a passenger email"""
+        return self.system.get_passenger_bookings(email)
+
+    async def book_ticket(self, train_id: str, passenger: Passenger, journey_date: str) -> Optional[Booking]:
+        """Book a seat and return once the booking is durable"""
+        booking = self.system.book_ticket(train_id, passenger, journey_date)
+        if booking is not None:
+            await self.wait_async()
+        return booking
+
+    async def book_tickets_batch(self, train_id: str, passengers: List[Passenger],
+                                 journey_date: str) -> Optional[List[Booking]]:
+        """Book seats for a group and return once the bookings are durable"""
+        bookings = self.system.book_tickets_batch(train_id, passengers, journey_date)
+        if bookings:
+            await self.wait_async()
+        return bookings
+
+    async def cancel_booking(self, booking_id: str) -> bool:
+        """Cancel a booking and return once the cancellation is durable"""
+        cancelled = self.system.cancel_booking(booking_id)
+        if cancelled:
+            await self.wait_async()
+        return cancelled
@@ -1,297 +1,301 @@
 # 🌍 Worldwide Cities Database by Country
 # Supporting comprehensive train booking system for the entire world
+#
+# The data lives in cities_data.json and is loaded on first use, together with
+# the lookup tables and autocomplete indexes derived from it. Those are cached
+# in a pickle next to the data file so later processes skip rebuilding them.
 
-# Country-based cities database with comprehensive coverage
-COUNTRIES_AND_CITIES = {
-    # 🇺🇸 United States
-    "United States": [
-        "New York", "Los Angeles", "Chicago", "Houston", "Phoenix", "Philadelphia", "San Antonio",
-        "San Diego", "Dallas", "San Jose", "Austin", "Jacksonville", "Fort Worth", "Columbus",
-        "Charlotte", "San Francisco", "Indianapolis", "Seattle", "Denver", "Washington DC", "Boston",
-        "El Paso", "Nashville", "Detroit", "Oklahoma City", "Portland", "Las Vegas", "Memphis",
-        "Louisville", "Baltimore", "Milwaukee", "Albuquerque", "Tucson", "Fresno", "Sacramento",
-        "Kansas City", "Mesa", "Atlanta", "Colorado Springs", "Omaha", "Raleigh", "Miami", "Oakland",
-        "Minneapolis", "Tulsa", "Cleveland", "Wichita", "Arlington", "Tampa", "New Orleans",
-        "Honolulu", "Anaheim", "Aurora", "Santa Ana", "St. Louis", "Riverside", "Corpus Christi",
-        "Lexington", "Pittsburgh", "Anchorage", "Stockton", "Cincinnati", "Saint Paul", "Buffalo"
-    ],
-    
-    # 🇨🇦 Canada
-    "Canada": [
-        "Toronto", "Montreal", "Vancouver", "Calgary", "Edmonton", "Ottawa", "Winnipeg",
-        "Quebec City", "Hamilton", "Kitchener", "London", "Victoria", "Halifax", "Oshawa",
-        "Windsor", "Saskatoon", "Regina", "Sherbrooke", "St. John's", "Barrie", "Kelowna",
-        "Abbotsford", "Greater Sudbury", "Kingston", "Saguenay", "Trois-Rivières", "Guelph",
-        "Cambridge", "Whitby", "Coquitlam", "Saanich", "Milton", "Thunder Bay", "Burlington"
-    ],
-    
-    # 🇬🇧 United Kingdom
-    "United Kingdom": [
-        "London", "Birmingham", "Manchester", "Glasgow", "Liverpool", "Leeds", "Sheffield",
-        "Edinburgh", "Bristol", "Cardiff", "Leicester", "Coventry", "Belfast", "Nottingham",
-        "Kingston upon Hull", "Newcastle upon Tyne", "Stoke-on-Trent", "Southampton", "Derby",
-        "Portsmouth", "Brighton", "Plymouth", "Northampton", "Reading", "Luton", "Wolverhampton"
-    ],
-    
-    # 🇩🇪 Germany
-    "Germany": [
-        "Berlin", "Hamburg", "Munich", "Cologne", "Frankfurt", "Stuttgart", "Düsseldorf", "Leipzig",
-        "Dortmund", "Essen", "Bremen", "Dresden", "Hannover", "Nuremberg", "Duisburg", "Bochum",
-        "Wuppertal", "Bielefeld", "Bonn", "Münster", "Mannheim", "Augsburg", "Wiesbaden", "Gelsenkirchen",
-        "Mönchengladbach", "Braunschweig", "Chemnitz", "Kiel", "Aachen", "Halle", "Magdeburg", "Freiburg"
-    ],
-    
-    # 🇫🇷 France
-    "France": [
-        "Paris", "Marseille", "Lyon", "Toulouse", "Nice", "Nantes", "Strasbourg", "Montpellier",
-        "Bordeaux", "Lille", "Rennes", "Reims", "Le Havre", "Saint-Étienne", "Toulon", "Grenoble",
-        "Dijon", "Angers", "Villeurbanne", "Saint-Denis", "Le Mans", "Aix-en-Provence", "Clermont-Ferrand",
-        "Brest", "Tours", "Limoges", "Amiens", "Annecy", "Perpignan", "Boulogne-Billancourt"
-    ],
-    
-    # 🇪🇸 Spain
-    "Spain": [
-        "Madrid", "Barcelona", "Valencia", "Seville", "Zaragoza", "Málaga", "Murcia", "Palma",
-        "Las Palmas", "Bilbao", "Alicante", "Córdoba", "Valladolid", "Vigo", "Gijón", "L'Hospitalet",
-        "A Coruña", "Granada", "Vitoria-Gasteiz", "Elche", "Santa Cruz de Tenerife", "Oviedo",
-        "Badalona", "Cartagena", "Terrassa", "Jerez de la Frontera", "Sabadell", "Móstoles"
-    ],
-    
-    # 🇮🇹 Italy
-    "Italy": [
-        "Rome", "Milan", "Naples", "Turin", "Palermo", "Genoa", "Bologna", "Florence", "Bari",
-        "Catania", "Venice", "Verona", "Messina", "Padua", "Trieste", "Taranto", "Brescia",
-        "Prato", "Reggio Calabria", "Modena", "Reggio Emilia", "Perugia", "Livorno", "Ravenna",
-        "Cagliari", "Foggia", "Rimini", "Salerno", "Ferrara", "Sassari", "Latina", "Giugliano"
-    ],
-    
-    # 🇯🇵 Japan
-    "Japan": [
-        "Tokyo", "Yokohama", "Osaka", "Nagoya", "Sapporo", "Fukuoka", "Kobe", "Kawasaki", "Kyoto",
-        "Saitama", "Hiroshima", "Sendai", "Kitakyushu", "Chiba", "Sakai", "Niigata", "Hamamatsu",
-        "Okayama", "Sagamihara", "Shizuoka", "Kumamoto", "Kagoshima", "Matsuyama", "Kanazawa",
-        "Utsunomiya", "Matsudo", "Kawaguchi", "Takasaki", "Oita", "Nara", "Toyama", "Nagasaki"
-    ],
-    
-    # 🇰🇷 South Korea
-    "South Korea": [
-        "Seoul", "Busan", "Incheon", "Daegu", "Daejeon", "Gwangju", "Suwon", "Ulsan", "Changwon",
-        "Goyang", "Yongin", "Bucheon", "Cheongju", "Ansan", "Jeonju", "Anyang", "Pohang", "Uijeongbu",
-        "Siheung", "Cheonan", "Hwaseong", "Gimhae", "Gumi", "Pyeongtaek", "Jinju", "Gunpo", "Osan"
-    ],
-    
-    # 🇨🇳 China
-    "China": [
-        "Beijing", "Shanghai", "Guangzhou", "Shenzhen", "Tianjin", "Wuhan", "Dongguan", "Chengdu",
-        "Nanjing", "Chongqing", "Xi'an", "Shenyang", "Hangzhou", "Foshan", "Zhengzhou", "Qingdao",
-        "Dalian", "Jinan", "Kunming", "Harbin", "Fuzhou", "Changchun", "Stone Mountain", "Wenzhou",
-        "Hefei", "Changsha", "Shijiazhuang", "Taiyuan", "Xuzhou", "Yantai", "Huizhou", "Weifang"
-    ],
-    
-    # 🇮🇳 India
-    "India": [
-        "Mumbai", "Delhi", "Bangalore", "Hyderabad", "Ahmedabad", "Chennai", "Kolkata", "Surat",
-        "Pune", "Jaipur", "Lucknow", "Kanpur", "Nagpur", "Indore", "Thane", "Bhopal", "Visakhapatnam",
-        "Pimpri-Chinchwad", "Patna", "Vadodara", "Ghaziabad", "Ludhiana", "Agra", "Nashik", "Faridabad",
-        "Meerut", "Rajkot", "Kalyan-Dombivali", "Vasai-Virar", "Varanasi", "Srinagar", "Dhanbad"
-    ],
-    
-    # 🇦🇺 Australia
-    "Australia": [
-        "Sydney", "Melbourne", "Brisbane", "Perth", "Adelaide", "Gold Coast", "Newcastle",
-        "Canberra", "Sunshine Coast", "Wollongong", "Hobart", "Geelong", "Townsville",
-        "Cairns", "Darwin", "Toowoomba", "Ballarat", "Bendigo", "Albury", "Launceston",
-        "Mackay", "Rockhampton", "Bunbury", "Bundaberg", "Coffs Harbour", "Wagga Wagga"
-    ],
-    
-    # 🇳🇿 New Zealand
-    "New Zealand": [
-        "Auckland", "Wellington", "Christchurch", "Hamilton", "Tauranga", "Napier-Hastings",
-        "Dunedin", "Palmerston North", "Nelson", "Rotorua", "New Plymouth", "Whangarei",
-        "Invercargill", "Whanganui", "Gisborne", "Timaru", "Pukekohe", "Papakura"
-    ],
-    
-    # 🇧🇷 Brazil
-    "Brazil": [
-        "São Paulo", "Rio de Janeiro", "Salvador", "Brasília", "Fortaleza", "Belo Horizonte",
-        "Manaus", "Curitiba", "Recife", "Porto Alegre", "Belém", "Goiânia", "Guarulhos",
-        "Campinas", "São Luís", "São Gonçalo", "Maceió", "Duque de Caxias", "Natal", "Teresina",
-        "Campo Grande", "Nova Iguaçu", "São Bernardo do Campo", "João Pessoa", "Santo André"
-    ],
-    
-    # 🇦🇷 Argentina
-    "Argentina": [
-        "Buenos Aires", "Córdoba", "Rosario", "Mendoza", "La Plata", "Tucumán", "Mar del Plata",
-        "Salta", "Santa Fe", "San Juan", "Resistencia", "Santiago del Estero", "Corrientes",
-        "Posadas", "Neuquén", "Bahía Blanca", "Paraná", "Formosa", "San Luis", "La Rioja"
-    ],
-    
-    # 🇲🇽 Mexico
-    "Mexico": [
-        "Mexico City", "Guadalajara", "Monterrey", "Puebla", "Tijuana", "León", "Juárez",
-        "Zapopan", "Nezahualcóyotl", "Chihuahua", "Naucalpan", "Mérida", "Álvaro Obregón",
-        "San Luis Potosí", "Aguascalientes", "Hermosillo", "Saltillo", "Mexicali", "Culiacán",
-        "Guadalupe", "Acapulco", "Tlalnepantla", "Cancún", "Querétaro", "Chimalhuacán"
-    ],
-    
-    # 🇷🇺 Russia
-    "Russia": [
-        "Moscow", "Saint Petersburg", "Novosibirsk", "Yekaterinburg", "Nizhny Novgorod", "Kazan",
-        "Chelyabinsk", "Omsk", "Samara", "Rostov-on-Don", "Ufa", "Krasnoyarsk", "Perm", "Voronezh",
-        "Volgograd", "Krasnodar", "Saratov", "Tyumen", "Tolyatti", "Izhevsk", "Barnaul", "Ulyanovsk"
-    ],
-    
-    # Additional countries with major cities
-    # 🇪🇬 Egypt
-    "Egypt": ["Cairo", "Alexandria", "Giza", "Shubra El Kheima", "Port Said", "Suez", "Luxor", "Mansoura", "El Mahalla El Kubra", "Tanta"],
-    
-    # 🇿🇦 South Africa
-    "South Africa": ["Johannesburg", "Cape Town", "Durban", "Pretoria", "Port Elizabeth", "Bloemfontein", "East London", "Nelspruit", "Kimberley", "Polokwane"],
-    
-    # 🇳🇬 Nigeria
-    "Nigeria": ["Lagos", "Kano", "Ibadan", "Kaduna", "Port Harcourt", "Benin City", "Maiduguri", "Zaria", "Aba", "Jos"],
-    
-    # 🇰🇪 Kenya
-    "Kenya": ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika", "Malindi", "Kitale", "Garissa", "Kakamega"],
-    
-    # 🇹🇭 Thailand
-    "Thailand": ["Bangkok", "Nonthaburi", "Pak Kret", "Hat Yai", "Chiang Mai", "Phuket", "Pattaya", "Udon Thani", "Nakhon Ratchasima", "Khon Kaen"],
-    
-    # 🇮🇩 Indonesia
-    "Indonesia": ["Jakarta", "Surabaya", "Bandung", "Bekasi", "Medan", "Depok", "Tangerang", "Palembang", "Semarang", "Makassar"],
-    
-    # 🇵🇭 Philippines
-    "Philippines": ["Manila", "Quezon City", "Caloocan", "Davao", "Cebu City", "Zamboanga", "Antipolo", "Pasig", "Taguig", "Valenzuela"],
-    
-    # 🇻🇳 Vietnam
-    "Vietnam": ["Ho Chi Minh City", "Hanoi", "Haiphong", "Da Nang", "Bien Hoa", "Hue", "Nha Trang", "Can Tho", "Rach Gia", "Qui Nhon"],
-    
-    # 🇲🇾 Malaysia
-    "Malaysia": ["Kuala Lumpur", "George Town", "Ipoh", "Shah Alam", "Petaling Jaya", "Johor Bahru", "Seremban", "Kuantan", "Kota Kinabalu", "Kuching"],
-    
-    # 🇸🇬 Singapore
-    "Singapore": ["Singapore"],
-    
-    # 🇳🇱 Netherlands
-    "Netherlands": ["Amsterdam", "Rotterdam", "The Hague", "Utrecht", "Eindhoven", "Tilburg", "Groningen", "Almere", "Breda", "Nijmegen"],
-    
-    # 🇧🇪 Belgium
-    "Belgium": ["Brussels", "Antwerp", "Ghent", "Charleroi", "Liège", "Bruges", "Namur", "Leuven", "Mons", "Aalst"],
-    
-    # 🇸🇪 Sweden
-    "Sweden": ["Stockholm", "Gothenburg", "Malmö", "Uppsala", "Västerås", "Örebro", "Linköping", "Helsingborg", "Jönköping", "Norrköping"],
-    
-    # 🇳🇴 Norway
-    "Norway": ["Oslo", "Bergen", "Trondheim", "Stavanger", "Bærum", "Kristiansand", "Fredrikstad", "Tromsø", "Sandnes", "Asker"],
-    
-    # 🇩🇰 Denmark
-    "Denmark": ["Copenhagen", "Aarhus", "Odense", "Aalborg", "Esbjerg", "Randers", "Kolding", "Horsens", "Vejle", "Roskilde"],
-    
-    # 🇫🇮 Finland
-    "Finland": ["Helsinki", "Espoo", "Tampere", "Vantaa", "Oulu", "Turku", "Jyväskylä", "Lahti", "Kuopio", "Pori"],
-    
-    # 🇵🇱 Poland
-    "Poland": ["Warsaw", "Kraków", "Łódź", "Wrocław", "Poznań", "Gdańsk", "Szczecin", "Bydgoszcz", "Lublin", "Białystok"],
-    
-    # 🇨🇿 Czech Republic
-    "Czech Republic": ["Prague", "Brno", "Ostrava", "Plzen", "Liberec", "Olomouc", "Ústí nad Labem", "České Budějovice", "Hradec Králové", "Pardubice"],
-    
-    # 🇦🇹 Austria
-    "Austria": ["Vienna", "Graz", "Linz", "Salzburg", "Innsbruck", "Klagenfurt", "Villach", "Wels", "Sankt Pölten", "Dornbirn"],
-    
-    # 🇨🇭 Switzerland
-    "Switzerland": ["Zurich", "Geneva", "Basel", "Lausanne", "Bern", "Winterthur", "Lucerne", "St. Gallen", "Lugano", "Biel/Bienne"],
-    
-    # 🇵🇹 Portugal
-    "Portugal": ["Lisbon", "Porto", "Vila Nova de Gaia", "Amadora", "Braga", "Setúbal", "Coimbra", "Queluz", "Funchal", "Almada"]
-}
-
-# Create flat list for backward compatibility
-WORLD_CITIES = []
-for country, cities in COUNTRIES_AND_CITIES.items():
-    WORLD_CITIES.extend(cities)
-
-
-# Regional groupings for better organization
-REGIONS = {
-    "North America": ["United States", "Canada", "Mexico"],
-    "Europe": ["United Kingdom", "Germany", "France", "Spain", "Italy", "Netherlands", "Belgium", 
-               "Sweden", "Norway", "Denmark", "Finland", "Poland", "Czech Republic", "Austria", "Switzerland", "Portugal"],
-    "Asia": ["Japan", "South Korea", "China", "India", "Thailand", "Indonesia", "Philippines", "Vietnam", "Malaysia", "Singapore"],
-    "Oceania": ["Australia", "New Zealand"],
-    "South America": ["Brazil", "Argentina"],
-    "Africa": ["Egypt", "South Africa", "Nigeria", "Kenya"],
-    "Eastern Europe & Russia": ["Russia"]
-}
+import json
+import os
+import pickle
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from types import MappingProxyType
+
+from config import CITIES_CACHE_FILE, CITIES_DATA_FILE
+
+# Autocomplete settings
+PREFIX_CACHE_DEPTH = 3  # prefixes up to this length keep a precomputed top list
+PREFIX_CACHE_SIZE = 32  # names kept per precomputed prefix
+
+
+def fold_text(text):
+    """Lowercase text and strip accents, so Sao matches São"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+class AutocompleteIndex:
+    """Ranked autocomplete over a list of names
+
+    Matches are ranked: exact match, then names starting with the query, then
+    names with a later word starting with it, then names containing it; ties
+    keep the order of the source list. Prefixes are answered from a sorted
+    array of name and word keys (a flattened trie); the shortest prefixes,
+    whose ranges are huge, get precomputed top lists instead. Contains-matches
+    come from n-gram posting lists, so no query scans every name.
+    """
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        self.folded = [fold_text(name) for name in self.names]
+        self.exact = {}
+        entries = []
+        self.grams = {}
+        for name_id, folded in enumerate(self.folded):
+            self.exact.setdefault(folded, []).append(name_id)
+            entries.append((folded, 1, name_id))
+            for start in range(1, len(folded)):
+                if folded[start].isalnum() and not folded[start - 1].isalnum():
+                    entries.append((folded[start:], 2, name_id))
+            for size in (1, 2, 3):
+                for start in range(len(folded) - size + 1):
+                    postings = self.grams.setdefault(folded[start:start + size], array("i"))
+                    if not postings or postings[-1] != name_id:
+                        postings.append(name_id)
+
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.key_ranks = [(tier, name_id) for _, tier, name_id in entries]
+        self.prefix_top = {}
+        for key, tier, name_id in entries:
+            for depth in range(1, min(PREFIX_CACHE_DEPTH, len(key)) + 1):
+                self.prefix_top.setdefault(key[:depth], []).append((tier, name_id))
+        for prefix, ranks in self.prefix_top.items():
+            ranks.sort()
+            self.prefix_top[prefix] = [name_id for _, name_id in ranks[:PREFIX_CACHE_SIZE]]
+
+    def _prefix_matches(self, query, limit):
+        """IDs of names with the name or a word starting with query, best first"""
+        if len(query) <= PREFIX_CACHE_DEPTH and limit <= PREFIX_CACHE_SIZE:
+            return self.prefix_top.get(query, [])
+        first = bisect_left(self.keys, query)
+        last = bisect_left(self.keys, query + "\U0010ffff", first)
+        return [name_id for _, name_id in sorted(self.key_ranks[first:last])]
+
+    def search(self, query, limit=10):
+        """Best matching names for an autocomplete query"""
+        query = fold_text(query)
+        if not query or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+
+        def take(name_ids):
+            for name_id in name_ids:
+                if name_id not in seen:
+                    seen.add(name_id)
+                    results.append(self.names[name_id])
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        if take(self.exact.get(query, ())) or take(self._prefix_matches(query, limit + len(seen))):
+            return results
+
+        # Contains-matches: walk the rarest n-gram's postings and check each candidate
+        size = min(3, len(query))
+        postings = min((self.grams.get(query[start:start + size], ())
+                        for start in range(len(query) - size + 1)), key=len)
+        take(name_id for name_id in postings if query in self.folded[name_id])
+        return results
+
+
+# Bump when the cached structures change shape so old caches are rebuilt
+CACHE_FORMAT = 1
+DATA_NAMES = ("COUNTRIES_AND_CITIES", "WORLD_CITIES", "REGIONS", "CITY_COUNTRIES", "COUNTRY_REGIONS")
+
+_data = None
+_data_lock = threading.Lock()
+
+
+def _data_path(filename):
+    """Resolve a data file name relative to this module"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+def _build_data(countries_and_cities, regions):
+    """Derive the flat city list, reverse lookups and autocomplete indexes"""
+    # Flat list for backward compatibility
+    world_cities = [city for cities in countries_and_cities.values() for city in cities]
+
+    # Reverse lookups: city -> every country it is in, country -> region
+    city_countries = {}
+    for country, cities in countries_and_cities.items():
+        for city in cities:
+            if country not in city_countries.get(city, ()):
+                city_countries[city] = city_countries.get(city, ()) + (country,)
+    country_regions = {}
+    for region, countries in regions.items():
+        for country in countries:
+            country_regions.setdefault(country, region)
+
+    # Case- and accent-insensitive fallback for city lookups
+    folded_city_countries = {}
+    for city, countries in city_countries.items():
+        key = fold_text(city)
+        known = folded_city_countries.get(key, ())
+        folded_city_countries[key] = known + tuple(country for country in countries if country not in known)
+
+    indexes = {"cities": AutocompleteIndex(world_cities),
+               "countries": AutocompleteIndex(sorted(countries_and_cities))}
+    for country, cities in countries_and_cities.items():
+        indexes[("country", country)] = AutocompleteIndex(cities)
+
+    return {
+        "COUNTRIES_AND_CITIES": countries_and_cities,
+        "WORLD_CITIES": world_cities,
+        "REGIONS": regions,
+        "CITY_COUNTRIES": city_countries,
+        "COUNTRY_REGIONS": country_regions,
+        "folded_city_countries": folded_city_countries,
+        "indexes": indexes
+    }
+
+
+def _load_data():
+    """Read the cache if it matches the data file, otherwise rebuild and rewrite it"""
+    data_file = _data_path(CITIES_DATA_FILE)
+    cache_file = _data_path(CITIES_CACHE_FILE)
+    stat = os.stat(data_file)
+    source = (CACHE_FORMAT, stat.st_mtime_ns, stat.st_size)
+
+    data = None
+    try:
+        with open(cache_file, 'rb') as f:
+            data = pickle.load(f)
+        if data.get("source") != source:
+            data = None
+    except Exception:
+        data = None  # Missing, stale or unreadable cache: rebuild it
+
+    if data is None:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        data = _build_data(raw["countries"], raw["regions"])
+        data["source"] = source
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            pass  # Read-only install: keep working without a cache
+
+    data["CITY_COUNTRIES"] = MappingProxyType(data["CITY_COUNTRIES"])
+    data["COUNTRY_REGIONS"] = MappingProxyType(data["COUNTRY_REGIONS"])
+    return data
+
+
+def preload():
+    """Load the city data and indexes now, e.g. in a server process before it forks workers"""
+    global _data
+    if _data is None:
+        with _data_lock:
+            if _data is None:
+                _data = _load_data()
+    return _data
+
+
+def __getattr__(name):
+    """Load the city data on first access to one of the data constants"""
+    if name in DATA_NAMES:
+        return preload()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Get all countries sorted alphabetically
 def get_all_countries():
     """Return all countries sorted alphabetically"""
-    return sorted(COUNTRIES_AND_CITIES.keys())
+    return sorted(preload()["COUNTRIES_AND_CITIES"].keys())
+
+# Get all cities in database order
+def get_all_cities():
+    """Return every city (cities in several countries appear once per country)"""
+    return preload()["WORLD_CITIES"]
+
+# Get countries grouped by region
+def get_all_regions():
+    """Return the region -> countries mapping"""
+    return preload()["REGIONS"]
 
 # Get cities for a specific country
 def get_cities_by_country(country):
     """Return cities for a specific country"""
-    return COUNTRIES_AND_CITIES.get(country, [])
+    return preload()["COUNTRIES_AND_CITIES"].get(country, [])
 
 # Get countries by region
 def get_countries_by_region(region):
     """Return countries in a specific region"""
-    return REGIONS.get(region, [])
+    return preload()["REGIONS"].get(region, [])
 
 # Search cities within a country
 def search_cities_in_country(country, query, limit=10):
     """Search for cities within a specific country"""
-    if country not in COUNTRIES_AND_CITIES:
-        return []
-    
-    cities = COUNTRIES_AND_CITIES[country]
-    query_lower = query.lower()
-    
-    # Exact matches first
-    exact_matches = [city for city in cities if city.lower() == query_lower]
-    
-    # Starts with matches
-    starts_with = [city for city in cities if city.lower().startswith(query_lower) and city not in exact_matches]
-    
-    # Contains matches
-    contains = [city for city in cities if query_lower in city.lower() and city not in exact_matches and city not in starts_with]
-    
-    # Combine and limit results
-    results = exact_matches + starts_with + contains
-    return results[:limit]
+    index = preload()["indexes"].get(("country", country))
+    return index.search(query, limit) if index is not None else []
+
+# Search cities worldwide
+def search_cities(query, limit=10):
+    """Search all cities for autocomplete"""
+    return preload()["indexes"]["cities"].search(query, limit)
 
 # Search for countries
 def search_countries(query, limit=10):
     """Search for countries based on query"""
-    query_lower = query.lower()
-    countries = get_all_countries()
-    
-    # Exact matches first
-    exact_matches = [country for country in countries if country.lower() == query_lower]
-    
-    # Starts with matches
-    starts_with = [country for country in countries if country.lower().startswith(query_lower) and country not in exact_matches]
-    
-    # Contains matches
-    contains = [country for country in countries if query_lower in country.lower() and country not in exact_matches and country not in starts_with]
-    
-    # Combine and limit results
-    results = exact_matches + starts_with + contains
-    return results[:limit]
+    return preload()["indexes"]["countries"].search(query, limit)
+
+# Get every country a city is in
+def get_countries_for_city(city):
+    """Return all countries with a city of this name, in database order"""
+    data = preload()
+    countries = data["CITY_COUNTRIES"].get(city)
+    if countries is None:
+        countries = data["folded_city_countries"].get(fold_text(city), ())
+    return countries
 
 # Get country for a city (for backward compatibility)
 def get_country_for_city(city):
-    """Return the country for a given city"""
-    for country, cities in COUNTRIES_AND_CITIES.items():
-        if city in cities:
-            return country
-    return None
+    """Return the country for a given city (the first one if several have it)"""
+    countries = get_countries_for_city(city)
+    return countries[0] if countries else None
 
 # Get region for a country
 def get_region_for_country(country):
     """Return the region for a given country"""
-    for region, countries in REGIONS.items():
-        if country in countries:
-            return region
-    return "Other"
+    return preload()["COUNTRY_REGIONS"].get(country, "Other")
+
+# Annotate many cities at once
+def annotate_cities(cities):
+    """Return {"city", "country", "countries", "region"} for each city"""
+    country_regions = preload()["COUNTRY_REGIONS"]
+    annotated = []
+    for city in cities:
+        countries = get_countries_for_city(city)
+        country = countries[0] if countries else None
+        annotated.append({
+            "city": city,
+            "country": country,
+            "countries": list(countries),
+            "region": country_regions.get(country, "Other")
+        })
+    return annotated
+
+# Annotate route records (search results, analytics rows) at once
+def annotate_routes(records, fields=("source", "destination")):
+    """Copy each record dict adding <field>_country and <field>_region for the city fields"""
+    country_regions = preload()["COUNTRY_REGIONS"]
+    lookups = {}
+    annotated = []
+    for record in records:
+        record = dict(record)
+        for field in fields:
+            city = record.get(field)
+            if city not in lookups:
+                country = get_country_for_city(city) if city else None
+                lookups[city] = (country, country_regions.get(country, "Other"))
+            record[f"{field}_country"], record[f"{field}_region"] = lookups[city]
+        annotated.append(record)
+    return annotated
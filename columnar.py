@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Columnar booking analytics for Train Booking System
+Vectorized reports over an integer-encoded snapshot of the booking history
+
+Requires NumPy (optional dependency: pip install numpy)
+"""
+
+from datetime import date
+from typing import Dict, List, Optional
+
+from inventory import journey_day
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without NumPy
+    np = None
+
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+STATUS_CODES = {"Confirmed": 0, "Cancelled": 1}
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Columnar analytics need NumPy. Install it with: pip install numpy")
+
+
+class ColumnarBookingSnapshot:
+    """Read-only column arrays of bookings for fast historical reporting
+
+    Each booking is a row across parallel arrays: train code, status code,
+    booking time as epoch seconds and journey date as days since the epoch.
+    Trains are described once in small per-train arrays (route code, price,
+    seats), so group-bys are bincounts over integer codes.
+    """
+
+    def __init__(self, train_ids: List[str], routes: List[str], train_route, train_price, train_seats,
+                 train_code, status, booked_at, journey_day):
+        _require_numpy()
+        self.train_ids = train_ids
+        self.routes = routes
+        self.train_route = np.asarray(train_route, dtype=np.int32)
+        self.train_price = np.asarray(train_price, dtype=np.float64)
+        self.train_seats = np.asarray(train_seats, dtype=np.int64)
+        self.train_code = np.asarray(train_code, dtype=np.int32)
+        self.status = np.asarray(status, dtype=np.int8)
+        self.booked_at = np.asarray(booked_at, dtype=np.int64)
+        self.journey_day = np.asarray(journey_day, dtype=np.int32)
+
+    @classmethod
+    def from_system(cls, system) -> "ColumnarBookingSnapshot":
+        """Encode the system's current trains and bookings"""
+        _require_numpy()
+        trains = list(system.trains.values())
+        train_codes = {train.train_id: code for code, train in enumerate(trains)}
+        route_codes = {}
+        train_route = [route_codes.setdefault(f"{train.source} → {train.destination}", len(route_codes))
+                       for train in trains]
+
+        bookings, journey_days = [], []
+        for booking in list(system.bookings.values()):
+            day = journey_day(booking.journey_date)
+            if booking.train_id in train_codes and day is not None:
+                bookings.append(booking)
+                journey_days.append(day - EPOCH_ORDINAL)
+
+        return cls(
+            train_ids=[train.train_id for train in trains],
+            routes=list(route_codes),
+            train_route=train_route,
+            train_price=[train.price for train in trains],
+            train_seats=[train.total_seats for train in trains],
+            train_code=np.fromiter((train_codes[booking.train_id] for booking in bookings),
+                                   dtype=np.int32, count=len(bookings)),
+            status=np.fromiter((STATUS_CODES.get(booking.status, 1) for booking in bookings),
+                               dtype=np.int8, count=len(bookings)),
+            booked_at=np.array([booking.booking_date for booking in bookings],
+                               dtype='datetime64[s]').astype(np.int64),
+            journey_day=journey_days
+        )
+
+    def __len__(self) -> int:
+        return len(self.train_code)
+
+    @property
+    def confirmed(self):
+        return self.status == STATUS_CODES["Confirmed"]
+
+    @property
+    def booking_day(self):
+        return self.booked_at // SECONDS_PER_DAY
+
+    def route_performance(self) -> List[Dict]:
+        """Bookings, confirmed revenue and cancellation rate per route"""
+        route = self.train_route[self.train_code]
+        route_count = len(self.routes)
+        confirmed = self.confirmed
+        bookings = np.bincount(route, minlength=route_count)
+        cancelled = np.bincount(route, weights=(~confirmed).astype(np.float64), minlength=route_count)
+        revenue = np.bincount(route, weights=self.train_price[self.train_code] * confirmed, minlength=route_count)
+
+        return [
+            {
+                "route": self.routes[code],
+                "total_bookings": int(bookings[code]),
+                "revenue": float(revenue[code]),
+                "cancellation_rate": float(cancelled[code] / bookings[code] * 100)
+            }
+            for code in np.flatnonzero(bookings)
+        ]
+
+    def revenue_trend(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """Confirmed revenue per booking day, optionally within [start_date, end_date]"""
+        if not len(self):
+            return []
+        day = self.booking_day
+        mask = self.confirmed
+        if start_date is not None:
+            mask &= day >= np.datetime64(start_date, 'D').astype(np.int64)
+        if end_date is not None:
+            mask &= day <= np.datetime64(end_date, 'D').astype(np.int64)
+        if not mask.any():
+            return []
+
+        day = day[mask]
+        first = day.min()
+        revenue = np.bincount(day - first, weights=self.train_price[self.train_code[mask]])
+        days = np.flatnonzero(np.bincount(day - first))
+        dates = (days + first).astype('datetime64[D]').astype(str)
+        return [{"date": date, "revenue": float(revenue[offset])} for date, offset in zip(dates, days)]
+
+    def peak_times(self) -> Dict:
+        """Booking counts per hour of day and per weekday"""
+        if not len(self):
+            return {"peak_hour": "0:00", "peak_hour_bookings": 0, "peak_day": "Unknown",
+                    "peak_day_bookings": 0, "hourly_distribution": {}, "daily_distribution": {}}
+        hours = np.bincount((self.booked_at // 3600) % 24, minlength=24)
+        # 1970-01-01 was a Thursday
+        weekdays = np.bincount((self.booking_day + 3) % 7, minlength=7)
+        peak_hour = int(hours.argmax())
+        peak_day = int(weekdays.argmax())
+
+        return {
+            "peak_hour": f"{peak_hour}:00",
+            "peak_hour_bookings": int(hours[peak_hour]),
+            "peak_day": WEEKDAYS[peak_day],
+            "peak_day_bookings": int(weekdays[peak_day]),
+            "hourly_distribution": {hour: int(count) for hour, count in enumerate(hours) if count},
+            "daily_distribution": {WEEKDAYS[day]: int(count) for day, count in enumerate(weekdays) if count}
+        }
+
+    def train_utilization(self, journey_date: Optional[str] = None) -> Dict:
+        """Occupied seats per train on a journey date, or on each train's busiest date"""
+        confirmed = self.confirmed
+        train_code = self.train_code[confirmed]
+        journey_day = self.journey_day[confirmed]
+        train_count = len(self.train_ids)
+
+        if journey_date is not None:
+            selected = journey_day == np.datetime64(journey_date, 'D').astype(np.int64)
+            occupied = np.bincount(train_code[selected], minlength=train_count)
+        elif len(train_code):
+            first = journey_day.min()
+            span = int(journey_day.max() - first) + 1
+            per_day = np.bincount(train_code.astype(np.int64) * span + (journey_day - first),
+                                  minlength=train_count * span)
+            occupied = per_day.reshape(train_count, span).max(axis=1)
+        else:
+            occupied = np.zeros(train_count, dtype=np.int64)
+
+        rates = np.divide(occupied * 100.0, self.train_seats, out=np.zeros(train_count),
+                          where=self.train_seats > 0)
+        return {
+            train_id: {
+                "utilization_rate": float(rates[code]),
+                "occupied_seats": int(occupied[code]),
+                "total_seats": int(self.train_seats[code])
+            }
+            for code, train_id in enumerate(self.train_ids)
+        }
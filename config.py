@@ -7,6 +7,46 @@ Contains all configurable settings and constants
 # System Configuration
 DEFAULT_DATA_FILE = "train_data.json"
 BACKUP_DATA_FILE = "train_data_backup.json"
+CITIES_DATA_FILE = "cities_data.json"  # relative paths are next to cities.py
+CITIES_CACHE_FILE = "cities_data.cache"  # pickled lookups and indexes, rebuilt when the data file changes
+
+# Storage Configuration
+# "json" rewrites the whole data file on every change,
+# "journal" appends each change to a write-ahead log next to the data file,
+# "sqlite" keeps trains, passengers and bookings in SQLite tables,
+# "binary" rewrites a compact columnar snapshot (an existing JSON data file is read once)
+STORAGE_MODE = "json"
+SQLITE_SUFFIX = ".db"  # the SQLite database replaces the data file's extension
+BINARY_SUFFIX = ".snap"  # so does the binary snapshot
+BINARY_COMPRESSION = 1  # zlib level for binary snapshots: 1 is fast, 9 is smallest
+# Compile the static timetable into <data file>.timetable and memory-map it, so
+# worker processes share one copy; only seat counts and booking lists stay per process
+SHARED_TIMETABLE = False
+TIMETABLE_SUFFIX = ".timetable"
+# Keep seat counters in <data file>.seats, mapped by every worker process on the
+# node, so workers never sell the same seat twice; POSIX only (uses fcntl locks),
+# and needs the unsharded "sqlite" STORAGE_MODE so every worker's bookings are kept
+SHARED_SEATS = False
+SEATS_SUFFIX = ".seats"
+SHARED_SEATS_MAX_TRAINS = 4096  # Trains the seat file has room for
+# Split trains and their bookings into shards, each with its own data file (or
+# journal/database, per STORAGE_MODE) and write lock: "region" puts each route in
+# its region's shard, "hash" spreads train IDs over BOOKING_SHARDS; None keeps one store
+SHARD_BY = None
+BOOKING_SHARDS = 8
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_FSYNC_BATCH = 64  # fsync the journal after this many records...
+JOURNAL_FSYNC_INTERVAL = 0.05  # ...or after this many seconds, whichever comes first
+JOURNAL_COMPACT_THRESHOLD = 5000  # fold the journal into a new snapshot after this many records
+BACKUP_GENERATIONS = 3  # previous snapshots kept as <data file>.backup.N to fall back to if one is damaged
+GROUP_COMMIT = False  # queue changes for a background writer thread instead of writing them in the request
+GROUP_COMMIT_WINDOW = 0.01  # seconds the writer waits for more changes before one durable write (5-20 ms)
+# Endpoints answering "sync" wait until their change is on disk; "async" ones answer once it is queued
+WRITE_ACK = {
+    "book": "sync",
+    "book_batch": "sync",
+    "cancel": "async"
+}
 
 # Display Configuration
 MAX_DISPLAY_WIDTH = 100
@@ -18,17 +58,33 @@ MIN_PASSENGER_AGE = 1
 MAX_PASSENGER_AGE = 120
 MIN_BOOKING_ADVANCE_DAYS = 0
 MAX_BOOKING_ADVANCE_DAYS = 365
+MAX_BATCH_BOOKING_SIZE = 200  # passengers per group booking request
 
 # Train Configuration
 DEFAULT_TRAIN_CAPACITY = 100
 MIN_TRAIN_CAPACITY = 10
 MAX_TRAIN_CAPACITY = 500
 
+# Journey Planner Configuration
+MAX_TRANSFERS = 2
+MIN_CONNECTION_MINUTES = 30
+MAX_JOURNEY_HOURS = 72  # journeys arriving later than this after the requested departure are dropped
+
 # Pricing Configuration
 MIN_TICKET_PRICE = 1.0
 MAX_TICKET_PRICE = 1000.0
 CURRENCY_SYMBOL = "$"
 
+# Cache Configuration
+CACHE_SHARDS = 16  # independently locked shards in a large CacheManager
+CACHE_MIN_SHARD_SIZE = 1024  # smaller caches use fewer shards so eviction stays close to exact LRU
+RESPONSE_CACHE_SIZE = 256  # cached response bodies per app
+RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+RESPONSE_CACHE_TTL = 300  # seconds; entries also go stale as soon as bookings change
+
+# Async Serving Configuration
+ASGI_WORKER_THREADS = 32  # threads running Flask views under the ASGI server
+
 # Date and Time Formats
 DATE_FORMAT = "%Y-%m-%d"
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -4,6 +4,8 @@ Demo script for Train Booking System
 This script demonstrates the key features of the booking system
 """
 
+from datetime import date, timedelta
+
 from main import TrainBookingSystem, Passenger
 import time
 
@@ -44,7 +46,7 @@ def demo_train_booking_system():
             email="john.demo@example.com"
         )
         
-        booking = system.book_ticket(train.train_id, passenger, "2025-09-15")
+        booking = system.book_ticket(train.train_id, passenger, (date.today() + timedelta(days=14)).isoformat())
         
         if booking:
             print("✅ Booking successful!")
@@ -65,7 +67,7 @@ def demo_train_booking_system():
         train2 = trains2[0]
         print(f"\n📋 Booking another ticket for the same passenger...")
         
-        booking2 = system.book_ticket(train2.train_id, passenger, "2025-09-16")
+        booking2 = system.book_ticket(train2.train_id, passenger, (date.today() + timedelta(days=15)).isoformat())
         
         if booking2:
             print("✅ Second booking successful!")
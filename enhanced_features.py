@@ -4,9 +4,12 @@ Advanced Train Booking System Features
 Enhanced functionality for better user experience
 """
 
+from datetime import date, timedelta
+
 from main import TrainBookingSystem, Train, Passenger, Booking
-from utils import format_currency, calculate_journey_duration, validate_email
-from datetime import datetime, timedelta
+from utils import format_currency, validate_email
+from config import MAX_TRANSFERS
+from journey_planner import JourneyPlanner
 import json
 
 class EnhancedTrainBookingSystem(TrainBookingSystem):
@@ -15,6 +18,7 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
     def __init__(self, data_file: str = "train_data.json"):
         super().__init__(data_file)
         self.loyalty_points = {}  # Store loyalty points for passengers
+        self._journey_planner = None
         self.discounts = {
             "STUDENT": 0.15,
             "SENIOR": 0.20,
@@ -26,25 +30,12 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
                              date: str = None, max_price: float = None,
                              departure_after: str = None) -> list:
         """Advanced train search with filters"""
-        results = self.search_trains(source, destination, date)
+        results = self.search_trains(source, destination, date, departure_after=departure_after)
         
         # Filter by maximum price
         if max_price is not None:
             results = [train for train in results if train.price <= max_price]
         
-        # Filter by departure time
-        if departure_after is not None:
-            try:
-                min_time = datetime.strptime(departure_after, "%H:%M").time()
-                filtered_results = []
-                for train in results:
-                    train_time = datetime.strptime(train.departure_time, "%H:%M").time()
-                    if train_time >= min_time:
-                        filtered_results.append(train)
-                results = filtered_results
-            except ValueError:
-                pass  # Invalid time format, ignore filter
-        
         return results
     
     def calculate_loyalty_points(self, price: float) -> int:
@@ -65,8 +56,6 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
             return None
         
         train = self.trains[train_id]
-        if train.available_seats <= 0:
-            return None
         
         # Calculate discounted price
         original_price = train.price
@@ -87,8 +76,6 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
             booking.discounted_price = discounted_price
             booking.discount_code = discount_code
             booking.points_earned = points_earned
-            
-            self.save_data()
         
         return booking
     
@@ -106,13 +93,8 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
     
     def get_popular_routes(self, limit: int = 5) -> list:
         """Get most popular routes based on bookings"""
-        route_counts = {}
-        
-        for booking in self.bookings.values():
-            if booking.status == "Confirmed":
-                train = self.trains[booking.train_id]
-                route = f"{train.source} → {train.destination}"
-                route_counts[route] = route_counts.get(route, 0) + 1
+        route_counts = {route: stats["confirmed"] for route, stats in self.aggregates.by_route.items()
+                        if stats["confirmed"] > 0}
         
         # Sort by popularity
         popular_routes = sorted(route_counts.items(), key=lambda x: x[1], reverse=True)
@@ -120,76 +102,40 @@ class EnhancedTrainBookingSystem(TrainBookingSystem):
     
     def get_revenue_report(self) -> dict:
         """Generate revenue report"""
-        total_revenue = 0
-        bookings_count = 0
-        cancelled_count = 0
-        
-        for booking in self.bookings.values():
-            if booking.status == "Confirmed":
-                train = self.trains[booking.train_id]
-                total_revenue += train.price
-                bookings_count += 1
-            elif booking.status == "Cancelled":
-                cancelled_count += 1
+        totals = self.aggregates.totals
+        total_revenue = totals["revenue"]
+        bookings_count = totals["confirmed"]
         
         return {
             "total_revenue": total_revenue,
             "confirmed_bookings": bookings_count,
-            "cancelled_bookings": cancelled_count,
+            "cancelled_bookings": totals["cancelled"],
             "average_ticket_price": total_revenue / bookings_count if bookings_count > 0 else 0
         }
     
-    def suggest_alternative_routes(self, source: str, destination: str) -> list:
+    @property
+    def journey_planner(self) -> JourneyPlanner:
+        """Connection search over the current timetable, rebuilt after trains change"""
+        if self._journey_planner is None:
+            self._journey_planner = JourneyPlanner(list(self.trains.values()))
+        return self._journey_planner
+    
+    def add_train(self, train: Train):
+        """Add a train to the timetable (or replace one with the same ID)"""
+        super().add_train(train)
+        self._journey_planner = None
+    
+    def plan_journeys(self, source: str, destination: str, journey_date: str = None,
+                      departure_after: str = "00:00", max_transfers: int = MAX_TRANSFERS) -> list:
+        """Direct and connecting journeys that are best on arrival, price or transfers"""
+        return self.journey_planner.plan(source, destination, journey_date, departure_after, max_transfers)
+    
+    def suggest_alternative_routes(self, source: str, destination: str, journey_date: str = None,
+                                   max_transfers: int = MAX_TRANSFERS) -> list:
         """Suggest alternative routes with connections"""
-        alternatives = []
-        
-        # Find trains from source to any intermediate station
-        intermediate_trains = []
-        for train in self.trains.values():
-            if train.source.lower() == source.lower() and train.available_seats > 0:
-                intermediate_trains.append(train)
-        
-        # Find trains from intermediate stations to destination
-        for intermediate_train in intermediate_trains:
-            intermediate_station = intermediate_train.destination
-            connecting_trains = []
-            
-            for train in self.trains.values():
-                if (train.source.lower() == intermediate_station.lower() and 
-                    train.destination.lower() == destination.lower() and 
-                    train.available_seats > 0):
-                    connecting_trains.append(train)
-            
-            for connecting_train in connecting_trains:
-                # Check if connection time is reasonable (at least 30 minutes)
-                try:
-                    arrival_time = datetime.strptime(intermediate_train.arrival_time, "%H:%M")
-                    departure_time = datetime.strptime(connecting_train.departure_time, "%H:%M")
-                    
-                    # Handle next day scenarios
-                    if connecting_train.departure_time < intermediate_train.arrival_time:
-                        departure_time += timedelta(days=1)
-                    
-                    connection_time = departure_time - arrival_time
-                    
-                    if connection_time.total_seconds() >= 1800:  # 30 minutes minimum
-                        total_price = intermediate_train.price + connecting_train.price
-                        total_duration = calculate_journey_duration(
-                            intermediate_train.departure_time, 
-                            connecting_train.arrival_time
-                        )
-                        
-                        alternatives.append({
-                            "route": f"{source} → {intermediate_station} → {destination}",
-                            "trains": [intermediate_train.train_id, connecting_train.train_id],
-                            "total_price": total_price,
-                            "total_duration": total_duration,
-                            "connection_time": str(connection_time)
-                        })
-                except ValueError:
-                    continue  # Skip if time parsing fails
-        
-        return alternatives
+        return [journey for journey in self.plan_journeys(source, destination, journey_date,
+                                                          max_transfers=max_transfers)
+                if journey["transfers"] > 0]
     
     def display_enhanced_booking_details(self, booking: Booking):
         """Display enhanced booking details with discounts and points"""
@@ -268,7 +214,7 @@ def run_enhanced_demo():
     
     if trains:
         booking = system.book_ticket_enhanced(trains[0].train_id, passenger, 
-                                            "2025-09-20", "STUDENT")
+                                            (date.today() + timedelta(days=30)).isoformat(), "STUDENT")
         if booking:
             print("✅ Student discount applied!")
             system.display_enhanced_booking_details(booking)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+In-memory indexes for Train Booking System
+Keep lookup structures up to date as trains and bookings change so queries
+don't have to scan everything
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def normalize_station(name: str) -> str:
+    """Normalize a station name for index keys"""
+    return name.strip().lower()
+
+
+class RouteIndex:
+    """Trains indexed by route, by source and by destination
+
+    Buckets keep trains in insertion order so search results come back in the
+    same order as the timetable. Seat availability is per journey date, so it
+    is left to callers that have one. Each route also keeps its trains sorted
+    by departure minute so departure-window searches are binary searches.
+    """
+
+    def __init__(self, trains: Iterable = ()):
+        self.by_route: Dict[Tuple[str, str], Dict[str, object]] = {}
+        self.by_source: Dict[str, Dict[str, object]] = {}
+        self.by_destination: Dict[str, Dict[str, object]] = {}
+        # Route -> (sorted departure minutes, trains in the same order)
+        self.departures: Dict[Tuple[str, str], Tuple[List[int], List[object]]] = {}
+        self._keys: Dict[str, Tuple[str, str]] = {}
+        for train in trains:
+            self.add(train)
+
+    def add(self, train):
+        """Index a new train, or re-index one whose route changed"""
+        if train.train_id in self._keys:
+            self.remove(train.train_id)
+
+        source = normalize_station(train.source)
+        destination = normalize_station(train.destination)
+        self._keys[train.train_id] = (source, destination)
+        self.by_route.setdefault((source, destination), {})[train.train_id] = train
+        self.by_source.setdefault(source, {})[train.train_id] = train
+        self.by_destination.setdefault(destination, {})[train.train_id] = train
+        if train.departure_minutes is not None:
+            minutes, trains = self.departures.setdefault((source, destination), ([], []))
+            position = bisect_right(minutes, train.departure_minutes)
+            minutes.insert(position, train.departure_minutes)
+            trains.insert(position, train)
+
+    def remove(self, train_id: str):
+        """Drop a train from every index"""
+        key = self._keys.pop(train_id, None)
+        if key is None:
+            return
+        source, destination = key
+        train = self.by_route[key][train_id]
+        if train.departure_minutes is not None:
+            minutes, trains = self.departures[key]
+            position = bisect_left(minutes, train.departure_minutes)
+            while trains[position] is not train:
+                position += 1
+            del minutes[position], trains[position]
+            if not trains:
+                del self.departures[key]
+        for index, bucket_key in ((self.by_route, key), (self.by_source, source),
+                                  (self.by_destination, destination)):
+            bucket = index[bucket_key]
+            del bucket[train_id]
+            if not bucket:
+                del index[bucket_key]
+
+    def find(self, source: str, destination: str) -> List:
+        """Trains running from source to destination"""
+        return list(self.by_route.get((normalize_station(source), normalize_station(destination)), {}).values())
+
+    def find_departing(self, source: str, destination: str, after: int = 0,
+                       before: Optional[int] = None) -> List:
+        """Trains from source to destination leaving between two minutes past midnight, in departure order"""
+        minutes, trains = self.departures.get((normalize_station(source), normalize_station(destination)),
+                                              ((), ()))
+        first = bisect_left(minutes, after)
+        last = bisect_right(minutes, before) if before is not None else len(minutes)
+        return list(trains[first:last])
+
+    def from_source(self, source: str) -> List:
+        """Trains departing from a station"""
+        return list(self.by_source.get(normalize_station(source), {}).values())
+
+    def to_destination(self, destination: str) -> List:
+        """Trains arriving at a station"""
+        return list(self.by_destination.get(normalize_station(destination), {}).values())
+
+
+def normalize_email(email: str) -> str:
+    """Normalize an email address for index keys"""
+    return email.strip().lower()
+
+
+class PassengerIndex:
+    """Bookings indexed by passenger email, bucketed by status
+
+    Each email maps to one ordered bucket per status, so listing a passenger's
+    confirmed bookings or counting them never touches bookings with another
+    status. A cancellation just moves the booking between buckets.
+    """
+
+    def __init__(self, bookings: Iterable = ()):
+        self.by_email: Dict[str, Dict[str, Dict[str, object]]] = {}
+        for booking in bookings:
+            self.add(booking)
+
+    def add(self, booking):
+        """Index a booking under its current status"""
+        statuses = self.by_email.setdefault(normalize_email(booking.passenger.email), {})
+        statuses.setdefault(booking.status, {})[booking.booking_id] = booking
+
+    def change_status(self, booking, old_status: str):
+        """Move a booking whose status just changed from old_status"""
+        statuses = self.by_email.get(normalize_email(booking.passenger.email))
+        if statuses is None or statuses.get(old_status, {}).pop(booking.booking_id, None) is None:
+            return
+        statuses.setdefault(booking.status, {})[booking.booking_id] = booking
+
+    def find(self, email: str, status: str = None) -> List:
+        """Bookings for an email in booking order, optionally for one status only"""
+        statuses = self.by_email.get(normalize_email(email), {})
+        if status is not None:
+            return list(statuses.get(status, {}).values())
+        bookings = [booking for bucket in statuses.values() for booking in bucket.values()]
+        return sorted(bookings, key=lambda booking: booking.booking_date)
+
+    def count(self, email: str, status: str = None) -> int:
+        """Number of bookings for an email, optionally for one status only"""
+        statuses = self.by_email.get(normalize_email(email), {})
+        if status is not None:
+            return len(statuses.get(status, {}))
+        return sum(len(bucket) for bucket in statuses.values())
+
+    def status_counts(self, email: str) -> Dict[str, int]:
+        """Booking counts per status for an email"""
+        return {status: len(bucket)
+                for status, bucket in self.by_email.get(normalize_email(email), {}).items()}
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Seat inventory for Train Booking System
+Track seats left per journey date for each train
+"""
+
+import mmap
+import os
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import MAX_BOOKING_ADVANCE_DAYS, SHARED_SEATS_MAX_TRAINS
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; shared seats are unavailable there
+    fcntl = None
+
+
+def journey_day(journey_date: str) -> Optional[int]:
+    """Turn a YYYY-MM-DD journey date into a day number, or None if invalid"""
+    try:
+        return date.fromisoformat(journey_date).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def bookable_day(journey_date: str) -> Optional[int]:
+    """Day number of a journey date open for booking: from today up to the advance limit, else None"""
+    day = journey_day(journey_date)
+    today = date.today().toordinal()
+    if day is None or not today <= day <= today + MAX_BOOKING_ADVANCE_DAYS:
+        return None
+    return day
+
+
+class SeatInventory:
+    """Seats left on one train for every journey date
+
+    Counters live in a fixed ring of slots covering the booking horizon, so a
+    lookup or decrement is one array access and memory doesn't grow with the
+    number of dates ever booked. Each slot remembers which day it holds; a
+    slot is handed to a new day once it has no seats taken or its day has
+    passed. The rare date that collides with a slot still in use gets a
+    counter in a small overflow dict instead. The ring is only allocated
+    when the first seat is taken, so trains nobody books cost next to nothing.
+    """
+
+    def __init__(self, total_seats: int, horizon_days: int = MAX_BOOKING_ADVANCE_DAYS + 1):
+        self.total_seats = total_seats
+        self.horizon_days = horizon_days
+        self._days = None  # Day held by each slot, 0 = never used
+        self._seats = None
+        self._overflow = {}
+
+    def _slot(self, day: int, claim: bool = False) -> int:
+        """Slot holding a day's counter, or -1 if it has none"""
+        if self._days is None:
+            if not claim or not self.horizon_days:
+                return -1
+            self._days = array('i', [0]) * self.horizon_days
+            self._seats = array('i', [self.total_seats]) * self.horizon_days
+        slot = day % self.horizon_days
+        held = self._days[slot]
+        if held == day:
+            return slot
+        if claim and (held == 0 or self._seats[slot] == self.total_seats or
+                      held < date.today().toordinal()):
+            self._days[slot] = day
+            self._seats[slot] = self.total_seats
+            return slot
+        return -1
+
+    def available(self, day: int) -> int:
+        """Seats left on a day"""
+        if day in self._overflow:
+            return self._overflow[day]
+        slot = self._slot(day)
+        return self._seats[slot] if slot >= 0 else self.total_seats
+
+    def reserve(self, day: int, count: int = 1) -> bool:
+        """Take seats on a day if enough are left"""
+        if day in self._overflow:
+            if self._overflow[day] < count:
+                return False
+            self._overflow[day] -= count
+            return True
+
+        slot = self._slot(day, claim=True)
+        if slot < 0:
+            if self.total_seats < count:
+                return False
+            self._overflow[day] = self.total_seats - count
+            return True
+
+        if self._seats[slot] < count:
+            return False
+        self._seats[slot] -= count
+        return True
+
+    def release(self, day: int, count: int = 1):
+        """Give seats on a day back"""
+        if day in self._overflow:
+            seats = self._overflow[day] + count
+            if seats >= self.total_seats:
+                del self._overflow[day]
+            else:
+                self._overflow[day] = seats
+            return
+
+        slot = self._slot(day)
+        if slot >= 0:
+            self._seats[slot] = min(self.total_seats, self._seats[slot] + count)
+
+    def min_available(self) -> int:
+        """Seats left on the most heavily booked day from today on (a scan of every slot)"""
+        today = date.today().toordinal()
+        seats = self.total_seats
+        if self._seats is not None:
+            seats = min((left for day, left in zip(self._days, self._seats) if day >= today), default=seats)
+        upcoming = [left for day, left in self._overflow.items() if day >= today]
+        return min(seats, min(upcoming)) if upcoming else seats
+
+    def taken(self) -> Iterator[Tuple[int, int]]:
+        """(day, seats left) for every day with seats taken"""
+        if self._seats is not None:
+            for day, seats in zip(self._days, self._seats):
+                if day and seats < self.total_seats:
+                    yield day, seats
+        yield from self._overflow.items()
+
+
+SEATS_MAGIC = b"TBSEATS\n"
+SEATS_VERSION = 1
+# magic, version, horizon days, train capacity, trains registered, seeded flag
+_SEATS_HEADER = struct.Struct("<8sHIIIB")
+_SEATS_HEADER_SIZE = 64
+_TRAIN_ID_SIZE = 32  # Directory entry: the train ID, UTF-8, NUL padded
+_SLOT = struct.Struct("<ii")  # Day held, seats left
+# Bytes locked with fcntl: the header while registering trains or seeding,
+# one byte every attached process holds shared while it has the file open,
+# and each train's directory entry while its counters change
+_HEADER_LOCK = 0
+_ATTACHED_LOCK = 1
+
+
+class SharedSeats:
+    """Seat counters for one train in a SharedSeatStore
+
+    Works like SeatInventory, but the ring of (day, seats) slots lives in a
+    file every worker process maps, and each reserve or release is a
+    compare-and-decrement done under a byte-range lock on the train's entry,
+    so processes booking the same train take turns and never oversell. A
+    day colliding with a slot in use probes on to the next free slot, as
+    there is no shared overflow dict; with every slot in use, reserve fails.
+    """
+
+    def __init__(self, store: 'SharedSeatStore', index: int, total_seats: int):
+        self.store = store
+        self.total_seats = total_seats
+        self.horizon_days = store.horizon_days
+        self._entry = _SEATS_HEADER_SIZE + index * _TRAIN_ID_SIZE
+        self._ring = store.slots_offset + index * store.horizon_days * _SLOT.size
+        self._lock = threading.Lock()  # fcntl locks don't exclude threads of one process
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.lockf(self.store.fd, fcntl.LOCK_EX, 1, self._entry)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.store.fd, fcntl.LOCK_UN, 1, self._entry)
+
+    def _slot(self, day: int, claim: bool = False) -> int:
+        """Offset of the slot holding a day's counter, or -1 if it has none"""
+        buffer = self.store.map
+        free = -1
+        today = date.today().toordinal()
+        for probe in range(self.horizon_days):
+            offset = self._ring + (day + probe) % self.horizon_days * _SLOT.size
+            held, seats = _SLOT.unpack_from(buffer, offset)
+            if held == day:
+                return offset
+            if free < 0 and (held == 0 or seats == self.total_seats or held < today):
+                free = offset
+            if held == 0:  # Never used, so the day isn't further along
+                break
+        if claim and free >= 0:
+            _SLOT.pack_into(buffer, free, day, self.total_seats)
+        return free if claim else -1
+
+    def available(self, day: int) -> int:
+        """Seats left on a day (read without locking)"""
+        offset = self._slot(day)
+        return _SLOT.unpack_from(self.store.map, offset)[1] if offset >= 0 else self.total_seats
+
+    def reserve(self, day: int, count: int = 1) -> bool:
+        """Take seats on a day if enough are left, atomically across processes"""
+        with self._locked():
+            offset = self._slot(day, claim=True)
+            if offset < 0:
+                return False
+            seats = _SLOT.unpack_from(self.store.map, offset)[1]
+            if seats < count:
+                return False
+            _SLOT.pack_into(self.store.map, offset, day, seats - count)
+            return True
+
+    def release(self, day: int, count: int = 1):
+        """Give seats on a day back"""
+        with self._locked():
+            offset = self._slot(day)
+            if offset >= 0:
+                seats = _SLOT.unpack_from(self.store.map, offset)[1]
+                _SLOT.pack_into(self.store.map, offset, day, min(self.total_seats, seats + count))
+
+    def min_available(self) -> int:
+        """Seats left on the most heavily booked day from today on"""
+        today = date.today().toordinal()
+        ring = memoryview(self.store.map)[self._ring:self._ring + self.horizon_days * _SLOT.size].cast('i')
+        try:
+            return min((seats for day, seats in zip(ring[0::2], ring[1::2]) if day >= today),
+                       default=self.total_seats)
+        finally:
+            ring.release()
+
+    def seed(self, inventory: SeatInventory):
+        """Copy the days taken in a process-local inventory into the shared slots"""
+        with self._locked():
+            for day, seats in inventory.taken():
+                offset = self._slot(day, claim=True)
+                if offset >= 0:
+                    _SLOT.pack_into(self.store.map, offset, day, seats)
+
+
+class SharedSeatStore:
+    """Seat counters for every train, in one file mapped by all worker processes
+
+    Layout: a header, a directory of train IDs, then one ring of
+    horizon_days slots per train. The first process to open the file while
+    no other has it open starts it afresh, so counters never outlive the
+    workers that kept them; its first seeding() copies in the seats of the
+    bookings it loaded, and processes joining later find it seeded. Use
+    open_seat_store(), which shares one store per file within a process.
+    """
+
+    def __init__(self, path: str, max_trains: int = SHARED_SEATS_MAX_TRAINS,
+                 horizon_days: int = MAX_BOOKING_ADVANCE_DAYS + 1):
+        if fcntl is None:
+            raise RuntimeError("Shared seat counters need POSIX file locks (fcntl)")
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.references = 1
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._views = {}
+        self._index = {}
+        try:
+            with self._header_locked():
+                try:
+                    fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, _ATTACHED_LOCK)
+                    alone = True
+                except OSError:
+                    alone = False
+                if alone:
+                    self._create(max_trains, horizon_days)
+                fcntl.lockf(self.fd, fcntl.LOCK_SH, 1, _ATTACHED_LOCK)
+                self._attach()
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _create(self, max_trains: int, horizon_days: int):
+        os.ftruncate(self.fd, 0)  # Sparse and zeroed: every slot starts unused
+        os.ftruncate(self.fd, _SEATS_HEADER_SIZE + max_trains * (_TRAIN_ID_SIZE + horizon_days * _SLOT.size))
+        os.pwrite(self.fd, _SEATS_HEADER.pack(SEATS_MAGIC, SEATS_VERSION, horizon_days, max_trains, 0, 0), 0)
+
+    def _attach(self):
+        header = os.pread(self.fd, _SEATS_HEADER.size, 0)
+        if len(header) < _SEATS_HEADER.size:
+            raise ValueError(f"{self.path} is not a seat counter file")
+        magic, version, self.horizon_days, self.max_trains, _, _ = _SEATS_HEADER.unpack(header)
+        if magic != SEATS_MAGIC or version != SEATS_VERSION:
+            raise ValueError(f"{self.path} is not a version {SEATS_VERSION} seat counter file")
+        self.slots_offset = _SEATS_HEADER_SIZE + self.max_trains * _TRAIN_ID_SIZE
+        self.map = mmap.mmap(self.fd, self.slots_offset + self.max_trains * self.horizon_days * _SLOT.size)
+
+    @contextmanager
+    def _header_locked(self):
+        with self._lock:
+            # Re-entered while seeding registers trains; only the outermost level unlocks
+            self._lock_depth += 1
+            if self._lock_depth == 1:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, _HEADER_LOCK)
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, _HEADER_LOCK)
+
+    def _field(self, index: int) -> int:
+        return _SEATS_HEADER.unpack_from(self.map)[index]
+
+    def _set_field(self, index: int, value: int):
+        fields = list(_SEATS_HEADER.unpack_from(self.map))
+        fields[index] = value
+        _SEATS_HEADER.pack_into(self.map, 0, *fields)
+
+    @contextmanager
+    def seeding(self) -> Iterator[bool]:
+        """Hold the file while counters are filled in; yields True if they should be
+
+        Only the first caller after the file was started afresh gets True;
+        everyone else waits here until it is done, then gets False.
+        """
+        with self._header_locked():
+            first = not self._field(5)
+            yield first
+            if first:
+                self._set_field(5, 1)
+
+    def seats(self, train_id: str, total_seats: int) -> SharedSeats:
+        """The shared counters for a train, registering it on first use"""
+        view = self._views.get(train_id)
+        if view is not None:
+            view.total_seats = total_seats
+            return view
+        index = self._index.get(train_id)
+        if index is None:
+            index = self._register(train_id)
+        view = self._views[train_id] = SharedSeats(self, index, total_seats)
+        return view
+
+    def _register(self, train_id: str) -> int:
+        key = train_id.encode('utf-8')
+        if len(key) > _TRAIN_ID_SIZE:
+            raise ValueError(f"Train ID {train_id!r} is longer than {_TRAIN_ID_SIZE} bytes")
+        with self._header_locked():
+            count = self._field(4)
+            for index in range(len(self._index), count):  # Registered by other processes since
+                entry = _SEATS_HEADER_SIZE + index * _TRAIN_ID_SIZE
+                self._index[str(self.map[entry:entry + _TRAIN_ID_SIZE].rstrip(b'\0'), 'utf-8')] = index
+            if train_id in self._index:
+                return self._index[train_id]
+            if count >= self.max_trains:
+                raise ValueError(f"{self.path} has room for {self.max_trains} trains; "
+                                 "raise SHARED_SEATS_MAX_TRAINS")
+            entry = _SEATS_HEADER_SIZE + count * _TRAIN_ID_SIZE
+            self.map[entry:entry + len(key)] = key
+            self._set_field(4, count + 1)
+            self._index[train_id] = count
+            return count
+
+    def close(self):
+        """Drop one reference; the last one unmaps the file and releases its locks"""
+        with _stores_lock:
+            self.references -= 1
+            if self.references:
+                return
+            _stores.pop(os.path.realpath(self.path), None)
+        self.map.close()
+        os.close(self.fd)
+
+
+_stores: Dict[str, SharedSeatStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_seat_store(path: str, max_trains: int = SHARED_SEATS_MAX_TRAINS,
+                    horizon_days: int = MAX_BOOKING_ADVANCE_DAYS + 1) -> SharedSeatStore:
+    """The process's store for a seat file, opening it if this is the first use
+
+    Every system in a process shares one store per file: fcntl locks belong
+    to the process, so a second descriptor would neither exclude the first
+    nor survive it being closed.
+    """
+    key = os.path.realpath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            store.references += 1
+            return store
+        store = _stores[key] = SharedSeatStore(path, max_trains, horizon_days)
+        return store
+
+
+def _reattach_after_fork():
+    """fcntl locks aren't inherited, so a forked worker takes its own attached lock"""
+    for store in _stores.values():
+        fcntl.lockf(store.fd, fcntl.LOCK_SH, 1, _ATTACHED_LOCK)
+
+
+if fcntl is not None and hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reattach_after_fork)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Journey planner for Train Booking System
+Find connecting journeys with transfers across the whole timetable
+"""
+
+from bisect import bisect_left
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from config import MAX_JOURNEY_HOURS, MAX_TRANSFERS, MIN_CONNECTION_MINUTES
+from indexes import normalize_station
+from inventory import journey_day
+from utils import format_duration, parse_timetable_time
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _dominated(bag: List, arrival: int, price: float) -> bool:
+    """Whether some label in a bag arrives no later and costs no more"""
+    for other_arrival, other_price in bag:
+        if other_arrival <= arrival and other_price <= price:
+            return True
+    return False
+
+
+def _format_clock(minutes: int) -> str:
+    """Format minutes since the journey date's midnight as a timetable time"""
+    days, minutes = divmod(minutes, MINUTES_PER_DAY)
+    clock = f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return f"{clock}+{days}" if days else clock
+
+
+class JourneyPlanner:
+    """Round-based connection search over a daily timetable
+
+    Departures are grouped by station once and sorted by time of day, so a
+    query only looks at trains leaving stations it has actually reached. Round
+    k extends the journeys found in round k-1 by one more train, so journeys
+    with fewer transfers are always found first. Every station keeps a bag of
+    (arrival, price) labels per round and a new label is dropped when one from
+    the same or an earlier round arrives no later for no more money; a label
+    only ever evicts labels of its own round, so a journey with fewer transfers
+    survives a cheaper or faster one with more. The destination's bags also
+    prune everything that can no longer beat a journey already found.
+
+    Trains are assumed to run every day. Times are minutes since midnight of
+    the journey date, so an "06:50+2" arrival on a train leaving at 18:55 is
+    2 days, 11 hours and 55 minutes after departure.
+    """
+
+    def __init__(self, trains: Iterable, min_connection: int = MIN_CONNECTION_MINUTES,
+                 max_transfers: int = MAX_TRANSFERS, max_journey_hours: int = MAX_JOURNEY_HOURS):
+        self.min_connection = min_connection
+        self.max_transfers = max_transfers
+        self.max_journey_minutes = max_journey_hours * 60
+        # Station -> (departure minutes, (minute, duration, train, next station) entries), sorted by minute
+        self.departures: Dict[str, tuple] = {}
+        # The same entries split by (station, next station), for the last leg of a search
+        self.direct: Dict[tuple, tuple] = {}
+
+        by_station: Dict[str, List[tuple]] = {}
+        for train in trains:
+            if train.departure_minutes is None or train.duration_minutes is None:
+                continue
+            by_station.setdefault(normalize_station(train.source), []).append(
+                (train.departure_minutes, train.duration_minutes, train, normalize_station(train.destination)))
+
+        by_route: Dict[tuple, List[tuple]] = {}
+        for station, entries in by_station.items():
+            entries.sort(key=lambda entry: entry[0])
+            self.departures[station] = ([entry[0] for entry in entries], entries)
+            for entry in entries:
+                by_route.setdefault((station, entry[3]), []).append(entry)
+        for key, entries in by_route.items():
+            self.direct[key] = ([entry[0] for entry in entries], entries)
+
+    def plan(self, source: str, destination: str, journey_date: str = None,
+             departure_after: str = "00:00", max_transfers: int = None) -> List[Dict]:
+        """Pareto-optimal journeys on arrival time, price and number of transfers
+
+        With a journey date, every leg must have seats on the date it departs;
+        without one, seats aren't checked.
+        """
+        origin = normalize_station(source)
+        target = normalize_station(destination)
+        start = parse_timetable_time(departure_after)
+        first_day = journey_day(journey_date) if journey_date is not None else None
+        if origin == target or start is None or (journey_date is not None and first_day is None):
+            return []
+        if max_transfers is None:
+            max_transfers = self.max_transfers
+
+        start = start[0] + start[1] * MINUTES_PER_DAY
+        horizon = start + self.max_journey_minutes
+        # bags[k]: station -> labels of journeys reaching it on k trains
+        bags = [{origin: [(start, 0.0)]}]
+        found = []
+        reached = {origin: [(start, 0.0, ())]}
+
+        def beaten(station, arrival, price):
+            return any(_dominated(round_bags.get(station, ()), arrival, price) for round_bags in bags)
+
+        for transfers in range(max_transfers + 1):
+            wait = self.min_connection if transfers else 0
+            current = bags[transfers]
+            bags.append({})
+            improved = {}
+            last_round = transfers == max_transfers
+            for station, labels in reached.items():
+                if last_round:
+                    # Only a train straight to the destination can finish the journey now
+                    minutes, entries = self.direct.get((station, target), ((), ()))
+                else:
+                    minutes, entries = self.departures.get(station, ((), ()))
+                count = len(entries)
+                for arrival, price, legs in labels:
+                    if (arrival, price) not in current[station] or beaten(target, arrival, price):
+                        continue  # Beaten by a later label, or can't beat a journey already found
+
+                    ready = arrival + wait
+                    midnight = ready - ready % MINUTES_PER_DAY
+                    first = bisect_left(minutes, ready - midnight)
+                    # Walk departures in the order they leave: the rest of today, then tomorrow
+                    for position in range(first, first + count):
+                        if position < count:
+                            minute, duration, train, stop = entries[position]
+                            departs = midnight + minute
+                        else:
+                            minute, duration, train, stop = entries[position - count]
+                            departs = midnight + MINUTES_PER_DAY + minute
+                        if departs >= horizon:
+                            break
+                        arrives = departs + duration
+                        fare = price + train.price
+                        if arrives > horizon or beaten(target, arrives, fare):
+                            continue
+
+                        if (first_day is not None and
+                                train.seats.available(first_day + departs // MINUTES_PER_DAY) <= 0):
+                            continue
+
+                        if beaten(stop, arrives, fare):
+                            continue
+                        bag = bags[-1].setdefault(stop, [])
+                        bag[:] = [label for label in bag if label[0] < arrives or label[1] < fare]
+                        bag.append((arrives, fare))
+
+                        journey = legs + ((train, departs, arrives),)
+                        if stop == target:
+                            found.append((arrives, fare, journey))
+                        else:
+                            improved.setdefault(stop, []).append((arrives, fare, journey))
+            if not improved:
+                break
+            reached = improved
+
+        return [self._describe(journey, journey_date)
+                for arrival, price, journey in self._pareto(found)]
+
+    @staticmethod
+    def _pareto(found: List[tuple]) -> List[tuple]:
+        """Keep journeys no other journey beats on arrival, price and transfers"""
+        found.sort(key=lambda item: (item[0], item[1], len(item[2])))
+        kept = []
+        for arrival, price, journey in found:
+            if not any(other[1] <= price and len(other[2]) <= len(journey) for other in kept):
+                kept.append((arrival, price, journey))
+        return kept
+
+    @staticmethod
+    def _describe(journey: tuple, journey_date: Optional[str]) -> Dict:
+        """Turn a chain of (train, departs, arrives) legs into a result dict"""
+        first_date = date.fromisoformat(journey_date) if journey_date is not None else None
+        connections = [journey[i + 1][1] - journey[i][2] for i in range(len(journey) - 1)]
+        departs, arrives = journey[0][1], journey[-1][2]
+        stations = [journey[0][0].source] + [train.destination for train, _, _ in journey]
+
+        legs = []
+        for train, leg_departs, leg_arrives in journey:
+            leg_date = None
+            if first_date is not None:
+                leg_date = (first_date + timedelta(days=leg_departs // MINUTES_PER_DAY)).isoformat()
+            legs.append({
+                "train_id": train.train_id,
+                "source": train.source,
+                "destination": train.destination,
+                "journey_date": leg_date,
+                "departure": _format_clock(leg_departs),
+                "arrival": _format_clock(leg_arrives),
+                "price": train.price
+            })
+
+        return {
+            "route": " → ".join(stations),
+            "trains": [train.train_id for train, _, _ in journey],
+            "legs": legs,
+            "transfers": len(journey) - 1,
+            "departure": _format_clock(departs),
+            "arrival": _format_clock(arrives),
+            "total_price": sum(train.price for train, _, _ in journey),
+            "total_duration": format_duration(arrives - departs),
+            "connection_time": str(timedelta(minutes=min(connections))) if connections else None,
+            "connection_times": [str(timedelta(minutes=minutes)) for minutes in connections]
+        }
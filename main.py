@@ -8,25 +8,65 @@ A comprehensive train ticket booking and management system
 VERSION = "1.0.0"
 
 from datetime import datetime, timedelta
-import json
 import os
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from operator import attrgetter
+from typing import Dict, Iterable, List, Optional
 import uuid
 
+from analytics import BookingAggregates
+from config import (BOOKING_SHARDS, DEFAULT_DATA_FILE, GROUP_COMMIT, SEATS_SUFFIX, SHARD_BY, SHARED_SEATS,
+                    SHARED_TIMETABLE, STORAGE_MODE, TIMETABLE_SUFFIX)
+from group_commit import BackgroundWriter
+from indexes import PassengerIndex, RouteIndex
+from inventory import SeatInventory, bookable_day, journey_day, open_seat_store
+from sharding import ShardedBookings, ShardedStorage, ShardRouter
+from storage import create_storage
+from timetable import TIMETABLE_FIELDS, MappedTimetable, open_timetable
+from utils import format_duration, gc_paused, journey_minutes, parse_timetable_time
+
 class Train:
+    # Times are parsed once here: minutes past midnight, the arrival's "+N" day offset and the duration
+    __slots__ = ('train_id', 'name', 'source', 'destination', 'departure_time', 'arrival_time',
+                 'departure_minutes', 'arrival_minutes', 'arrival_day_offset', 'duration_minutes',
+                 'total_seats', 'seats', 'price', 'bookings')
+
     def __init__(self, train_id: str, name: str, source: str, destination: str, 
                  departure_time: str, arrival_time: str, total_seats: int, price: float):
-        self.train_id = train_id
+        self.train_id = sys.intern(train_id)
         self.name = name
-        self.source = source
-        self.destination = destination
+        self.source = sys.intern(source)
+        self.destination = sys.intern(destination)
         self.departure_time = departure_time
         self.arrival_time = arrival_time
+        departure = parse_timetable_time(departure_time)
+        arrival = parse_timetable_time(arrival_time)
+        self.departure_minutes = departure[0] if departure else None
+        self.arrival_minutes, self.arrival_day_offset = arrival if arrival else (None, None)
+        self.duration_minutes = journey_minutes(departure_time, arrival_time)
         self.total_seats = total_seats
-        self.available_seats = total_seats
+        self.seats = SeatInventory(total_seats)
         self.price = price
         self.bookings = []
 
+    @property
+    def available_seats(self) -> int:
+        """Seats left on this train's most heavily booked journey date from today on"""
+        return self.seats.min_available()
+
+    @property
+    def duration(self) -> str:
+        """Journey duration, e.g. 35h 55m"""
+        return format_duration(self.duration_minutes) if self.duration_minutes is not None else "Unknown"
+
+    def seats_on(self, journey_date: str) -> int:
+        """Seats left on a journey date (YYYY-MM-DD)"""
+        day = journey_day(journey_date)
+        return self.seats.available(day) if day is not None else 0
+
     def to_dict(self):
         return {
             'train_id': self.train_id,
@@ -38,7 +78,7 @@ class Train:
             'total_seats': self.total_seats,
             'available_seats': self.available_seats,
             'price': self.price,
-            'bookings': self.bookings
+            'bookings': list(self.bookings)
         }
 
     @classmethod
@@ -47,11 +87,36 @@ class Train:
             data['train_id'], data['name'], data['source'], data['destination'],
             data['departure_time'], data['arrival_time'], data['total_seats'], data['price']
         )
-        train.available_seats = data['available_seats']
+        # Per-date seat counts are rebuilt from the bookings themselves
         train.bookings = data['bookings']
         return train
 
+def _timetable_field(name: str) -> property:
+    return property(lambda train: train.timetable.field(train.index, name),
+                    doc=f"{name}, read from the shared timetable")
+
+class MappedTrain(Train):
+    """A train whose timetable fields are read from a shared, memory-mapped timetable
+
+    Only its seat inventory and booking list live in the process. ID, name,
+    stations, times, capacity and price are read from the mapped file on
+    every access (and cannot be assigned), so worker processes share one
+    copy of the timetable.
+    """
+    __slots__ = ('timetable', 'index')
+
+    def __init__(self, timetable: MappedTimetable, index: int):
+        self.timetable = timetable
+        self.index = index
+        self.seats = SeatInventory(self.total_seats)
+        self.bookings = []
+
+for _name, _ in TIMETABLE_FIELDS:
+    setattr(MappedTrain, _name, _timetable_field(_name))
+
 class Passenger:
+    __slots__ = ('passenger_id', 'name', 'age', 'gender', 'phone', 'email')
+
     def __init__(self, name: str, age: int, gender: str, phone: str, email: str):
         self.passenger_id = str(uuid.uuid4())
         self.name = name
@@ -72,17 +137,27 @@ class Passenger:
 
     @classmethod
     def from_dict(cls, data):
-        passenger = cls(data['name'], data['age'], data['gender'], data['phone'], data['email'])
+        # Skip __init__: it would generate an ID only for it to be overwritten
+        passenger = cls.__new__(cls)
         passenger.passenger_id = data['passenger_id']
+        passenger.name = data['name']
+        passenger.age = data['age']
+        passenger.gender = data['gender']
+        passenger.phone = data['phone']
+        passenger.email = data['email']
         return passenger
 
 class Booking:
+    # The pricing slots are only set for bookings made with a discount code
+    __slots__ = ('booking_id', 'train_id', 'passenger', 'booking_date', 'journey_date', 'status',
+                 'original_price', 'discounted_price', 'discount_code', 'points_earned')
+
     def __init__(self, train_id: str, passenger: Passenger, booking_date: str, journey_date: str):
         self.booking_id = str(uuid.uuid4())
-        self.train_id = train_id
+        self.train_id = sys.intern(train_id)
         self.passenger = passenger
         self.booking_date = booking_date
-        self.journey_date = journey_date
+        self.journey_date = sys.intern(journey_date)
         self.status = "Confirmed"
 
     def to_dict(self):
@@ -96,46 +171,374 @@ class Booking:
         }
 
     @classmethod
-    def from_dict(cls, data):
-        booking = cls(
-            data['train_id'], 
-            Passenger.from_dict(data['passenger']), 
-            data['booking_date'], 
-            data['journey_date']
-        )
+    def from_dict(cls, data, passenger: Passenger = None):
+        """Rebuild a stored booking, optionally around an existing Passenger"""
+        booking = cls.__new__(cls)
         booking.booking_id = data['booking_id']
-        booking.status = data['status']
+        booking.train_id = sys.intern(data['train_id'])
+        booking.passenger = passenger if passenger is not None else Passenger.from_dict(data['passenger'])
+        booking.booking_date = data['booking_date']
+        booking.journey_date = sys.intern(data['journey_date'])
+        booking.status = sys.intern(data['status'])
         return booking
 
+def _passenger_key(email: str, name: str, age: int, gender: str, phone: str):
+    """Identity of a person across bookings: the same details mean the same passenger"""
+    return (email.strip().lower(), name, age, gender, phone)
+
+class _BookingDicts(Mapping):
+    """Bookings as dicts, converted one at a time while a snapshot is written"""
+
+    def __init__(self, bookings: Dict[str, Booking]):
+        self._bookings = bookings
+
+    def __getitem__(self, booking_id):
+        return self._bookings[booking_id].to_dict()
+
+    def __iter__(self):
+        return iter(self._bookings)
+
+    def __len__(self):
+        return len(self._bookings)
+
+    def to_columns(self, booking_columns, passenger_columns):
+        """Booking attributes column by column, for storage formats that store columns
+
+        Returns the booking columns, each booking's row in the passenger
+        columns, and the passenger columns. A Passenger shared by several
+        bookings gets one row.
+        """
+        bookings = list(self._bookings.values())
+        people = list(map(attrgetter('passenger'), bookings))
+        ids = list(map(id, people))
+        unique = dict(zip(ids, people))  # first-seen order, one entry per Passenger object
+        rows = dict(zip(unique, range(len(unique))))
+        passenger_rows = list(map(rows.__getitem__, ids))
+        passengers = list(unique.values())
+        return ({name: list(map(attrgetter(name), bookings)) for name in booking_columns},
+                passenger_rows,
+                {name: list(map(attrgetter(name), passengers)) for name in passenger_columns})
+
 class TrainBookingSystem:
-    def __init__(self, data_file: str = "train_data.json"):
+    def __init__(self, data_file: str = DEFAULT_DATA_FILE, storage_mode: str = None,
+                 group_commit: bool = None, shared_timetable: bool = None, shared_seats: bool = None,
+                 shard_by: str = None, shards: int = None):
         self.data_file = data_file
+        # Sharded, each region's (or hash bucket's) trains and bookings are
+        # stored, saved and locked apart; passenger lookups use the global index
+        shard_by = SHARD_BY if shard_by is None else shard_by
+        self.router = ShardRouter(shard_by, shards or BOOKING_SHARDS) if shard_by else None
+        if self.router is not None:
+            self.storage = ShardedStorage(storage_mode or STORAGE_MODE, data_file, self.router)
+        else:
+            self.storage = create_storage(storage_mode or STORAGE_MODE, data_file)
+        # With a shared timetable, trains are views onto one file that every
+        # worker process maps; trains added later stay ordinary objects until
+        # the next start compiles them in
+        self.shared_timetable = SHARED_TIMETABLE if shared_timetable is None else shared_timetable
+        self.timetable_file = os.path.splitext(data_file)[0] + TIMETABLE_SUFFIX
+        # With shared seats, every train's counters live in one file that all
+        # worker processes on the node map and decrement under a lock. Their
+        # bookings must all reach the store too, so a backend that rewrites
+        # whole snapshots (or compacts from one process's view) won't do
+        self.seat_store = None
+        if SHARED_SEATS if shared_seats is None else shared_seats:
+            if not self.storage.shares_writes:
+                self.storage.close()
+                raise ValueError("Shared seats need storage every worker can write to at once: "
+                                 "use the unsharded sqlite storage mode")
+            self.seat_store = open_seat_store(os.path.splitext(data_file)[0] + SEATS_SUFFIX)
         self.trains = {}
-        self.bookings = {}
+        self.bookings = self._empty_bookings()
+        self.route_index = RouteIndex()
+        self.passenger_index = PassengerIndex()
+        self.aggregates = BookingAggregates()
+        self.passengers = {}
+        # Bumped after every change to trains, bookings or seats, so callers
+        # can tell whether anything derived from them is still current
+        self.data_version = 0
+        self.last_modified = time.time()
+        # Seat checks and decrements lock only their own train; the bookings
+        # dict and indexes share one short-lived lock, and persistence is
+        # serialized separately so disk writes never block seat allocation
+        self._train_locks = {}
+        self._index_lock = threading.Lock()
+        self._persist_lock = threading.RLock()
+        # A background writer (group_commit.py, async_booking.py) takes over
+        # persistence while attached and writes queued changes in groups
+        self.writer = None
         self.load_data()
         self.initialize_sample_trains()
+        if GROUP_COMMIT if group_commit is None else group_commit:
+            BackgroundWriter(self).start()
 
     def load_data(self):
-        """Load data from JSON file"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    self.trains = {tid: Train.from_dict(tdata) for tid, tdata in data.get('trains', {}).items()}
-                    self.bookings = {bid: Booking.from_dict(bdata) for bid, bdata in data.get('bookings', {}).items()}
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Error loading data: {e}. Starting with empty data.")
-                self.trains = {}
-                self.bookings = {}
+        """Stream the latest snapshot and replay any journaled changes
+
+        Each booking is built as soon as its record has been read, so the
+        parsed snapshot never sits in memory next to the objects made from
+        it. A damaged snapshot falls back to the newest backup generation
+        that verifies; if none does, CorruptSnapshotError is raised rather
+        than starting empty and overwriting the data on the next save.
+        """
+        with gc_paused():
+            self.passengers = {}
+            self.trains = {}
+            self.bookings = self._empty_bookings()
+            records = []
+            train_dicts = []
+            for key, value in self.storage.iter_load():
+                if key == 'booking':
+                    booking_id, data = value
+                    passenger = self._stored_passenger(data['passenger'])
+                    self.bookings[booking_id] = Booking.from_dict(data, passenger)
+                elif key == 'trains':
+                    # Sharded storage sends each shard's trains ahead of its bookings
+                    if self.router is not None:
+                        for tid, tdata in value.items():
+                            self.router.assign(tid, tdata['source'], tdata['destination'])
+                    if self.shared_timetable:
+                        train_dicts.extend(value.values())  # Mapped once every shard's are in
+                    else:
+                        self.trains.update((tid, Train.from_dict(tdata)) for tid, tdata in value.items())
+                elif key == 'booking_columns':
+                    self._load_booking_columns(*value)
+                elif key == 'record':
+                    records.append(value)
+
+            if train_dicts:
+                self.trains = self._mapped_trains(train_dicts)
+            for train in self.trains.values():
+                train.bookings = []  # Rebuilt below around the booking objects' own IDs
+            days = {}
+            for booking in self.bookings.values():
+                train = self.trains.get(booking.train_id)
+                if train is None or booking.status != "Confirmed":
+                    continue
+                train.bookings.append(booking.booking_id)
+                if booking.journey_date not in days:
+                    days[booking.journey_date] = journey_day(booking.journey_date)
+                day = days[booking.journey_date]
+                if day is not None:
+                    train.seats.reserve(day)
+            for record in records:
+                self._replay(record)
+            self._share_seats(self.trains.values())
+            self.route_index = RouteIndex(self.trains.values())
+            self.passenger_index = PassengerIndex(self.bookings.values())
+            self.aggregates = BookingAggregates.from_bookings(self.bookings.values(), self.trains)
+
+    def _load_booking_columns(self, columns: Dict[str, List], passenger_rows,
+                              passenger_columns: Dict[str, List]):
+        """Build bookings from a columnar snapshot without a dict per booking"""
+        passengers = []
+        for passenger_id, name, age, gender, phone, email in zip(
+                passenger_columns['passenger_id'], passenger_columns['name'], passenger_columns['age'],
+                passenger_columns['gender'], passenger_columns['phone'], passenger_columns['email']):
+            key = _passenger_key(email, name, age, gender, phone)
+            passenger = self.passengers.get(key)
+            if passenger is None:
+                passenger = self.passengers[key] = Passenger.__new__(Passenger)
+                passenger.passenger_id = passenger_id
+                passenger.name, passenger.age, passenger.gender = name, age, gender
+                passenger.phone, passenger.email = phone, email
+            passengers.append(passenger)
+
+        for booking_id, train_id, booking_date, journey_date, status, row in zip(
+                columns['booking_id'], columns['train_id'], columns['booking_date'],
+                columns['journey_date'], columns['status'], passenger_rows):
+            booking = Booking.__new__(Booking)
+            booking.booking_id = booking_id
+            booking.train_id = train_id
+            booking.passenger = passengers[row]
+            booking.booking_date = booking_date
+            booking.journey_date = journey_date
+            booking.status = status
+            self.bookings[booking_id] = booking
+
+    def _empty_bookings(self):
+        return ShardedBookings(self.router) if self.router is not None else {}
 
     def save_data(self):
-        """Save data to JSON file"""
-        data = {
-            'trains': {tid: train.to_dict() for tid, train in self.trains.items()},
-            'bookings': {bid: booking.to_dict() for bid, booking in self.bookings.items()}
+        """Save a full snapshot of all trains and bookings (every shard's, when sharded)"""
+        if self.router is None:
+            with self._persist_lock:
+                self.storage.save_snapshot(self.snapshot_data())
+            return
+
+        with self._index_lock:
+            shards = {self.router.shard_of(train_id) for train_id in self.trains}
+            shards.update(self.bookings.shards)
+        for shard in shards:
+            with self.storage.lock(shard):
+                self.storage.shard(shard).save_snapshot(self.snapshot_data(shard))
+        self.storage.write_manifest(list(shards))
+
+    def snapshot_data(self, shard: str = None) -> Dict:
+        """Current trains and bookings (of one shard, if given) in the form storage backends save
+
+        Bookings are converted to dicts only as a backend reads them.
+        """
+        with self._index_lock:
+            if shard is None:
+                trains = list(self.trains.items())
+                bookings = dict(self.bookings)
+            else:
+                trains = [(tid, train) for tid, train in self.trains.items() if self.router.shard_of(tid) == shard]
+                bookings = dict(self.bookings.shard(shard))
+        return {
+            'trains': {tid: train.to_dict() for tid, train in trains},
+            'bookings': _BookingDicts(bookings)
         }
-        with open(self.data_file, 'w') as f:
-            json.dump(data, f, indent=2)
+
+    def _persist(self, record: Dict):
+        """Persist a single change, appending it when the backend supports it"""
+        writer = self.writer
+        if writer is not None:
+            writer.submit(record)
+            return
+
+        if self.router is not None:
+            self._write_shard(self.router.shard_for_record(record), [record])
+            return
+        with self._persist_lock:
+            if not self.storage.appends_records:
+                self.save_data()
+                return
+
+            self.storage.append(record)
+            if self.storage.needs_compaction():
+                self.save_data()
+
+    def _write_records(self, records: List[Dict]):
+        """Durably persist a group of changes with one snapshot or one journal sync (per shard)"""
+        if self.router is not None:
+            by_shard = {}
+            for record in records:
+                by_shard.setdefault(self.router.shard_for_record(record), []).append(record)
+            for shard, shard_records in by_shard.items():
+                self._write_shard(shard, shard_records)
+            return
+        with self._persist_lock:
+            if not self.storage.appends_records:
+                self.save_data()
+                return
+
+            self.storage.append_many(records)
+            if self.storage.needs_compaction():
+                self.save_data()
+
+    def _write_shard(self, shard: str, records: List[Dict]):
+        """Persist changes to one shard, holding only that shard's lock"""
+        storage = self.storage.shard(shard)
+        with self.storage.lock(shard):
+            if storage.appends_records and len(records) == 1:
+                storage.append(records[0])
+            elif storage.appends_records:
+                storage.append_many(records)
+            if not storage.appends_records or storage.needs_compaction():
+                storage.save_snapshot(self.snapshot_data(shard))
+        if self.storage.needs_compaction():
+            self.save_data()  # A shard the manifest doesn't list yet: record the new layout
+
+    def close(self):
+        """Write any queued changes and release the storage backend"""
+        writer = self.writer
+        if isinstance(writer, BackgroundWriter):
+            writer.stop()
+        self.storage.close()
+        if self.seat_store is not None:
+            self.seat_store.close()
+            self.seat_store = None
+
+    def wait_durable(self, timeout: float = None):
+        """Block until every change made so far is on disk
+
+        Changes are written before their call returns unless a background
+        writer is attached, so this only waits while one is.
+        """
+        writer = self.writer
+        if writer is not None:
+            writer.wait(timeout=timeout)
+
+    def _train_lock(self, train_id: str) -> threading.Lock:
+        """Lock guarding one train's seat counts"""
+        lock = self._train_locks.get(train_id)
+        if lock is None:
+            lock = self._train_locks.setdefault(train_id, threading.Lock())
+        return lock
+
+    def _replay(self, record: Dict):
+        """Re-apply a journaled change on top of the loaded snapshot"""
+        if record['op'] == 'train':
+            train = Train.from_dict(record['train'])
+            self._assign_shard(train)
+            self.trains[train.train_id] = train
+        elif record['op'] in ('book', 'book_batch'):
+            booking_dicts = record['bookings'] if record['op'] == 'book_batch' else [record['booking']]
+            for booking_data in booking_dicts:
+                # A concurrent compaction may already have captured this booking
+                if booking_data['booking_id'] not in self.bookings:
+                    self._apply_booking(Booking.from_dict(booking_data))
+        elif record['op'] == 'cancel':
+            booking = self.bookings.get(record['booking_id'])
+            if booking and booking.status == "Confirmed":
+                self._apply_cancellation(booking)
+
+    def _shared_passenger(self, passenger: Passenger) -> Passenger:
+        """Return the one Passenger object kept for these passenger details
+
+        Repeat bookings by the same person share a single record instead of
+        each booking holding its own copy.
+        """
+        key = _passenger_key(passenger.email, passenger.name, passenger.age,
+                             passenger.gender, passenger.phone)
+        return self.passengers.setdefault(key, passenger)
+
+    def _stored_passenger(self, data: Dict) -> Passenger:
+        """Shared Passenger for stored passenger details, built only the first time they are seen"""
+        key = _passenger_key(data['email'], data['name'], data['age'], data['gender'], data['phone'])
+        passenger = self.passengers.get(key)
+        if passenger is None:
+            passenger = self.passengers[key] = Passenger.from_dict(data)
+        return passenger
+
+    def _changed(self):
+        """Bump the data version after a change (caller holds the index lock)"""
+        self.data_version += 1
+        self.last_modified = time.time()
+
+    def _apply_booking(self, booking: Booking, seat_taken: bool = False):
+        """Record a confirmed booking and take its seat unless already taken (caller holds the train lock)"""
+        with self._index_lock:
+            booking.passenger = self._shared_passenger(booking.passenger)
+            self.bookings[booking.booking_id] = booking
+            self.passenger_index.add(booking)
+            self.aggregates.record_booking(booking, self.trains.get(booking.train_id))
+        train = self.trains.get(booking.train_id)
+        if train:
+            day = journey_day(booking.journey_date)
+            if day is not None and not seat_taken:
+                train.seats.reserve(day)
+            train.bookings.append(booking.booking_id)
+        with self._index_lock:
+            self._changed()
+
+    def _apply_cancellation(self, booking: Booking, release_seat: bool = True):
+        """Mark a booking cancelled and release its seat unless told not to (caller holds the train lock)"""
+        old_status = booking.status
+        booking.status = "Cancelled"
+        with self._index_lock:
+            self.passenger_index.change_status(booking, old_status)
+            self.aggregates.record_cancellation(booking, self.trains.get(booking.train_id))
+        train = self.trains.get(booking.train_id)
+        if train:
+            day = journey_day(booking.journey_date)
+            if day is not None and release_seat:
+                train.seats.release(day)
+            train.bookings.remove(booking.booking_id)
+        with self._index_lock:
+            self._changed()
 
     def initialize_sample_trains(self):
         """Initialize with sample train data if no trains exist"""
@@ -189,50 +592,141 @@ class TrainBookingSystem:
                 Train("SA003", "Cusco-Machu Picchu", "Cusco", "Aguas Calientes", "06:10", "09:54", 112, 75.0)
             ]
             
-            for train in sample_trains:
-                self.trains[train.train_id] = train
+            if self.shared_timetable:
+                self.trains = self._mapped_trains([train.to_dict() for train in sample_trains])
+            else:
+                self.trains = {train.train_id: train for train in sample_trains}
+            self._share_seats(self.trains.values())
+            for train in self.trains.values():
+                self._assign_shard(train)
+                self.route_index.add(train)
             self.save_data()
 
-    def search_trains(self, source: str, destination: str, date: str = None) -> List[Train]:
-        """Search for trains between source and destination"""
-        results = []
-        for train in self.trains.values():
-            if (train.source.lower() == source.lower() and 
-                train.destination.lower() == destination.lower() and 
-                train.available_seats > 0):
-                results.append(train)
-        return results
+    def _mapped_trains(self, train_dicts: List[Dict]) -> Dict[str, MappedTrain]:
+        """Trains as views onto the shared timetable, compiled from train_dicts if it is out of date"""
+        timetable = open_timetable(self.timetable_file, train_dicts)
+        trains = {}
+        for index in range(len(timetable)):
+            train = MappedTrain(timetable, index)
+            trains[train.train_id] = train
+        return trains
+
+    def _assign_shard(self, train: Train):
+        """Route a train's bookings to its shard from now on"""
+        if self.router is not None:
+            self.router.assign(train.train_id, train.source, train.destination)
+
+    def _share_seats(self, trains: Iterable[Train]):
+        """Switch trains over to their counters in the shared seat file
+
+        The first process to open the file copies in the seats taken by the
+        bookings it loaded; processes that join later find them there.
+        """
+        if self.seat_store is None:
+            return
+        with self.seat_store.seeding() as first:
+            for train in trains:
+                seats = self.seat_store.seats(train.train_id, train.total_seats)
+                if first and isinstance(train.seats, SeatInventory):
+                    seats.seed(train.seats)
+                train.seats = seats
+
+    def add_train(self, train: Train):
+        """Add a train to the timetable (or replace one with the same ID)"""
+        self._share_seats([train])
+        self._assign_shard(train)
+        with self._index_lock:
+            self.trains[train.train_id] = train
+            self.route_index.add(train)
+            self._changed()
+        self._persist({'op': 'train', 'train': train.to_dict()})
+
+    def search_trains(self, source: str, destination: str, date: str = None,
+                      departure_after: str = None, departure_before: str = None) -> List[Train]:
+        """Search for trains between source and destination, with seats on date if given
+
+        Without a date every train on the route is returned, as seats are only
+        ever sold out on particular dates. With a departure window ("HH:MM" bounds; invalid ones are ignored) trains
+        come back in departure order.
+        """
+        after = parse_timetable_time(departure_after) if departure_after else None
+        before = parse_timetable_time(departure_before) if departure_before else None
+        if after is None and before is None:
+            trains = self.route_index.find(source, destination)
+        else:
+            trains = self.route_index.find_departing(source, destination, after[0] if after else 0,
+                                                     before[0] if before else None)
+        if date is None:
+            return trains
+
+        day = journey_day(date)
+        if day is None:
+            return []
+        return [train for train in trains if train.seats.available(day) > 0]
 
     def book_ticket(self, train_id: str, passenger: Passenger, journey_date: str) -> Optional[Booking]:
         """Book a ticket for a passenger"""
         if train_id not in self.trains:
             return None
         
-        train = self.trains[train_id]
-        if train.available_seats <= 0:
+        day = bookable_day(journey_date)
+        if day is None:
             return None
 
-        booking = Booking(train_id, passenger, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), journey_date)
-        self.bookings[booking.booking_id] = booking
-        train.available_seats -= 1
-        train.bookings.append(booking.booking_id)
+        train = self.trains[train_id]
+        with self._train_lock(train_id):
+            # Check and take the seat in one step, as other processes may share the counter
+            if not train.seats.reserve(day):
+                return None
+
+            booking = Booking(train_id, passenger, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), journey_date)
+            self._apply_booking(booking, seat_taken=True)
         
-        self.save_data()
+        self._persist({'op': 'book', 'booking': booking.to_dict()})
         return booking
 
+    def book_tickets_batch(self, train_id: str, passengers: List[Passenger],
+                           journey_date: str) -> Optional[List[Booking]]:
+        """Book seats for a group on one train and date, all or nothing"""
+        if train_id not in self.trains or not passengers:
+            return None
+
+        day = bookable_day(journey_date)
+        if day is None:
+            return None
+
+        train = self.trains[train_id]
+        booking_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._train_lock(train_id):
+            if not train.seats.reserve(day, len(passengers)):
+                return None
+
+            bookings = [Booking(train_id, passenger, booking_date, journey_date) for passenger in passengers]
+            for booking in bookings:
+                self._apply_booking(booking, seat_taken=True)
+
+        self._persist({'op': 'book_batch', 'bookings': [booking.to_dict() for booking in bookings]})
+        return bookings
+
     def cancel_booking(self, booking_id: str) -> bool:
         """Cancel a booking"""
         if booking_id not in self.bookings:
             return False
         
         booking = self.bookings[booking_id]
-        train = self.trains[booking.train_id]
-        
-        booking.status = "Cancelled"
-        train.available_seats += 1
-        train.bookings.remove(booking_id)
+        with self._train_lock(booking.train_id):
+            if booking.status != "Confirmed":
+                return False
+            # Workers sharing seats may hold the same booking: only the one
+            # whose update flips it in the database gives the seat back. One
+            # still queued for writing can't be known to any other worker
+            claimed = self.storage.claim_cancellation(booking_id) if self.seat_store is not None else None
+            self._apply_cancellation(booking, release_seat=claimed is not False)
+            if claimed is False:
+                return False
         
-        self.save_data()
+        if claimed is None:
+            self._persist({'op': 'cancel', 'booking_id': booking_id, 'train_id': booking.train_id})
         return True
 
     def get_booking(self, booking_id: str) -> Optional[Booking]:
@@ -240,9 +734,8 @@ class TrainBookingSystem:
         return self.bookings.get(booking_id)
 
     def get_passenger_bookings(self, email: str) -> List[Booking]:
-        """Get all bookings for a passenger by email"""
-        return [booking for booking in self.bookings.values() 
-                if booking.passenger.email == email and booking.status == "Confirmed"]
+        """Get all confirmed bookings for a passenger by email (case-insensitive)"""
+        return self.passenger_index.find(email, "Confirmed")
 
     def display_trains(self, trains: List[Train]):
         """Display train information in a formatted way"""
@@ -269,6 +762,7 @@ class TrainBookingSystem:
         print(f"Route: {train.source} → {train.destination}")
         print(f"Departure: {train.departure_time}")
         print(f"Arrival: {train.arrival_time}")
+        print(f"Duration: {train.duration}")
         print(f"Passenger: {booking.passenger.name}")
         print(f"Journey Date: {booking.journey_date}")
         print(f"Booking Date: {booking.booking_date}")
@@ -370,7 +864,7 @@ def main():
                 print("\n✅ Booking Successful!")
                 system.display_booking_details(booking)
             else:
-                print("❌ Booking failed. No seats available.")
+                print("❌ Booking failed. No seats available on that date (use YYYY-MM-DD).")
                 
         elif choice == '3':
             print("\n❌ CANCEL BOOKING")
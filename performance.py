@@ -6,10 +6,15 @@ Performance monitoring and optimization tools for Train Booking System
 import time
 import psutil
 import os
-from datetime import datetime
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 from typing import Dict, List
 import json
 
+from config import CACHE_MIN_SHARD_SIZE, CACHE_SHARDS
+
 class PerformanceMonitor:
     """Monitor system performance and resource usage"""
     
@@ -160,72 +165,158 @@ class DatabaseOptimizer:
         
         return compressed
 
+def _estimate_size(value) -> int:
+    """Rough size in bytes of a cached value, counting one level of containers"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(sys.getsizeof(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(item) for key, item in value.items())
+    return size
+
+class _CacheShard:
+    """One independently locked slice of a CacheManager"""
+    __slots__ = ('lock', 'entries', 'bytes', 'hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, expires_at, size), least recently used first
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def expire(self, now: float):
+        """Drop expired entries; they are always at the least recently used end"""
+        entries = self.entries
+        while entries:
+            key, (value, expires_at, size) = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            del entries[key]
+            self.bytes -= size
+            self.expirations += 1
+
 class CacheManager:
-    """Manage caching for frequently accessed data"""
+    """Manage caching for frequently accessed data
+    
+    A thread-safe LRU cache split into shards, each an OrderedDict with its
+    own lock, so get and set are O(1) and threads working on different keys
+    rarely wait for each other. An entry expires ttl_seconds after it was
+    last set or read. Because every set or hit moves the entry to the back,
+    the front of each shard is also the entry that expires next, so expired
+    entries are dropped from the front as a shard is written to, with no
+    timer or full scan.
     
-    def __init__(self, max_size: int = 100, ttl_seconds: int = 300):
-        self.cache = {}
-        self.access_times = {}
+    Capacity is max_size entries and, optionally, max_bytes of estimated
+    value size; both are split evenly across shards, so the least recently
+    used entry of the shard being written to is evicted first.
+    """
+    
+    def __init__(self, max_size: int = 100, ttl_seconds: int = 300, max_bytes: int = None,
+                 shards: int = None, sizeof=_estimate_size):
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
-        
+        self.max_bytes = max_bytes
+        # Small caches keep one shard so eviction stays exact LRU
+        self.shard_count = shards or max(1, min(CACHE_SHARDS, max_size // CACHE_MIN_SHARD_SIZE))
+        self.sizeof = sizeof
+        self._shards = [_CacheShard() for _ in range(self.shard_count)]
+        self._shard_size = -(-max_size // self.shard_count)
+        self._shard_bytes = -(-max_bytes // self.shard_count) if max_bytes else None
+    
+    def _shard(self, key) -> _CacheShard:
+        return self._shards[hash(key) % self.shard_count]
+    
     def get(self, key: str):
         """Get item from cache"""
-        current_time = time.time()
-        
-        if key in self.cache:
-            # Check if item has expired
-            if current_time - self.access_times[key] > self.ttl_seconds:
-                del self.cache[key]
-                del self.access_times[key]
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
                 return None
             
-            self.access_times[key] = current_time
-            return self.cache[key]
-        
-        return None
+            value, expires_at, size = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del shard.entries[key]
+                shard.bytes -= size
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            
+            shard.entries[key] = (value, now + self.ttl_seconds, size)
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return value
     
     def set(self, key: str, value):
         """Set item in cache"""
-        current_time = time.time()
-        
-        # Remove expired items
-        self._cleanup_expired()
-        
-        # Remove oldest item if cache is full
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.access_times.keys(), key=lambda k: self.access_times[k])
-            del self.cache[oldest_key]
-            del self.access_times[oldest_key]
-        
-        self.cache[key] = value
-        self.access_times[key] = current_time
+        size = self.sizeof(value) if self._shard_bytes else 0
+        shard = self._shard(key)
+        with shard.lock:
+            now = time.monotonic()
+            old = shard.entries.pop(key, None)
+            if old is not None:
+                shard.bytes -= old[2]
+            shard.expire(now)
+            
+            shard.entries[key] = (value, now + self.ttl_seconds, size)
+            shard.bytes += size
+            entries = shard.entries
+            while len(entries) > self._shard_size or (self._shard_bytes and shard.bytes > self._shard_bytes
+                                                      and len(entries) > 1):
+                _, (_, _, evicted_size) = entries.popitem(last=False)
+                shard.bytes -= evicted_size
+                shard.evictions += 1
     
-    def _cleanup_expired(self):
-        """Remove expired items from cache"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, access_time in self.access_times.items()
-            if current_time - access_time > self.ttl_seconds
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
-            del self.access_times[key]
+    def delete(self, key: str) -> bool:
+        """Remove an item, returning whether it was cached"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.pop(key, None)
+            if entry is None:
+                return False
+            shard.bytes -= entry[2]
+            return True
     
     def clear(self):
         """Clear all cache"""
-        self.cache.clear()
-        self.access_times.clear()
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.bytes = 0
+    
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
     
     def get_stats(self) -> Dict:
         """Get cache statistics"""
-        self._cleanup_expired()
+        totals = {"size": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                shard.expire(now)
+                totals["size"] += len(shard.entries)
+                totals["bytes"] += shard.bytes
+                totals["hits"] += shard.hits
+                totals["misses"] += shard.misses
+                totals["evictions"] += shard.evictions
+                totals["expirations"] += shard.expirations
+        
+        lookups = totals["hits"] + totals["misses"]
         return {
-            "size": len(self.cache),
+            "size": totals["size"],
             "max_size": self.max_size,
-            "utilization_percent": round((len(self.cache) / self.max_size) * 100, 2),
-            "ttl_seconds": self.ttl_seconds
+            "utilization_percent": round((totals["size"] / self.max_size) * 100, 2),
+            "ttl_seconds": self.ttl_seconds,
+            "bytes": totals["bytes"] if self.max_bytes else None,
+            "max_bytes": self.max_bytes,
+            "shards": self.shard_count,
+            "hits": totals["hits"],
+            "misses": totals["misses"],
+            "hit_ratio_percent": round(totals["hits"] / lookups * 100, 2) if lookups else 0.0,
+            "evictions": totals["evictions"],
+            "expirations": totals["expirations"]
         }
 
 def benchmark_operations(booking_system, num_operations: int = 1000) -> Dict:
@@ -257,11 +348,595 @@ def benchmark_operations(booking_system, num_operations: int = 1000) -> Dict:
     monitor.log_operation("data_saving", save_duration / 100)
     results["save_avg_ms"] = round((save_duration / 100) * 1000, 2)
     
+    # Compare snapshot formats on the same data
+    results["snapshot_formats"] = benchmark_snapshot_formats(booking_system)
+    
     results["system_stats"] = monitor.get_system_stats()
     results["performance_report"] = monitor.generate_performance_report()
     
     return results
 
+def benchmark_snapshot_formats(booking_system, iterations: int = 3) -> Dict:
+    """Size and save/load time of the system's data as an indented JSON vs a binary snapshot
+
+    "load_ms" reads the snapshot back through the storage backend;
+    "startup_ms" builds a whole TrainBookingSystem from it, indexes and
+    report aggregates included.
+    """
+    import tempfile
+    from collections import deque
+    from main import TrainBookingSystem
+    from storage import BinaryStorage, JsonStorage
+
+    data = booking_system.snapshot_data()
+    results = {"bookings": len(booking_system.bookings)}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, "snapshot.json")
+        for mode, storage_class in (("json", JsonStorage), ("binary", BinaryStorage)):
+            storage = storage_class(data_file, backups=0)
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                storage.save_snapshot(data)
+            save_duration = (time.perf_counter() - start_time) / iterations
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                deque(storage.iter_load(), maxlen=0)
+            load_duration = (time.perf_counter() - start_time) / iterations
+            start_time = time.perf_counter()
+            TrainBookingSystem(data_file, mode, group_commit=False)
+            startup_duration = time.perf_counter() - start_time
+            results[mode] = {
+                "size_mb": round(os.path.getsize(storage.data_file) / 2**20, 2),
+                "save_ms": round(save_duration * 1000, 2),
+                "load_ms": round(load_duration * 1000, 2),
+                "startup_ms": round(startup_duration * 1000, 2)
+            }
+    # How many times smaller or faster binary is than JSON
+    results["binary_improvement"] = {key.rsplit("_", 1)[0]: round(results["json"][key] / results["binary"][key], 1)
+                                     for key in results["json"] if results["binary"][key]}
+    return results
+
+def benchmark_booking_memory(num_bookings: int = 1_000_000, num_passengers: int = 10_000) -> Dict:
+    """Measure bytes per in-memory booking for the slotted models vs the old layout
+
+    The old layout is rebuilt with plain classes: every booking owns its own
+    Passenger copy (as loading from JSON used to produce) and nothing is interned.
+    """
+    import tracemalloc
+    import uuid
+    from main import Booking, Passenger
+
+    class LegacyPassenger:
+        def __init__(self, name, age, gender, phone, email):
+            self.passenger_id = str(uuid.uuid4())
+            self.name, self.age, self.gender, self.phone, self.email = name, age, gender, phone, email
+
+    class LegacyBooking:
+        def __init__(self, train_id, passenger, booking_date, journey_date):
+            self.booking_id = str(uuid.uuid4())
+            self.train_id, self.passenger = train_id, passenger
+            self.booking_date, self.journey_date = booking_date, journey_date
+            self.status = "Confirmed"
+
+    def details(i):
+        p = i % num_passengers
+        return (f"Passenger {p}", 20 + p % 60, "F", f"555{p:07d}", f"passenger{p}@example.com")
+
+    def build(booking_cls, passenger_for):
+        bookings = {}
+        for i in range(num_bookings):
+            # Copy strings the way json.load hands them out
+            train_id = "".join(["T", f"{i % 35:03d}"])
+            journey_date = "".join(["2025-09-", f"{1 + i % 28:02d}"])
+            booking_date = f"2025-08-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:{(i // 60) % 60:02d}"
+            booking = booking_cls(train_id, passenger_for(i), booking_date, journey_date)
+            bookings[booking.booking_id] = booking
+        return bookings
+
+    def measure(booking_cls, passenger_for):
+        tracemalloc.start()
+        bookings = build(booking_cls, passenger_for)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del bookings
+        return round(size / num_bookings, 1)
+
+    shared = {}
+
+    def shared_passenger(i):
+        key = details(i)
+        if key not in shared:
+            shared[key] = Passenger(*key)
+        return shared[key]
+
+    legacy = measure(LegacyBooking, lambda i: LegacyPassenger(*details(i)))
+    slotted = measure(Booking, shared_passenger)
+    return {
+        "bookings": num_bookings,
+        "legacy_bytes_per_booking": legacy,
+        "slotted_bytes_per_booking": slotted,
+        "saving_percent": round((1 - slotted / legacy) * 100, 1)
+    }
+
+def benchmark_columnar_analytics(num_bookings: int = 10_000_000, num_trains: int = 35, seed: int = 7) -> Dict:
+    """Time vectorized reports over a synthetic columnar booking history"""
+    import numpy as np
+    from columnar import ColumnarBookingSnapshot
+
+    rng = np.random.default_rng(seed)
+    start = int(np.datetime64("2025-01-01T00:00:00", "s").astype(np.int64))
+    booked_at = start + rng.integers(0, 365 * 86400, num_bookings)
+    snapshot = ColumnarBookingSnapshot(
+        train_ids=[f"T{i:03d}" for i in range(num_trains)],
+        routes=[f"Route {i}" for i in range(num_trains)],
+        train_route=np.arange(num_trains),
+        train_price=rng.uniform(10, 500, num_trains),
+        train_seats=rng.integers(100, 2000, num_trains),
+        train_code=rng.integers(0, num_trains, num_bookings),
+        status=(rng.random(num_bookings) < 0.1).astype(np.int8),
+        booked_at=booked_at,
+        journey_day=booked_at // 86400 + rng.integers(0, 60, num_bookings)
+    )
+
+    results = {"bookings": num_bookings}
+    for name, report in (("route_performance", snapshot.route_performance),
+                         ("revenue_trend", snapshot.revenue_trend),
+                         ("peak_times", snapshot.peak_times),
+                         ("train_utilization", snapshot.train_utilization)):
+        start_time = time.time()
+        report()
+        results[f"{name}_ms"] = round((time.time() - start_time) * 1000, 2)
+    return results
+
+def benchmark_journey_planner(num_trains: int = 20_000, num_stations: int = 400,
+                              num_queries: int = 50, seed: int = 3) -> Dict:
+    """Time journey planner queries on a synthetic timetable of daily trains"""
+    import random
+    from main import Train
+    from journey_planner import JourneyPlanner
+
+    rng = random.Random(seed)
+    stations = [f"Station {i}" for i in range(num_stations)]
+    trains = []
+    for i in range(num_trains):
+        source, destination = rng.sample(stations, 2)
+        departs = rng.randrange(1440)
+        arrives = departs + rng.randrange(30, 600)
+        arrival = f"{arrives % 1440 // 60:02d}:{arrives % 60:02d}"
+        if arrives >= 1440:
+            arrival += f"+{arrives // 1440}"
+        trains.append(Train(f"B{i:05d}", f"Bench {i}", source, destination,
+                            f"{departs // 60:02d}:{departs % 60:02d}", arrival, 100, float(rng.randrange(10, 200))))
+
+    start_time = time.time()
+    planner = JourneyPlanner(trains)
+    build_ms = (time.time() - start_time) * 1000
+
+    timings = []
+    for _ in range(num_queries):
+        source, destination = rng.sample(stations, 2)
+        start_time = time.time()
+        planner.plan(source, destination, "2030-01-01", "08:00")
+        timings.append((time.time() - start_time) * 1000)
+    timings.sort()
+
+    return {
+        "trains": num_trains,
+        "build_ms": round(build_ms, 2),
+        "median_query_ms": round(timings[len(timings) // 2], 2),
+        "max_query_ms": round(timings[-1], 2)
+    }
+
+def benchmark_shared_timetable(num_trains: int = 50_000, worker_counts: tuple = (1, 2, 4, 8),
+                               seed: int = 5) -> Dict:
+    """Memory of N worker processes holding the timetable as objects vs one mapped file
+
+    Every worker loads the same data file, reads every train's fields and
+    waits; once all are up, their unique (USS) and proportional (PSS) memory
+    is sampled. With the shared timetable the mapped pages are counted once
+    across workers instead of once per worker.
+    """
+    import random
+    import subprocess
+    import tempfile
+    from main import Train, TrainBookingSystem
+
+    rng = random.Random(seed)
+    stations = [f"Station {i}" for i in range(400)]
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {"trains": num_trains}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, "train_data.json")
+        system = TrainBookingSystem(data_file, "json", group_commit=False)
+        system.trains = {}
+        for i in range(num_trains):
+            source, destination = rng.sample(stations, 2)
+            departs = rng.randrange(1440)
+            arrives = departs + rng.randrange(30, 600)
+            arrival = f"{arrives % 1440 // 60:02d}:{arrives % 60:02d}" + (f"+{arrives // 1440}" if arrives >= 1440 else "")
+            train = Train(f"W{i:06d}", f"Worker Bench {i}", source, destination,
+                          f"{departs // 60:02d}:{departs % 60:02d}", arrival, 100, float(rng.randrange(10, 200)))
+            system.trains[train.train_id] = train
+        system.save_data()
+        system.close()
+        del system
+        # Compile once up front rather than in every worker at the same time
+        TrainBookingSystem(data_file, "json", group_commit=False, shared_timetable=True).close()
+
+        for label, shared in (("objects", False), ("shared", True)):
+            script = (
+                f"import sys\nsys.path.insert(0, {here!r})\n"
+                "from main import TrainBookingSystem\n"
+                f"system = TrainBookingSystem({data_file!r}, 'json', group_commit=False, shared_timetable={shared})\n"
+                "for train in system.trains.values():\n"
+                "    train.train_id, train.name, train.source, train.destination, train.departure_time, train.price\n"
+                "print('ready', flush=True)\n"
+                "sys.stdin.read()\n"
+            )
+            results[label] = {}
+            for workers in worker_counts:
+                processes = [subprocess.Popen([sys.executable, "-c", script], cwd=here, stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+                try:
+                    for process in processes:
+                        process.stdout.readline()
+                    memory = [psutil.Process(process.pid).memory_full_info() for process in processes]
+                finally:
+                    for process in processes:
+                        process.stdin.close()
+                        process.wait()
+                results[label][workers] = {
+                    "uss_mb_per_worker": round(sum(m.uss for m in memory) / workers / 2**20, 1),
+                    "pss_mb_total": round(sum(m.pss for m in memory) / 2**20, 1)
+                }
+    return results
+
+def benchmark_city_autocomplete(num_names: int = 100_000, num_queries: int = 1000, seed: int = 11) -> Dict:
+    """Time autocomplete queries on a synthetic gazetteer"""
+    import random
+    from cities import AutocompleteIndex
+
+    rng = random.Random(seed)
+    syllables = ["ba", "ca", "de", "fé", "go", "hu", "ja", "ka", "lo", "mi", "na", "pé", "ro", "sã", "ta", "vi",
+                 "bre", "cho", "dri", "gla", "kro", "lün", "mar", "nor", "ost", "pra", "sel", "tor"]
+    names = [" ".join("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).title()
+                      for _ in range(rng.randint(1, 2)))
+             for _ in range(num_names)]
+
+    start_time = time.time()
+    index = AutocompleteIndex(names)
+    build_ms = (time.time() - start_time) * 1000
+
+    queries = []
+    for _ in range(num_queries):
+        name = rng.choice(index.names)
+        start = rng.randrange(len(name) // 2 + 1)
+        queries.append(name[start:start + rng.randint(1, 6)])
+
+    timings = []
+    for query in queries:
+        start_time = time.time()
+        index.search(query, limit=10)
+        timings.append((time.time() - start_time) * 1000)
+    timings.sort()
+
+    return {
+        "names": len(index.names),
+        "build_ms": round(build_ms, 2),
+        "median_query_ms": round(timings[len(timings) // 2], 3),
+        "p99_query_ms": round(timings[int(len(timings) * 0.99)], 3)
+    }
+
+def benchmark_cache_manager(num_entries: int = 1_000_000, num_operations: int = 200_000) -> Dict:
+    """Time CacheManager get and set on a small cache and on one holding num_entries"""
+    results = {"entries": num_entries}
+    for label, size in (("small", 10_000), ("full", num_entries)):
+        cache = CacheManager(max_size=size)
+        for i in range(size):
+            cache.set(i, i)
+        
+        start_time = time.perf_counter()
+        for i in range(num_operations):
+            cache.set(size + i, i)  # Each set evicts the least recently used entry
+        set_ns = (time.perf_counter() - start_time) / num_operations * 1e9
+        
+        start_time = time.perf_counter()
+        for i in range(num_operations):
+            cache.get(size + i)
+        get_ns = (time.perf_counter() - start_time) / num_operations * 1e9
+        
+        results[f"{label}_set_ns"] = round(set_ns)
+        results[f"{label}_get_ns"] = round(get_ns)
+    return results
+
+def _journey_date(i: int) -> str:
+    """One of 336 bookable journey dates, spreading benchmark bookings across days"""
+    return (date.today() + timedelta(days=1 + i % 336)).isoformat()
+
+
+def _seed_bookings(system, count: int):
+    """Fill a booking system with count bookings spread over its trains and save once"""
+    import uuid
+    from main import Booking, Passenger
+    trains = list(system.trains)
+    for i in range(count):
+        passenger = Passenger(f"Passenger {i}", 40, "M", "5550100200", f"passenger{i}@example.com")
+        booking = Booking(trains[i % len(trains)], passenger, "2026-01-01 09:00:00",
+                          f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}")
+        booking.booking_id = str(uuid.uuid4())
+        system._apply_booking(booking)
+    system.save_data()
+
+def benchmark_group_commit(num_bookings: int = 2000, threads: int = 32, existing_bookings: int = 5000,
+                           storage_mode: str = "json") -> Dict:
+    """Booking throughput and latency with writes in the request vs a background writer
+
+    `threads` clients book back to back. "direct" writes every change before
+    book_ticket returns; "sync_ack" queues it for the group-commit writer and
+    waits until it is durable; "async_ack" returns as soon as it is queued.
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from main import Passenger, TrainBookingSystem
+
+    def run(data_file, group_commit, wait):
+        system = TrainBookingSystem(data_file, storage_mode, group_commit=False)
+        _seed_bookings(system, existing_bookings)
+        if group_commit:
+            from group_commit import BackgroundWriter
+            BackgroundWriter(system).start()
+        latencies = []
+
+        def book(i):
+            started = time.perf_counter()
+            passenger = Passenger(f"Rider {i}", 30, "F", "5550100100", f"rider{i}@example.com")
+            system.book_ticket("E001", passenger, _journey_date(i))
+            if wait:
+                system.wait_durable()
+            latencies.append(time.perf_counter() - started)
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(book, range(num_bookings)))
+        elapsed = time.perf_counter() - start_time
+        writer = system.writer
+        system.close()
+        latencies.sort()
+        return {
+            "bookings_per_second": round(num_bookings / elapsed, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            "writes": writer.groups_written if writer is not None else num_bookings
+        }
+
+    results = {"bookings": num_bookings, "threads": threads, "existing_bookings": existing_bookings,
+               "storage_mode": storage_mode}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for label, group_commit, wait in (("direct", False, False), ("sync_ack", True, True),
+                                          ("async_ack", True, False)):
+            results[label] = run(os.path.join(temp_dir, f"{label}.json"), group_commit, wait)
+    return results
+
+def benchmark_sharding(num_bookings: int = 400, threads: int = 16, existing_bookings: int = 5000,
+                       shard_counts: tuple = (1, 2, 4, 8), storage_modes: tuple = ("json", "journal")) -> Dict:
+    """Booking throughput with the store in one piece vs split into hash shards
+
+    `threads` clients book back to back across all trains, writing each
+    change before book_ticket returns. With one store every write takes the
+    same lock (and a JSON snapshot rewrites every booking); with shards a
+    write locks, syncs and rewrites only its own shard.
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from main import Passenger, TrainBookingSystem
+
+    def run(data_file, storage_mode, shards):
+        system = TrainBookingSystem(data_file, storage_mode, group_commit=False,
+                                    shard_by="hash" if shards > 1 else "", shards=shards)
+        _seed_bookings(system, existing_bookings)
+        trains = list(system.trains)
+
+        def book(i):
+            passenger = Passenger(f"Rider {i}", 30, "F", "5550100100", f"rider{i}@example.com")
+            system.book_ticket(trains[i % len(trains)], passenger, _journey_date(i))
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(book, range(num_bookings)))
+        elapsed = time.perf_counter() - start_time
+        system.close()
+        return round(num_bookings / elapsed, 1)
+
+    results = {"bookings": num_bookings, "threads": threads, "existing_bookings": existing_bookings}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for storage_mode in storage_modes:
+            results[storage_mode] = {}
+            for shards in shard_counts:
+                data_file = os.path.join(temp_dir, f"{storage_mode}_{shards}.json")
+                results[storage_mode][shards] = {"bookings_per_second": run(data_file, storage_mode, shards)}
+            baseline = results[storage_mode][shard_counts[0]]["bookings_per_second"]
+            for shards in shard_counts:
+                entry = results[storage_mode][shards]
+                entry["speedup"] = round(entry["bookings_per_second"] / baseline, 2) if baseline else None
+    return results
+
+def benchmark_cold_start(num_bookings: int = 1_000_000, storage_mode: str = "json") -> Dict:
+    """Startup time and memory of loading num_bookings, streamed vs parsed in one piece
+
+    Each load runs in a fresh interpreter so its peak RSS is its own. The
+    "whole_document" baseline is the previous loader: json.load the entire
+    snapshot, then build every object while the parsed tree is still held.
+    "final_rss_mb" is what stays resident afterwards, i.e. the object graph.
+    """
+    import gc
+    import subprocess
+    import tempfile
+    from main import TrainBookingSystem
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    streamed = (
+        "from main import TrainBookingSystem\n"
+        "system = TrainBookingSystem(DATA_FILE, STORAGE_MODE, group_commit=False)\n"
+    )
+    whole_document = (
+        "import storage\n"
+        "def iter_parsed(self):\n"
+        "    with open(self.data_file, 'rb') as f:\n"
+        "        if not f.readline().startswith(b'{\"format\":'):\n"
+        "            f.seek(0)\n"
+        "        data = json.load(f)\n"
+        "    for key, value in data.items():\n"
+        "        if key == 'bookings':\n"
+        "            for item in value.items():\n"
+        "                yield 'booking', item\n"
+        "        else:\n"
+        "            yield key, value\n"
+        "storage.JsonStorage.iter_load = iter_parsed\n" + streamed
+    )
+
+    def measure(data_file, code):
+        script = (
+            f"import gc, json, resource, sys, time, psutil\nsys.path.insert(0, {here!r})\n"
+            f"DATA_FILE, STORAGE_MODE = {data_file!r}, {storage_mode!r}\n"
+            "started = time.perf_counter()\n" + code +
+            "elapsed = time.perf_counter() - started\n"
+            "gc.collect()\n"
+            "print(json.dumps([elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+            "                  psutil.Process().memory_info().rss]))\n"
+        )
+        output = subprocess.run([sys.executable, "-c", script], cwd=here, check=True,
+                                capture_output=True, text=True).stdout
+        elapsed, peak_kb, final_bytes = json.loads(output.splitlines()[-1])
+        return {
+            "seconds": round(elapsed, 2),
+            "peak_rss_mb": round(peak_kb / 1024, 1),
+            "final_rss_mb": round(final_bytes / 2**20, 1)
+        }
+
+    results = {"bookings": num_bookings, "storage_mode": storage_mode}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, "train_data.json")
+        system = TrainBookingSystem(data_file, storage_mode, group_commit=False)
+        _seed_bookings(system, num_bookings)
+        system.close()
+        del system
+        gc.collect()
+        results["snapshot_mb"] = round(os.path.getsize(data_file) / 2**20, 1)
+        results["streamed"] = measure(data_file, streamed)
+        results["whole_document"] = measure(data_file, whole_document)
+    return results
+
+def benchmark_web_modes(num_requests: int = 2000, concurrency: int = 32, booking_share: float = 0.2,
+                        existing_bookings: int = 5000, storage_mode: str = "json") -> Dict:
+    """Load-test the web app as a threaded WSGI server and under ASGI with group commit
+
+    Both modes get the same mix of search pages and single-seat bookings from
+    `concurrency` clients sending requests back to back. The apps are called
+    in-process, so only the serving model differs: in the WSGI mode every
+    booking writes its own change before answering, under ASGI bookings wait
+    for the writer task's next group commit.
+    """
+    import asyncio
+    import random
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from app import create_app
+    from asgi import BookingAsgiApp, _build_environ, _call_wsgi
+
+    rng = random.Random(5)
+    requests = []
+    for i in range(num_requests):
+        if rng.random() < booking_share:
+            body = json.dumps({
+                "train_id": "E001",
+                "journey_date": _journey_date(i),
+                "passengers": [{"name": f"Load Test {i}", "age": 30, "gender": "F",
+                                "phone": "5550100100", "email": f"load{i}@example.com"}]
+            }).encode()
+            requests.append(("/api/bookings/batch", body, b"application/json"))
+        else:
+            body = f"source=London&destination=Paris&journey_date={_journey_date(i)}"
+            requests.append(("/search", body.encode(), b"application/x-www-form-urlencoded"))
+
+    def scope(path, body, content_type):
+        return {"type": "http", "method": "POST", "path": path, "query_string": b"", "root_path": "",
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+                "http_version": "1.1", "scheme": "http", "server": ("localhost", 80), "client": ("127.0.0.1", 0)}
+
+    def build_app(data_file):
+        app = create_app(data_file, storage_mode)
+        _seed_bookings(app.extensions["booking_system"], existing_bookings)
+        return app
+
+    def summarize(latencies, errors, elapsed):
+        latencies.sort()
+        return {
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+            "errors": errors
+        }
+
+    def run_wsgi(app):
+        work = iter(requests)
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def client():
+            while True:
+                with lock:
+                    request = next(work, None)
+                if request is None:
+                    return
+                started = time.perf_counter()
+                status, _, _ = _call_wsgi(app, _build_environ(scope(*request), request[1]))
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += status >= 400
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(client)
+        return summarize(latencies, errors[0], time.perf_counter() - start_time)
+
+    async def run_asgi(app):
+        await app.service.start()
+        work = iter(requests)
+        latencies, errors = [], [0]
+
+        async def client():
+            for path, body, content_type in work:
+                sent = []
+
+                async def receive(body=body):
+                    return {"type": "http.request", "body": body, "more_body": False}
+
+                async def send(message):
+                    sent.append(message)
+
+                started = time.perf_counter()
+                await app(scope(path, body, content_type), receive, send)
+                latencies.append(time.perf_counter() - started)
+                errors[0] += sent[0]["status"] >= 400
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+        stats = app.service.get_stats()
+        await app.service.stop()
+        app.executor.shutdown()
+        return dict(summarize(latencies, errors[0], elapsed), average_group_size=stats["average_group_size"])
+
+    results = {"requests": num_requests, "concurrency": concurrency, "booking_share": booking_share,
+               "existing_bookings": existing_bookings, "storage_mode": storage_mode}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results["wsgi_threaded"] = run_wsgi(build_app(os.path.join(temp_dir, "wsgi.json")))
+        asgi_app = BookingAsgiApp(build_app(os.path.join(temp_dir, "asgi.json")))
+        results["asgi_group_commit"] = asyncio.run(run_asgi(asgi_app))
+    return results
+
 if __name__ == "__main__":
     # Example usage
     monitor = PerformanceMonitor()
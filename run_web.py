@@ -35,9 +35,14 @@ def main():
         # Open browser after 3 seconds
         Timer(3.0, open_browser).start()
         
-        # Import and run the Flask app
-        from app import app
-        app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
+        if '--asgi' in sys.argv:
+            # Async mode: Flask views on a thread pool, group-committed writes
+            import uvicorn
+            uvicorn.run("asgi:app", host='0.0.0.0', port=5000)
+        else:
+            # Import and run the Flask app
+            from app import create_app
+            create_app().run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
         
     except KeyboardInterrupt:
         print("\n👋 TrainBook Pro stopped. Thank you!")
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Sharded booking storage for Train Booking System
+Split trains and their bookings into shards by region or by train ID hash,
+each kept in its own files behind its own write lock
+"""
+
+import json
+import os
+import re
+import threading
+import zlib
+from collections.abc import MutableMapping
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cities import get_countries_for_city, get_region_for_country
+from config import BINARY_SUFFIX, SQLITE_SUFFIX
+from storage import STORAGE_BACKENDS, booking_dicts, create_storage
+from utils import atomic_write
+
+SHARD_SCHEMES = ("region", "hash")
+SHARDS_SUFFIX = ".shards"  # Manifest of the shard layout, next to the data file
+SHARDS_FORMAT = "train-booking-shards"
+SHARDS_VERSION = 1
+
+
+def train_region(source: str, destination: str) -> str:
+    """Region a route runs in: the first one its two cities share, else either city's"""
+    source_regions = [get_region_for_country(country) for country in get_countries_for_city(source)]
+    destination_regions = [get_region_for_country(country) for country in get_countries_for_city(destination)]
+    for region in source_regions:
+        if region in destination_regions:
+            return region
+    regions = source_regions or destination_regions
+    return regions[0] if regions else "Other"
+
+
+class ShardRouter:
+    """Which shard each train, and so each of its bookings, belongs to
+
+    With the "hash" scheme a train ID picks one of `count` buckets by CRC-32,
+    the same in every process. With "region" the route's region decides, so
+    trains have to be assigned (from their stations) before their bookings
+    are routed; bookings of a train never assigned go to "other".
+    """
+
+    def __init__(self, scheme: str, count: int = 1):
+        if scheme not in SHARD_SCHEMES:
+            raise ValueError(f"Unknown shard scheme: {scheme}")
+        if scheme == "hash" and count < 1:
+            raise ValueError("A hash shard layout needs at least one shard")
+        self.scheme = scheme
+        self.count = count if scheme == "hash" else None
+        self._shards: Dict[str, str] = {}
+
+    def assign(self, train_id: str, source: str, destination: str) -> str:
+        """Shard of a train, remembering it for routing the train's bookings"""
+        shard = self._shards.get(train_id)
+        if shard is None:
+            if self.scheme == "hash":
+                shard = str(zlib.crc32(train_id.encode('utf-8')) % self.count)
+            else:
+                shard = re.sub(r'[^a-z0-9]+', '-', train_region(source, destination).lower()).strip('-')
+            shard = self._shards[train_id] = shard
+        return shard
+
+    def shard_of(self, train_id: str) -> str:
+        """Shard of an assigned train (any train, with the hash scheme)"""
+        shard = self._shards.get(train_id)
+        if shard is None:
+            return self.assign(train_id, "", "") if self.scheme == "hash" else "other"
+        return shard
+
+    def shard_for_record(self, record: Dict) -> str:
+        """Shard a change record is written to"""
+        if record['op'] == 'train':
+            train = record['train']
+            return self.assign(train['train_id'], train['source'], train['destination'])
+        if record['op'] == 'book_batch':
+            return self.shard_of(record['bookings'][0]['train_id'])
+        if record['op'] == 'book':
+            return self.shard_of(record['booking']['train_id'])
+        return self.shard_of(record['train_id'])
+
+    def layout(self) -> Dict:
+        return {'shard_by': self.scheme, 'shards': self.count}
+
+
+class ShardedBookings(MutableMapping):
+    """Bookings kept in one dict per shard, behind a single mapping
+
+    A booking is stored in its train's shard, so one shard's bookings can
+    be saved without scanning the rest; a lookup by ID tries each shard.
+    """
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+        self.shards: Dict[str, Dict] = {}
+
+    def shard(self, name: str) -> Dict:
+        """The bookings of one shard"""
+        return self.shards.get(name, {})
+
+    def __getitem__(self, booking_id: str):
+        for bookings in self.shards.values():
+            booking = bookings.get(booking_id)
+            if booking is not None:
+                return booking
+        raise KeyError(booking_id)
+
+    def get(self, booking_id: str, default=None):
+        for bookings in self.shards.values():
+            booking = bookings.get(booking_id)
+            if booking is not None:
+                return booking
+        return default
+
+    def __contains__(self, booking_id) -> bool:
+        return any(booking_id in bookings for bookings in self.shards.values())
+
+    def __setitem__(self, booking_id: str, booking):
+        shard = self.router.shard_of(booking.train_id)
+        bookings = self.shards.get(shard)
+        if bookings is None:
+            bookings = self.shards[shard] = {}
+        bookings[booking_id] = booking
+
+    def __delitem__(self, booking_id: str):
+        for bookings in self.shards.values():
+            if booking_id in bookings:
+                del bookings[booking_id]
+                return
+        raise KeyError(booking_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return chain.from_iterable(self.shards.values())
+
+    def __len__(self) -> int:
+        return sum(map(len, self.shards.values()))
+
+    def values(self):
+        return list(chain.from_iterable(bookings.values() for bookings in self.shards.values()))
+
+    def items(self):
+        return list(chain.from_iterable(bookings.items() for bookings in self.shards.values()))
+
+
+class ShardedStorage:
+    """One storage backend per shard, in files named <data file>.shard-<name>
+
+    Each shard is a backend of the given mode with its own write lock, so
+    changes to different shards are written (and fsynced) independently
+    and a snapshot only rewrites the shard that changed. A manifest lists
+    the layout and the shards written under it. Without one the unsharded
+    data file is read, and after a layout change the old shards are read
+    once more; either way needs_compaction() then asks for a full save
+    into the new layout. Shard files the new manifest no longer lists are
+    left on disk but never read.
+    """
+
+    shares_writes = False  # Resharding rewrites whole shards from one process's bookings
+
+    def __init__(self, mode: str, data_file: str, router: ShardRouter):
+        self.mode = mode
+        self.data_file = data_file
+        self.router = router
+        self.manifest_file = os.path.splitext(data_file)[0] + SHARDS_SUFFIX
+        self.appends_records = STORAGE_BACKENDS[mode].appends_records
+        self._backends: Dict[str, object] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+        self._listed = None  # Shards in the manifest, if it has the router's layout
+        self._written = set()  # Shards written to since starting
+
+    def shard_file(self, name: str) -> str:
+        stem, extension = os.path.splitext(self.data_file)
+        return f"{stem}.shard-{name}{extension}"
+
+    def shard(self, name: str):
+        """The backend of a shard to write to"""
+        self._written.add(name)
+        return self._backend(name)
+
+    def _backend(self, name: str):
+        backend = self._backends.get(name)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get(name)
+                if backend is None:
+                    backend = self._backends[name] = create_storage(self.mode, self.shard_file(name))
+                    self._locks[name] = threading.RLock()
+        return backend
+
+    def lock(self, name: str) -> threading.RLock:
+        """Lock serializing writes to one shard"""
+        self.shard(name)
+        return self._locks[name]
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.manifest_file, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        if manifest.get('format') != SHARDS_FORMAT or manifest.get('version') != SHARDS_VERSION:
+            raise ValueError(f"{self.manifest_file} is not a version {SHARDS_VERSION} shard manifest")
+        return manifest
+
+    def write_manifest(self, names: List[str]):
+        """Record the router's layout and the shards that now hold every train and booking"""
+        with self._lock:
+            names = sorted(names)
+            manifest = {'format': SHARDS_FORMAT, 'version': SHARDS_VERSION, **self.router.layout(), 'names': names}
+            atomic_write(self.manifest_file, json.dumps(manifest, indent=2).encode('utf-8'))
+            self._listed = set(names)
+
+    def _unsharded_exists(self) -> bool:
+        stem = os.path.splitext(self.data_file)[0]
+        if self.mode == "sqlite":
+            return os.path.exists(stem + SQLITE_SUFFIX)
+        if self.mode == "binary":
+            return os.path.exists(stem + BINARY_SUFFIX) or os.path.exists(self.data_file)
+        return os.path.exists(self.data_file)
+
+    def iter_load(self) -> Iterator[Tuple[str, object]]:
+        """Every shard's stored state in turn, as the backends stream it
+
+        Each shard yields its own "trains" before its bookings.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            if self._unsharded_exists():
+                source = create_storage(self.mode, self.data_file)
+                try:
+                    yield from source.iter_load()
+                finally:
+                    source.close()
+            return
+
+        if {key: manifest.get(key) for key in self.router.layout()} == self.router.layout():
+            self._listed = set(manifest['names'])
+        for name in manifest['names']:
+            yield from self._backend(name).iter_load()
+
+    def load(self) -> Tuple[Dict, List[Dict]]:
+        """Every shard's trains, bookings and records merged, as a single backend returns them"""
+        data, records = {'trains': {}, 'bookings': {}}, []
+        for key, value in self.iter_load():
+            if key == 'trains':
+                data['trains'].update(value)
+            elif key == 'booking':
+                data['bookings'][value[0]] = value[1]
+            elif key == 'booking_columns':
+                for booking in booking_dicts(*value):
+                    data['bookings'][booking['booking_id']] = booking
+            elif key == 'record':
+                records.append(value)
+        return (data if data['trains'] or data['bookings'] else {}), records
+
+    def needs_compaction(self) -> bool:
+        """Whether a full save is due: the manifest is missing, outdated or lacks a shard written to"""
+        return self._listed is None or not self._written <= self._listed
+
+    def close(self):
+        for backend in self._backends.values():
+            backend.close()
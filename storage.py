@@ -0,0 +1,1056 @@
+#!/usr/bin/env python3
+"""
+Storage backends for Train Booking System
+Persist trains and bookings as a single JSON document, as a snapshot plus
+an append-only journal of booking changes, in an SQLite database or
+as a compact binary snapshot
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import (SQLITE_SUFFIX, JOURNAL_SUFFIX, JOURNAL_FSYNC_BATCH, JOURNAL_FSYNC_INTERVAL,
+                    JOURNAL_COMPACT_THRESHOLD, BACKUP_GENERATIONS, BINARY_SUFFIX, BINARY_COMPRESSION)
+from utils import atomic_file, backup_data, backup_files
+
+SNAPSHOT_FORMAT = "train-booking-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAGIC = b'{"format":'
+SNAPSHOT_HEADER_SIZE = 256  # the header line is padded so it can be written after the body
+SNAPSHOT_CHUNK_SIZE = 1 << 20
+
+
+class CorruptSnapshotError(ValueError):
+    """A snapshot file is truncated, fails its checksum or is not valid JSON"""
+
+
+class _JsonStream:
+    """Incremental reader for a JSON document too large to parse in one piece
+
+    Keeps a window of the text in memory and decodes one value at a time
+    with the stdlib decoder, reading more whenever a value runs past the
+    window.
+    """
+
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    _colon = re.compile(r'[ \t\n\r]*:[ \t\n\r]*')
+    _separator = re.compile(r'[ \t\n\r]*([,}])')
+    _number_chars = frozenset('0123456789.eE+-')
+
+    def __init__(self, f, chunk_size: int = SNAPSHOT_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> bool:
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it ('' at the end)"""
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ''
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} but found {found!r}")
+        self.pos += 1
+
+    def _may_go_on(self, value, end: int) -> bool:
+        """Whether a value decoded up to end could continue past the window
+
+        Only a number can: the window may stop after "1" of "12", or after
+        "1." of "1.5", where the decoder returns 1 and leaves the rest.
+        """
+        if end == len(self.buffer):
+            return True
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and self.buffer[end] in self._number_chars)
+
+    def value(self):
+        """Decode the next complete value"""
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                if self.eof or not self._may_go_on(value, end):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # The value runs past the window (or a number may go on): read more and retry
+            self._fill(size)
+            size *= 2
+
+    def keys(self) -> Iterator[str]:
+        """Step through an object, yielding each key; the caller reads its value before the next"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected an object key but found {key!r}")
+            self._expect(':')
+            yield key
+            separator = self._peek()
+            self.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"expected ',' or '}}' but found {separator!r}")
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        """Step through an object, yielding (key, value) pairs"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            entry = self._entry_in_window()
+            if entry is None:
+                # The entry runs past the window (or is malformed): go step by step
+                key = self.value()
+                if not isinstance(key, str):
+                    raise ValueError(f"expected an object key but found {key!r}")
+                self._expect(':')
+                value = self.value()
+                separator = self._peek()
+                self.pos += 1
+            else:
+                key, value, separator = entry
+            yield key, value
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"expected ',' or '}}' but found {separator!r}")
+            self._peek()
+
+    def _entry_in_window(self) -> Optional[Tuple[str, object, str]]:
+        """Decode `key: value` plus the separator after it if all of it is in the window"""
+        buffer = self.buffer
+        try:
+            key, end = self._decoder.raw_decode(buffer, self.pos)
+            match = self._colon.match(buffer, end)
+            if match is None or not isinstance(key, str):
+                return None
+            value, end = self._decoder.raw_decode(buffer, match.end())
+        except ValueError:
+            return None
+        if self._may_go_on(value, end):
+            return None
+        match = self._separator.match(buffer, end)
+        if match is None:
+            return None
+        self.pos = match.end()
+        return key, value, match.group(1)
+
+    def end(self):
+        if self._peek():
+            raise ValueError("extra data after the document")
+
+
+def write_snapshot(f, data: Dict, generation: int, json_options: Dict):
+    """Stream data into a binary file as a snapshot
+
+    The body is written record by record, bookings one at a time, and the
+    fixed-width header with its length and checksum is filled in last.
+    """
+    f.write(b' ' * (SNAPSHOT_HEADER_SIZE - 1) + b'\n')
+    digest = hashlib.sha256()
+    length = 0
+    pending = []
+
+    def flush():
+        nonlocal length
+        chunk = ''.join(pending).encode('utf-8')
+        pending.clear()
+        digest.update(chunk)
+        length += len(chunk)
+        f.write(chunk)
+
+    pending.append('{')
+    for index, (key, value) in enumerate(data.items()):
+        pending.append(('\n' if index == 0 else ',\n') + json.dumps(key) + ': ')
+        if key != 'bookings':
+            pending.append(json.dumps(value, **json_options))
+            continue
+        pending.append('{')
+        for number, (booking_id, booking) in enumerate(value.items()):
+            pending.append(('\n' if number == 0 else ',\n') + json.dumps(booking_id) + ': ' +
+                           json.dumps(booking, **json_options))
+            if len(pending) >= 1024:
+                flush()
+        pending.append('\n}')
+    pending.append('\n}\n')
+    flush()
+
+    header = json.dumps({
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "generation": generation,
+        "length": length,
+        "sha256": digest.hexdigest()
+    }, separators=(',', ':')).encode('utf-8')
+    f.seek(0)
+    f.write(header.ljust(SNAPSHOT_HEADER_SIZE - 1) + b'\n')
+
+
+def read_snapshot_header(f) -> Optional[Dict]:
+    """Parse the header at the start of a binary file, leaving f at the body
+
+    Returns None for files written before snapshots had a header, which are
+    plain JSON from the first byte.
+    """
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        f.seek(0)
+        return None
+    f.seek(0)
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        raise CorruptSnapshotError("unreadable snapshot header")
+    if header.get("format") != SNAPSHOT_FORMAT:
+        f.seek(0)
+        return None
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise CorruptSnapshotError(f"unsupported snapshot version {header.get('version')}")
+    return header
+
+
+def verify_snapshot(path: str) -> int:
+    """Check a snapshot's length and checksum and return its generation (0 without a header)"""
+    with open(path, 'rb') as f:
+        header = read_snapshot_header(f)
+        if header is None:
+            return 0
+        length = os.fstat(f.fileno()).st_size - f.tell()
+        if length != header["length"]:
+            raise CorruptSnapshotError(f"truncated: {length} of {header['length']} bytes")
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(SNAPSHOT_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        if digest.hexdigest() != header["sha256"]:
+            raise CorruptSnapshotError("checksum mismatch")
+        return header["generation"]
+
+
+def iter_snapshot(path: str) -> Iterator[Tuple[str, object]]:
+    """Stream a snapshot's top-level entries as (key, value) pairs
+
+    Bookings come one at a time as ("booking", (booking_id, data)), so the
+    whole document is never held in memory.
+    """
+    with open(path, 'rb') as raw:
+        read_snapshot_header(raw)
+        stream = _JsonStream(io.TextIOWrapper(raw, encoding='utf-8'))
+        try:
+            for key in stream.keys():
+                if key == 'bookings':
+                    for item in stream.items():
+                        yield 'booking', item
+                else:
+                    yield key, stream.value()
+            stream.end()
+        except ValueError as e:
+            raise CorruptSnapshotError(f"{path} is not valid JSON: {e}")
+
+
+# Compact binary snapshots: a fixed header, then length-prefixed blocks holding
+# the trains as JSON and the bookings and passengers column by column. Columns
+# of UUIDs are stored as 16 raw bytes each, repetitive columns (dates, train
+# IDs, statuses) as a table of distinct values plus a 32-bit index per row,
+# anything else as a JSON list; all but the UUIDs are zlib-compressed.
+BINARY_MAGIC = b"TBSNAP\r\n"  # the CR LF catches files mangled by text-mode transfers
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<8sHQQ32s")  # magic, version, generation, body length, body SHA-256
+_BLOCK_LENGTH = struct.Struct("<Q")
+BOOKING_COLUMNS = ('booking_id', 'train_id', 'booking_date', 'journey_date', 'status')
+PASSENGER_COLUMNS = ('passenger_id', 'name', 'age', 'gender', 'phone', 'email')
+_PLAIN, _DICTIONARY, _UUIDS = range(3)
+# Where the 32 hex digits of a canonical UUID sit among its 36 characters
+_UUID_DASHES = (8, 13, 18, 23)
+_UUID_DIGITS = [i for i in range(36) if i not in _UUID_DASHES]
+
+
+def _pack_uuids(values: List) -> Optional[bytes]:
+    """16 bytes per value if every value is a lowercase canonical UUID string, else None"""
+    count = len(values)
+    if set(map(len, values)) != {36}:
+        return None
+    text = ''.join(values)
+    if not text.isascii():
+        return None
+    raw = text.encode('ascii')
+    if any(raw[i::36] != b'-' * count for i in _UUID_DASHES):
+        return None
+    digits = bytearray(32 * count)
+    for j, i in enumerate(_UUID_DIGITS):
+        digits[j::32] = raw[i::36]
+    digits = digits.decode('ascii')
+    try:
+        packed = bytes.fromhex(digits)
+    except ValueError:
+        return None
+    # fromhex also accepts upper case, which would not come back the same
+    return packed if packed.hex() == digits else None
+
+
+def _unpack_uuids(packed: bytes) -> List[str]:
+    count = len(packed) // 16
+    digits = packed.hex().encode('ascii')
+    text = bytearray(b'-' * (36 * count))
+    for j, i in enumerate(_UUID_DIGITS):
+        text[i::36] = digits[j::32]
+    text = text.decode('ascii')
+    return [text[i:i + 36] for i in range(0, len(text), 36)]
+
+
+def _index_bytes(indexes: List[int]) -> bytes:
+    packed = array('I', indexes)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _index_array(data: bytes) -> array:
+    indexes = array('I')
+    indexes.frombytes(data)
+    if sys.byteorder == 'big':
+        indexes.byteswap()
+    return indexes
+
+
+def _block(data: bytes) -> bytes:
+    return _BLOCK_LENGTH.pack(len(data)) + data
+
+
+def _compressed_block(data: bytes) -> bytes:
+    return _block(zlib.compress(data, BINARY_COMPRESSION))
+
+
+def _pack_column(values: List) -> bytes:
+    """Encode one column as UUIDs, distinct values plus indexes, or a plain JSON list"""
+    types = set(map(type, values))
+    if types == {str}:
+        packed = _pack_uuids(values)
+        if packed is not None:
+            # Random bytes: compressing them would only cost time
+            return bytes([_UUIDS]) + _block(packed)
+    # Only single-type columns: in a dict 1, 1.0 and True would be one value.
+    # A sample decides whether the column repeats enough to be worth it.
+    sample = values[::max(1, len(values) // 1000)]
+    if (types == {str} or types == {int}) and len(set(sample)) <= len(sample) // 2:
+        distinct = dict.fromkeys(values)
+        positions = dict(zip(distinct, range(len(distinct))))
+        return (bytes([_DICTIONARY]) + _compressed_block(json.dumps(list(distinct)).encode('utf-8')) +
+                _compressed_block(_index_bytes(list(map(positions.__getitem__, values)))))
+    return bytes([_PLAIN]) + _compressed_block(json.dumps(values).encode('utf-8'))
+
+
+class _BlockReader:
+    """Cursor over the body of a binary snapshot"""
+
+    def __init__(self, body: bytes):
+        self.body = memoryview(body)
+        self.pos = 0
+
+    def byte(self) -> int:
+        value = self.body[self.pos]
+        self.pos += 1
+        return value
+
+    def block(self) -> memoryview:
+        (length,) = _BLOCK_LENGTH.unpack_from(self.body, self.pos)
+        start = self.pos + _BLOCK_LENGTH.size
+        self.pos = start + length
+        if self.pos > len(self.body):
+            raise ValueError("block runs past the end of the snapshot")
+        return self.body[start:self.pos]
+
+    def compressed_block(self) -> bytes:
+        return zlib.decompress(self.block())
+
+    def column(self, count: int) -> List:
+        kind = self.byte()
+        if kind == _UUIDS:
+            values = _unpack_uuids(self.block())
+        elif kind == _DICTIONARY:
+            distinct = json.loads(self.compressed_block())
+            values = list(map(distinct.__getitem__, _index_array(self.compressed_block())))
+        elif kind == _PLAIN:
+            values = json.loads(self.compressed_block())
+        else:
+            raise ValueError(f"unknown column encoding {kind}")
+        if len(values) != count:
+            raise ValueError(f"column holds {len(values)} values instead of {count}")
+        return values
+
+
+def _booking_columns(bookings) -> Tuple[Dict[str, List], List[int], Dict[str, List]]:
+    """Split booking dicts into booking columns, passenger rows and passenger columns"""
+    columns = {name: [] for name in BOOKING_COLUMNS}
+    rows = {}
+    passenger_rows = []
+    for booking in bookings:
+        for name in BOOKING_COLUMNS:
+            columns[name].append(booking[name])
+        passenger = booking['passenger']
+        key = tuple(passenger[name] for name in PASSENGER_COLUMNS)
+        passenger_rows.append(rows.setdefault(key, len(rows)))
+    passengers = list(zip(*rows)) or [()] * len(PASSENGER_COLUMNS)
+    return columns, passenger_rows, dict(zip(PASSENGER_COLUMNS, map(list, passengers)))
+
+
+def write_binary_snapshot(f, data: Dict, generation: int):
+    """Write data to a binary file as a compact snapshot
+
+    data['bookings'] may provide to_columns(booking_columns, passenger_columns)
+    returning the same split as _booking_columns, read straight off booking
+    objects instead of going through one dict per booking. Train booking
+    lists are left out: they are rebuilt from the bookings on load.
+    """
+    bookings = data.get('bookings', {})
+    to_columns = getattr(bookings, 'to_columns', None)
+    if to_columns is not None:
+        columns, passenger_rows, passengers = to_columns(BOOKING_COLUMNS, PASSENGER_COLUMNS)
+    else:
+        columns, passenger_rows, passengers = _booking_columns(bookings.values())
+
+    meta = {key: value for key, value in data.items() if key != 'bookings'}
+    if 'trains' in meta:
+        meta['trains'] = {train_id: {key: value for key, value in train.items() if key != 'bookings'}
+                          for train_id, train in meta['trains'].items()}
+    meta['counts'] = [len(passenger_rows), len(passengers['passenger_id'])]
+
+    digest = hashlib.sha256()
+    length = 0
+    f.write(b'\0' * _BINARY_HEADER.size)
+
+    def emit(chunk: bytes):
+        nonlocal length
+        digest.update(chunk)
+        length += len(chunk)
+        f.write(chunk)
+
+    emit(_compressed_block(json.dumps(meta, separators=(',', ':')).encode('utf-8')))
+    for name in BOOKING_COLUMNS:
+        emit(_pack_column(columns[name]))
+    emit(_compressed_block(_index_bytes(passenger_rows)))
+    for name in PASSENGER_COLUMNS:
+        emit(_pack_column(passengers[name]))
+
+    f.seek(0)
+    f.write(_BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, generation, length, digest.digest()))
+
+
+def read_binary_header(f) -> Tuple[int, int, bytes]:
+    """(generation, body length, SHA-256) from the header, leaving f at the body"""
+    header = f.read(_BINARY_HEADER.size)
+    if len(header) < _BINARY_HEADER.size:
+        raise CorruptSnapshotError("truncated header")
+    magic, version, generation, length, checksum = _BINARY_HEADER.unpack(header)
+    if magic != BINARY_MAGIC:
+        raise CorruptSnapshotError("not a binary snapshot")
+    if version != BINARY_VERSION:
+        raise CorruptSnapshotError(f"unsupported binary snapshot version {version}")
+    return generation, length, checksum
+
+
+def verify_binary_snapshot(path: str) -> int:
+    """Check a binary snapshot's length and checksum and return its generation"""
+    with open(path, 'rb') as f:
+        generation, length, checksum = read_binary_header(f)
+        body = f.read()
+    if len(body) != length:
+        raise CorruptSnapshotError(f"truncated: {len(body)} of {length} bytes")
+    if hashlib.sha256(body).digest() != checksum:
+        raise CorruptSnapshotError("checksum mismatch")
+    return generation
+
+
+def iter_binary_snapshot(path: str) -> Iterator[Tuple[str, object]]:
+    """Read a binary snapshot as (key, value) pairs like iter_snapshot
+
+    Instead of one ("booking", ...) pair per booking, all bookings come as
+    a single ("booking_columns", (booking columns, passenger rows, passenger
+    columns)) pair; booking_dicts turns it into booking dicts.
+    """
+    with open(path, 'rb') as f:
+        read_binary_header(f)
+        body = f.read()
+    try:
+        reader = _BlockReader(body)
+        meta = json.loads(reader.compressed_block())
+        booking_count, passenger_count = meta.pop('counts')
+        columns = [reader.column(booking_count) for _ in BOOKING_COLUMNS]
+        passenger_rows = _index_array(reader.compressed_block())
+        passenger_columns = [reader.column(passenger_count) for _ in PASSENGER_COLUMNS]
+        if len(passenger_rows) != booking_count:
+            raise ValueError(f"{len(passenger_rows)} passenger references for {booking_count} bookings")
+        if passenger_rows and max(passenger_rows) >= passenger_count:
+            raise ValueError("passenger reference out of range")
+    except (ValueError, IndexError, KeyError, TypeError, zlib.error) as e:
+        raise CorruptSnapshotError(f"{path} is not a valid binary snapshot: {e}")
+
+    booking_ids, train_ids, _, _, statuses = columns
+    trains = meta.get('trains', {})
+    for train in trains.values():
+        train['bookings'] = []
+    for booking_id, train_id, status in zip(booking_ids, train_ids, statuses):
+        if status == "Confirmed" and train_id in trains:
+            trains[train_id]['bookings'].append(booking_id)
+    for key, value in meta.items():
+        yield key, value
+    yield 'booking_columns', (dict(zip(BOOKING_COLUMNS, columns)), passenger_rows,
+                              dict(zip(PASSENGER_COLUMNS, passenger_columns)))
+
+
+def booking_dicts(columns: Dict[str, List], passenger_rows,
+                  passenger_columns: Dict[str, List]) -> Iterator[Dict]:
+    """Booking dicts from the columns of a binary snapshot"""
+    passengers = [dict(zip(PASSENGER_COLUMNS, row))
+                  for row in zip(*[passenger_columns[name] for name in PASSENGER_COLUMNS])]
+    for row, passenger in zip(zip(*[columns[name] for name in BOOKING_COLUMNS]), passenger_rows):
+        booking = dict(zip(BOOKING_COLUMNS, row))
+        booking['passenger'] = passengers[passenger]
+        yield booking
+
+
+class JsonStorage:
+    """Keep everything in one JSON file that is rewritten on every save
+
+    Snapshots are written to a temp file, fsynced and renamed over the data
+    file, so a crash or a concurrent reader never sees half a file. Each
+    carries a generation number and a SHA-256 of its body; the previous
+    BACKUP_GENERATIONS snapshots are kept as rotating backups, and loading
+    falls back to the newest one that verifies.
+    """
+
+    # Backends that can persist a single change without a full rewrite set this
+    appends_records = False
+    # Backends that several processes can write at once, each change merged in, set this
+    shares_writes = False
+
+    # Keyword arguments for json.dumps of the snapshot body
+    json_options = {"indent": 2}
+
+    def __init__(self, data_file: str, backups: int = BACKUP_GENERATIONS):
+        self.data_file = data_file
+        self.backups = backups
+        self.generation = 0
+
+    def load(self) -> Tuple[Dict, List[Dict]]:
+        """Return the stored snapshot and the change records written after it"""
+        data, records = {}, []
+        for key, value in self.iter_load():
+            if key == 'booking':
+                data.setdefault('bookings', {})[value[0]] = value[1]
+            elif key == 'booking_columns':
+                bookings = data.setdefault('bookings', {})
+                for booking in booking_dicts(*value):
+                    bookings[booking['booking_id']] = booking
+            elif key == 'record':
+                records.append(value)
+            else:
+                data[key] = value
+        return data, records
+
+    def iter_load(self) -> Iterator[Tuple[str, object]]:
+        """Stream the stored state as (key, value) pairs
+
+        Top-level snapshot entries come as they are, each booking as
+        ("booking", (booking_id, data)) (or all of them at once as
+        "booking_columns", see iter_binary_snapshot) and each later change
+        record as ("record", record), so callers can build objects without
+        the whole parsed snapshot in memory.
+        """
+        path = self._find_snapshot()
+        if path is not None:
+            yield from self._iter_snapshot(path)
+
+    def _find_snapshot(self) -> Optional[str]:
+        """Path of the newest snapshot that verifies, setting generation from it"""
+        damaged = []
+        unreadable = False
+        for path in [self.data_file] + backup_files(self.data_file):
+            try:
+                if os.path.getsize(path) == 0:
+                    # An empty file (e.g. just created) holds no data yet
+                    damaged.append(f"{path} (empty)")
+                    continue
+                self.generation = self._verify_snapshot(path)
+            except FileNotFoundError:
+                continue
+            except CorruptSnapshotError as e:
+                damaged.append(f"{path} ({e})")
+                unreadable = True
+                continue
+            if damaged:
+                print(f"Warning: damaged snapshot {'; '.join(damaged)}. "
+                      f"Recovered generation {self.generation} from {path}.")
+            return path
+
+        if unreadable:
+            # Never start empty over data we failed to read: that would overwrite it
+            raise CorruptSnapshotError(f"No readable snapshot: {'; '.join(damaged)}")
+        return None
+
+    def save_snapshot(self, data: Dict):
+        """Write the full system state as the next snapshot generation
+
+        data may be any mapping; its 'bookings' entry is read one booking at
+        a time, so it can convert bookings to dicts lazily.
+        """
+        self._write_snapshot(data)
+
+    def _write_snapshot(self, data: Dict):
+        with atomic_file(self.data_file) as f:
+            self._encode_snapshot(f, data, self.generation + 1)
+            if self.backups > 0 and os.path.exists(self.data_file):
+                # Snapshots are only ever replaced by rename, so a hard link is a safe backup
+                backup_data(self.data_file, keep=self.backups, link=True)
+        self.generation += 1
+
+    # The snapshot encoding, replaced by subclasses that store another format
+    def _verify_snapshot(self, path: str) -> int:
+        return verify_snapshot(path)
+
+    def _iter_snapshot(self, path: str) -> Iterator[Tuple[str, object]]:
+        return iter_snapshot(path)
+
+    def _encode_snapshot(self, f, data: Dict, generation: int):
+        write_snapshot(f, data, generation, self.json_options)
+
+    def append(self, record: Dict):
+        """Persist a single change record"""
+        raise NotImplementedError("JsonStorage only supports full snapshots")
+
+    def append_many(self, records: List[Dict]):
+        """Persist a group of change records with one durable write"""
+        for record in records:
+            self.append(record)
+
+    def needs_compaction(self) -> bool:
+        """Whether the caller should write a fresh snapshot"""
+        return False
+
+    def close(self):
+        """Release any open file handles"""
+
+
+class JournalStorage(JsonStorage):
+    """Snapshot file plus an append-only write-ahead journal
+
+    Every booking, group booking or cancellation becomes one JSON line in the
+    journal, so a write costs the same no matter how many bookings exist. Records carry a
+    sequence number and the snapshot remembers the last one it contains, which
+    makes replay safe even if we crash between writing a snapshot and
+    truncating the journal. A record is fsynced within fsync_interval even if
+    no other write follows it: a timer syncs whatever the last batch left.
+    """
+
+    appends_records = True
+    json_options = {"separators": (',', ':')}
+
+    def __init__(self, data_file: str, fsync_batch: int = JOURNAL_FSYNC_BATCH,
+                 fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+                 compact_threshold: int = JOURNAL_COMPACT_THRESHOLD):
+        super().__init__(data_file)
+        self.journal_file = data_file + JOURNAL_SUFFIX
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.records_since_snapshot = 0
+        self._journal = None
+        self._seq = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+        self._lock = threading.RLock()  # The sync timer runs on its own thread
+
+    def iter_load(self) -> Iterator[Tuple[str, object]]:
+        """Stream the snapshot, then the journal records that are newer than it"""
+        snapshot_seq = 0
+        for key, value in super().iter_load():
+            if key == 'journal_seq':
+                snapshot_seq = value
+            yield key, value
+        for record in self._read_journal(snapshot_seq):
+            yield 'record', record
+
+    def _read_journal(self, snapshot_seq: int) -> List[Dict]:
+        """Journal records after snapshot_seq, dropping a torn tail"""
+        self._seq = snapshot_seq
+        records = []
+
+        if os.path.exists(self.journal_file):
+            valid_bytes = 0
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn final line from a crash mid-append
+                    valid_bytes += len(line)
+                    if record['seq'] <= snapshot_seq:
+                        continue  # Already folded into the snapshot
+                    records.append(record)
+                    self._seq = record['seq']
+
+            # Drop a torn tail so new records are not appended after garbage
+            if valid_bytes < os.path.getsize(self.journal_file):
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(valid_bytes)
+
+        if records and records[0]['seq'] != snapshot_seq + 1:
+            # Only after falling back to an older snapshot: the journal was
+            # already cut at the newer one
+            print(f"Warning: changes {snapshot_seq + 1} to {records[0]['seq'] - 1} are missing "
+                  f"between the snapshot and {self.journal_file}.")
+        self.records_since_snapshot = len(records)
+        return records
+
+    def append(self, record: Dict):
+        """Append one change record, fsyncing in batches"""
+        with self._lock:
+            self._write([record])
+            elapsed = time.monotonic() - self._last_sync
+            if self._unsynced >= self.fsync_batch or elapsed >= self.fsync_interval:
+                self.sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval - elapsed, self._sync_due)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def append_many(self, records: List[Dict]):
+        """Append a group of change records and fsync once for all of them"""
+        with self._lock:
+            self._write(records)
+            self.sync()
+
+    def _sync_due(self):
+        """Timer callback: fsync records still waiting when the interval is up"""
+        with self._lock:
+            self._timer = None
+            self.sync()
+
+    def _write(self, records: List[Dict]):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+
+        lines = []
+        for record in records:
+            self._seq += 1
+            lines.append(json.dumps(dict(record, seq=self._seq), separators=(',', ':')) + '\n')
+        self._journal.write(''.join(lines))
+        self._journal.flush()
+        self._unsynced += len(records)
+        self.records_since_snapshot += len(records)
+
+    def sync(self):
+        """Force journal records written so far to disk"""
+        with self._lock:
+            if self._journal is not None and self._unsynced:
+                os.fsync(self._journal.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def save_snapshot(self, data: Dict):
+        """Fold the journal into a new snapshot and start an empty journal"""
+        with self._lock:
+            self._write_snapshot(dict(data, journal_seq=self._seq))
+
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            open(self.journal_file, 'w').close()
+            self.records_since_snapshot = 0
+            self._unsynced = 0
+
+    def needs_compaction(self) -> bool:
+        return self.records_since_snapshot >= self.compact_threshold
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._journal is not None:
+                self.sync()
+                self._journal.close()
+                self._journal = None
+
+
+class BinaryStorage(JsonStorage):
+    """Compact binary snapshots, rewritten on every save like JsonStorage
+
+    The snapshot replaces the data file's extension with BINARY_SUFFIX and
+    gets the same atomic writes, generations and backups as the JSON file.
+    Until the first one is written, an existing JSON data file is read
+    instead, so switching modes keeps the data.
+    """
+
+    def __init__(self, data_file: str, backups: int = BACKUP_GENERATIONS):
+        super().__init__(os.path.splitext(data_file)[0] + BINARY_SUFFIX, backups)
+        self.json_file = data_file
+
+    def iter_load(self) -> Iterator[Tuple[str, object]]:
+        path = self._find_snapshot()
+        if path is not None:
+            yield from self._iter_snapshot(path)
+        elif self.json_file != self.data_file and os.path.exists(self.json_file):
+            yield from JsonStorage(self.json_file).iter_load()
+
+    def _verify_snapshot(self, path: str) -> int:
+        return verify_binary_snapshot(path)
+
+    def _iter_snapshot(self, path: str) -> Iterator[Tuple[str, object]]:
+        return iter_binary_snapshot(path)
+
+    def _encode_snapshot(self, f, data: Dict, generation: int):
+        write_binary_snapshot(f, data, generation)
+
+
+class SQLiteStorage(JsonStorage):
+    """Trains, passengers and bookings in SQLite tables
+
+    Each change is a small transaction keyed by primary key, so a write costs
+    the same no matter how many bookings exist, and several processes can
+    write to the same database.
+    """
+
+    appends_records = True
+    shares_writes = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trains (
+            train_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            departure_time TEXT NOT NULL,
+            arrival_time TEXT NOT NULL,
+            total_seats INTEGER NOT NULL,
+            available_seats INTEGER NOT NULL,
+            price REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS passengers (
+            passenger_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            gender TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            email TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS bookings (
+            booking_id TEXT PRIMARY KEY,
+            train_id TEXT NOT NULL,
+            passenger_id TEXT NOT NULL REFERENCES passengers(passenger_id),
+            booking_date TEXT NOT NULL,
+            journey_date TEXT NOT NULL,
+            status TEXT NOT NULL
+        );
+    """
+
+    TRAIN_COLUMNS = ('train_id', 'name', 'source', 'destination', 'departure_time',
+                     'arrival_time', 'total_seats', 'available_seats', 'price')
+    PASSENGER_COLUMNS = ('passenger_id', 'name', 'age', 'gender', 'phone', 'email')
+
+    def __init__(self, data_file: str):
+        super().__init__(data_file)
+        self.db_file = os.path.splitext(data_file)[0] + SQLITE_SUFFIX
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def load(self) -> Tuple[Dict, List[Dict]]:
+        """Rebuild the JSON-shaped snapshot from the tables"""
+        with self._lock:
+            trains = {}
+            for row in self._conn.execute(f"SELECT {', '.join(self.TRAIN_COLUMNS)} FROM trains"):
+                train = dict(zip(self.TRAIN_COLUMNS, row))
+                train['bookings'] = []
+                trains[train['train_id']] = train
+
+            bookings = {}
+            rows = self._conn.execute(
+                "SELECT b.booking_id, b.train_id, b.booking_date, b.journey_date, b.status, "
+                "p.passenger_id, p.name, p.age, p.gender, p.phone, p.email "
+                "FROM bookings b JOIN passengers p ON p.passenger_id = b.passenger_id "
+                "ORDER BY b.rowid"
+            )
+            for row in rows:
+                booking_id, train_id, booking_date, journey_date, status = row[:5]
+                bookings[booking_id] = {
+                    'booking_id': booking_id,
+                    'train_id': train_id,
+                    'passenger': dict(zip(self.PASSENGER_COLUMNS, row[5:])),
+                    'booking_date': booking_date,
+                    'journey_date': journey_date,
+                    'status': status
+                }
+                if status == "Confirmed" and train_id in trains:
+                    trains[train_id]['bookings'].append(booking_id)
+
+        if not trains and not bookings:
+            return {}, []
+        return {'trains': trains, 'bookings': bookings}, []
+
+    def iter_load(self) -> Iterator[Tuple[str, object]]:
+        """The tables as load() returns them, in the streamed form"""
+        data, _ = self.load()
+        for key, value in data.items():
+            if key == 'bookings':
+                for item in value.items():
+                    yield 'booking', item
+            else:
+                yield key, value
+
+    def save_snapshot(self, data: Dict):
+        """Replace the stored state with a full snapshot in one transaction"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bookings")
+            self._conn.execute("DELETE FROM passengers")
+            self._conn.execute("DELETE FROM trains")
+            for train in data.get('trains', {}).values():
+                self._insert_train(train)
+            for booking in data.get('bookings', {}).values():
+                self._insert_booking(booking)
+
+    def append(self, record: Dict):
+        """Apply one train, booking or cancellation change as a single transaction"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict]):
+        """Apply a group of changes in one transaction"""
+        with self._lock, self._conn:
+            for record in records:
+                self._apply(record)
+
+    def _apply(self, record: Dict):
+        if record['op'] == 'train':
+            self._insert_train(record['train'])
+        elif record['op'] == 'book':
+            # Per-date seat counts are derived from bookings on load
+            self._insert_booking(record['booking'])
+        elif record['op'] == 'book_batch':
+            for booking in record['bookings']:
+                self._insert_booking(booking)
+        elif record['op'] == 'cancel':
+            self._conn.execute(
+                "UPDATE bookings SET status = 'Cancelled' WHERE booking_id = ? AND status = 'Confirmed'",
+                (record['booking_id'],)
+            )
+
+    def claim_cancellation(self, booking_id: str) -> Optional[bool]:
+        """Cancel a stored booking only if it is still confirmed, as one step across processes
+
+        True if this call cancelled it, False if another writer already had,
+        None if the booking isn't stored yet.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE bookings SET status = 'Cancelled' WHERE booking_id = ? AND status = 'Confirmed'",
+                (booking_id,)
+            )
+            if cursor.rowcount == 1:
+                return True
+            stored = self._conn.execute("SELECT 1 FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+            return False if stored else None
+
+    def _insert_train(self, train: Dict):
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO trains VALUES ({', '.join('?' * len(self.TRAIN_COLUMNS))})",
+            [train[column] for column in self.TRAIN_COLUMNS]
+        )
+
+    def _insert_booking(self, booking: Dict):
+        passenger = booking['passenger']
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO passengers VALUES ({', '.join('?' * len(self.PASSENGER_COLUMNS))})",
+            [passenger[column] for column in self.PASSENGER_COLUMNS]
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO bookings VALUES (?, ?, ?, ?, ?, ?)",
+            (booking['booking_id'], booking['train_id'], passenger['passenger_id'],
+             booking['booking_date'], booking['journey_date'], booking['status'])
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "sqlite": SQLiteStorage,
+    "binary": BinaryStorage,
+}
+
+
+def create_storage(mode: str, data_file: str):
+    """Create the storage backend for the given mode"""
+    if mode not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage mode: {mode}")
+    return STORAGE_BACKENDS[mode](data_file)
+
+
+def migrate_json_to_sqlite(json_file: str, db_file: str = None) -> Dict:
+    """One-shot copy of a train_data.json file into a SQLite database"""
+    source = JournalStorage(json_file)
+    data, records = source.load()
+    if records:
+        raise ValueError(f"{source.journal_file} has unapplied records; compact it before migrating")
+
+    target = SQLiteStorage(db_file or json_file)
+    try:
+        target.save_snapshot(data)
+    finally:
+        target.close()
+
+    return {
+        "database": target.db_file,
+        "trains": len(data.get('trains', {})),
+        "bookings": len(data.get('bookings', {}))
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python storage.py <train_data.json> [train_data.db]")
+        sys.exit(1)
+
+    summary = migrate_json_to_sqlite(*sys.argv[1:])
+    print(f"✅ Migrated {summary['trains']} trains and {summary['bookings']} bookings "
+          f"into {summary['database']}")
@@ -6,9 +6,35 @@ Test suite for Train Booking System
 import unittest
 import json
 import os
+import shutil
+import subprocess
+import asyncio
+import io
+import sys
 import tempfile
-from datetime import datetime
+import threading
+from unittest import mock
+from importlib.util import find_spec
+from datetime import datetime, timedelta
 from main import Train, Passenger, Booking, TrainBookingSystem
+from analytics import BookingAnalytics
+from async_booking import AsyncBookingService
+from cities import (AutocompleteIndex, annotate_routes, get_countries_for_city, get_country_for_city,
+                    get_region_for_country, search_cities, search_cities_in_country, search_countries)
+from columnar import ColumnarBookingSnapshot, np
+from config import MAX_BOOKING_ADVANCE_DAYS
+from enhanced_features import EnhancedTrainBookingSystem
+from group_commit import BackgroundWriter
+from inventory import SeatInventory, journey_day
+from journey_planner import JourneyPlanner
+from performance import CacheManager
+from storage import BinaryStorage, CorruptSnapshotError, JournalStorage, _JsonStream, migrate_json_to_sqlite
+from utils import backup_data, backup_files, restore_data
+
+
+def days_ahead(days: int) -> str:
+    """A journey date the given number of days from today, inside the booking window"""
+    return (datetime.now() + timedelta(days=days)).date().isoformat()
 
 class TestTrainBookingSystem(unittest.TestCase):
     
@@ -21,9 +47,10 @@ class TestTrainBookingSystem(unittest.TestCase):
     
     def tearDown(self):
         """Clean up after each test method."""
-        # Remove the temporary file
-        if os.path.exists(self.test_file.name):
-            os.unlink(self.test_file.name)
+        # Remove the temporary file and its snapshot backups
+        for path in [self.test_file.name] + backup_files(self.test_file.name):
+            if os.path.exists(path):
+                os.unlink(path)
     
     def test_train_creation(self):
         """Test Train class creation and methods."""
@@ -40,6 +67,34 @@ class TestTrainBookingSystem(unittest.TestCase):
         self.assertEqual(passenger.age, 30)
         self.assertIsNotNone(passenger.passenger_id)
     
+    def test_models_are_slotted(self):
+        """Test that models carry no per-instance __dict__."""
+        passenger = Passenger("Slim", 30, "M", "1234567890", "slim@example.com")
+        booking = Booking("T001", passenger, "2025-08-01 10:00:00", days_ahead(20))
+        for obj in (self.system.trains["T001"], passenger, booking):
+            self.assertFalse(hasattr(obj, "__dict__"))
+    
+    def test_passenger_records_are_shared(self):
+        """Test that repeat bookings share one Passenger object across reloads."""
+        first = Passenger("Sam Share", 44, "M", "2323232323", "sam@example.com")
+        again = Passenger("Sam Share", 44, "M", "2323232323", "SAM@example.com")
+        booking1 = self.system.book_ticket("T001", first, days_ahead(20))
+        booking2 = self.system.book_ticket("T003", again, days_ahead(21))
+        self.assertIs(booking1.passenger, booking2.passenger)
+        
+        new_system = TrainBookingSystem(self.test_file.name)
+        self.assertIs(new_system.get_booking(booking1.booking_id).passenger,
+                      new_system.get_booking(booking2.booking_id).passenger)
+    
+    def test_enhanced_booking_keeps_discount_details(self):
+        """Test that discount details still attach to slotted bookings."""
+        system = EnhancedTrainBookingSystem(self.test_file.name)
+        passenger = Passenger("Stu Dent", 20, "F", "3030303030", "stu@example.com")
+        booking = system.book_ticket_enhanced("T001", passenger, days_ahead(20), "STUDENT")
+        self.assertEqual(booking.discount_code, "STUDENT")
+        self.assertAlmostEqual(booking.discounted_price, 42.5)
+        self.assertFalse(hasattr(self.system.book_ticket("T001", passenger, days_ahead(20)), "discount_code"))
+    
     def test_search_trains(self):
         """Test train search functionality."""
         trains = self.system.search_trains("New York", "Boston")
@@ -60,7 +115,7 @@ class TestTrainBookingSystem(unittest.TestCase):
         train = trains[0]
         initial_seats = train.available_seats
         
-        booking = self.system.book_ticket(train.train_id, passenger, "2025-09-01")
+        booking = self.system.book_ticket(train.train_id, passenger, days_ahead(20))
         
         self.assertIsNotNone(booking)
         self.assertEqual(booking.train_id, train.train_id)
@@ -76,7 +131,7 @@ class TestTrainBookingSystem(unittest.TestCase):
         initial_seats = train.available_seats
         
         # Book a ticket
-        booking = self.system.book_ticket(train.train_id, passenger, "2025-09-01")
+        booking = self.system.book_ticket(train.train_id, passenger, days_ahead(20))
         self.assertIsNotNone(booking)
         
         # Cancel the booking
@@ -96,12 +151,28 @@ class TestTrainBookingSystem(unittest.TestCase):
         train = trains[0]
         
         # Book multiple tickets
-        booking1 = self.system.book_ticket(train.train_id, passenger, "2025-09-01")
-        booking2 = self.system.book_ticket(train.train_id, passenger, "2025-09-02")
+        booking1 = self.system.book_ticket(train.train_id, passenger, days_ahead(20))
+        booking2 = self.system.book_ticket(train.train_id, passenger, days_ahead(21))
         
         bookings = self.system.get_passenger_bookings("carol@example.com")
         self.assertEqual(len(bookings), 2)
     
+    def test_passenger_index_tracks_status(self):
+        """Test email normalization and per-status counts in the passenger index."""
+        passenger = Passenger("Erin Case", 36, "F", "6666666666", "Erin@Example.com")
+        booking1 = self.system.book_ticket("T001", passenger, days_ahead(20))
+        booking2 = self.system.book_ticket("T001", passenger, days_ahead(21))
+        self.system.cancel_booking(booking1.booking_id)
+        
+        self.assertEqual(self.system.get_passenger_bookings(" erin@example.COM "), [booking2])
+        self.assertEqual(self.system.passenger_index.status_counts("erin@example.com"),
+                         {"Confirmed": 1, "Cancelled": 1})
+        
+        new_system = TrainBookingSystem(self.test_file.name)
+        self.assertEqual([b.booking_id for b in new_system.get_passenger_bookings("erin@example.com")],
+                         [booking2.booking_id])
+        self.assertEqual(new_system.passenger_index.count("erin@example.com"), 2)
+    
     def test_data_persistence(self):
         """Test saving and loading data."""
         passenger = Passenger("Dave Wilson", 40, "M", "8888888888", "dave@example.com")
@@ -109,7 +180,7 @@ class TestTrainBookingSystem(unittest.TestCase):
         trains = self.system.search_trains("New York", "Boston")
         train = trains[0]
         
-        booking = self.system.book_ticket(train.train_id, passenger, "2025-09-01")
+        booking = self.system.book_ticket(train.train_id, passenger, days_ahead(20))
         
         # Create a new system instance with the same data file
         new_system = TrainBookingSystem(self.test_file.name)
@@ -123,7 +194,7 @@ class TestTrainBookingSystem(unittest.TestCase):
         """Test booking with invalid train ID."""
         passenger = Passenger("Invalid User", 25, "M", "0000000000", "invalid@example.com")
         
-        booking = self.system.book_ticket("INVALID", passenger, "2025-09-01")
+        booking = self.system.book_ticket("INVALID", passenger, days_ahead(20))
         self.assertIsNone(booking)
     
     def test_booking_full_train(self):
@@ -136,12 +207,1110 @@ class TestTrainBookingSystem(unittest.TestCase):
         passenger2 = Passenger("Second", 30, "F", "2222222222", "second@example.com")
         
         # Book the only seat
-        booking1 = self.system.book_ticket("FULL", passenger1, "2025-09-01")
+        booking1 = self.system.book_ticket("FULL", passenger1, days_ahead(20))
         self.assertIsNotNone(booking1)
         
         # Try to book when full
-        booking2 = self.system.book_ticket("FULL", passenger2, "2025-09-01")
+        booking2 = self.system.book_ticket("FULL", passenger2, days_ahead(20))
         self.assertIsNone(booking2)
+    
+    def test_search_hides_trains_sold_out_on_the_date(self):
+        """Test that only a dated search hides a train sold out on that date."""
+        self.system.add_train(Train("ONE", "Single Seat", "Lyon", "Nice", "10:00", "14:00", 1, 30.0))
+        self.system.add_train(Train("TWO", "Double Seat", " lyon ", "NICE", "12:00", "16:00", 2, 35.0))
+        self.assertEqual([t.train_id for t in self.system.search_trains("Lyon", "Nice")], ["ONE", "TWO"])
+        
+        passenger = Passenger("Solo", 40, "M", "1010101010", "solo@example.com")
+        booking = self.system.book_ticket("ONE", passenger, days_ahead(20))
+        self.assertEqual([t.train_id for t in self.system.search_trains("lyon", "nice", days_ahead(20))], ["TWO"])
+        self.assertEqual([t.train_id for t in self.system.search_trains("lyon", "nice")], ["ONE", "TWO"])
+        self.assertEqual(self.system.trains["ONE"].available_seats, 0)
+        
+        self.system.cancel_booking(booking.booking_id)
+        self.assertEqual([t.train_id for t in self.system.search_trains("Lyon", "Nice", days_ahead(20))],
+                         ["ONE", "TWO"])
+    
+    def test_added_train_is_persisted_and_indexed(self):
+        """Test that add_train survives a restart and is searchable."""
+        self.system.add_train(Train("NEW", "New Line", "Oslo", "Bergen", "07:00", "14:00", 50, 60.0))
+        
+        new_system = TrainBookingSystem(self.test_file.name)
+        self.assertEqual([t.train_id for t in new_system.search_trains("Oslo", "Bergen")], ["NEW"])
+        self.assertEqual([t.train_id for t in new_system.route_index.from_source("oslo")], ["NEW"])
+    
+    def test_timetable_is_precompiled(self):
+        """Test parsed times, multi-day durations and departure-window search."""
+        self.system.add_train(Train("LATE", "Late", "Kiruna", "Narvik", "18:55", "06:50+2", 50, 30.0))
+        self.system.add_train(Train("EARLY", "Early", "Kiruna", "Narvik", "06:15", "09:30", 50, 30.0))
+        self.system.add_train(Train("NOON", "Noon", "Kiruna", "Narvik", "12:00", "15:00", 50, 30.0))
+        
+        late = self.system.trains["LATE"]
+        self.assertEqual((late.departure_minutes, late.arrival_minutes, late.arrival_day_offset),
+                         (1135, 410, 2))
+        self.assertEqual(late.duration, "35h 55m")
+        
+        window = self.system.search_trains("kiruna", "narvik", departure_after="07:00", departure_before="19:00")
+        self.assertEqual([t.train_id for t in window], ["NOON", "LATE"])
+        self.assertEqual([t.train_id for t in self.system.search_trains("Kiruna", "Narvik", departure_after="bad")],
+                         ["LATE", "EARLY", "NOON"])
+        
+        self.system.add_train(Train("NOON", "Noon", "Kiruna", "Narvik", "05:00", "08:00", 50, 30.0))
+        self.assertEqual([t.train_id for t in self.system.search_trains("Kiruna", "Narvik", departure_after="00:00")],
+                         ["NOON", "EARLY", "LATE"])
+    
+    def test_seats_are_tracked_per_journey_date(self):
+        """Test that each journey date has its own seat inventory."""
+        self.system.add_train(Train("SOLO", "One Seat", "Porto", "Faro", "09:00", "13:00", 1, 25.0))
+        passenger = Passenger("Dana Date", 27, "F", "4444444444", "dana@example.com")
+        
+        self.assertIsNotNone(self.system.book_ticket("SOLO", passenger, days_ahead(20)))
+        self.assertIsNotNone(self.system.book_ticket("SOLO", passenger, days_ahead(21)))
+        self.assertIsNone(self.system.book_ticket("SOLO", passenger, days_ahead(20)))
+        self.assertIsNone(self.system.book_ticket("SOLO", passenger, "not-a-date"))
+        
+        self.assertEqual(self.system.search_trains("Porto", "Faro", days_ahead(20)), [])
+        self.assertEqual([t.train_id for t in self.system.search_trains("Porto", "Faro", days_ahead(22))], ["SOLO"])
+        
+        new_system = TrainBookingSystem(self.test_file.name)
+        self.assertEqual(new_system.trains["SOLO"].seats_on(days_ahead(20)), 0)
+        self.assertEqual(new_system.trains["SOLO"].seats_on(days_ahead(22)), 1)
+
+    def test_journey_dates_must_be_in_the_booking_window(self):
+        """Test that past dates and dates beyond the advance booking limit are refused."""
+        self.system.add_train(Train("WIN", "Window", "Porto", "Braga", "09:00", "10:00", 10, 15.0))
+        passenger = Passenger("Wendy Window", 33, "F", "4545454545", "wendy@example.com")
+
+        for journey_date in (days_ahead(-1), days_ahead(MAX_BOOKING_ADVANCE_DAYS + 1), "9999-12-31"):
+            self.assertIsNone(self.system.book_ticket("WIN", passenger, journey_date))
+            self.assertIsNone(self.system.book_tickets_batch("WIN", [passenger], journey_date))
+        self.assertEqual(self.system.get_passenger_bookings("wendy@example.com"), [])
+
+        self.assertIsNotNone(self.system.book_ticket("WIN", passenger, days_ahead(0)))
+        self.assertIsNotNone(self.system.book_tickets_batch("WIN", [passenger],
+                                                            days_ahead(MAX_BOOKING_ADVANCE_DAYS)))
+    
+    def test_batch_booking_is_all_or_nothing(self):
+        """Test group bookings reserve every seat or none."""
+        self.system.add_train(Train("GRP", "Group Line", "Rome", "Pisa", "09:00", "12:00", 3, 40.0))
+        group = [Passenger(f"Tourist {i}", 30 + i, "F", "5550000000", "tours@example.com") for i in range(3)]
+        
+        self.assertIsNone(self.system.book_tickets_batch("GRP", group + group[:1], days_ahead(20)))
+        self.assertEqual(self.system.trains["GRP"].seats_on(days_ahead(20)), 3)
+        
+        bookings = self.system.book_tickets_batch("GRP", group, days_ahead(20))
+        self.assertEqual(len(bookings), 3)
+        self.assertEqual(self.system.trains["GRP"].seats_on(days_ahead(20)), 0)
+        self.assertEqual(len(self.system.get_passenger_bookings("tours@example.com")), 3)
+        
+        new_system = TrainBookingSystem(self.test_file.name)
+        self.assertEqual(new_system.trains["GRP"].seats_on(days_ahead(20)), 0)
+        self.assertEqual(new_system.trains["GRP"].bookings, [b.booking_id for b in bookings])
+
+class TestBookingAnalytics(unittest.TestCase):
+    
+    def setUp(self):
+        """Book and cancel a few tickets to report on."""
+        self.test_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
+        self.test_file.close()
+        self.system = TrainBookingSystem(self.test_file.name)
+        alice = Passenger("Alice", 30, "F", "1111111111", "alice@example.com")
+        bob = Passenger("Bob", 40, "M", "2222222222", "bob@example.com")
+        self.system.book_ticket("T001", alice, days_ahead(20))
+        self.system.book_ticket("T001", alice, days_ahead(21))
+        cancelled = self.system.book_ticket("E001", bob, days_ahead(20))
+        self.system.cancel_booking(cancelled.booking_id)
+        self.analytics = BookingAnalytics(self.system)
+    
+    def tearDown(self):
+        """Remove the data file and its snapshot backups."""
+        for path in [self.test_file.name] + backup_files(self.test_file.name):
+            os.unlink(path)
+    
+    def test_reports_use_maintained_aggregates(self):
+        """Test report values maintained on book and cancel."""
+        daily = self.analytics.generate_daily_report()
+        self.assertEqual(daily["total_bookings"], 3)
+        self.assertEqual(daily["confirmed_bookings"], 2)
+        self.assertEqual(daily["cancelled_bookings"], 1)
+        self.assertEqual(daily["total_revenue"], 100.0)
+        self.assertEqual(daily["popular_routes"][0], ("New York → Boston", 2))
+        
+        routes = {r["route"]: r for r in self.analytics.get_route_performance()}
+        self.assertEqual(routes["London → Paris"]["cancellation_rate"], 100.0)
+        self.assertEqual(routes["New York → Boston"]["revenue"], 100.0)
+        
+        insights = self.analytics.get_passenger_insights()
+        self.assertEqual(insights["total_unique_passengers"], 2)
+        self.assertEqual(insights["repeat_customers"], 1)
+        self.assertEqual(insights["most_frequent_passenger"]["name"], "Alice")
+        
+        self.assertEqual(self.analytics.generate_weekly_report()["total_bookings"], 3)
+        self.assertEqual(sum(self.analytics.predict_peak_times()["hourly_distribution"].values()), 3)
+    
+    def test_aggregates_match_rebuild(self):
+        """Test that live aggregates agree with a rebuild, also after reload."""
+        self.assertTrue(self.analytics.verify_aggregates())
+        reloaded = TrainBookingSystem(self.test_file.name)
+        self.assertTrue(reloaded.aggregates.matches(self.system.aggregates))
+        
+        enhanced = EnhancedTrainBookingSystem(self.test_file.name)
+        self.assertEqual(enhanced.get_revenue_report()["confirmed_bookings"], 2)
+        self.assertEqual(enhanced.get_popular_routes(), [("New York → Boston", 2)])
+
+    def test_cancellation_refunds_the_price_booked(self):
+        """Test a cancellation after a price change takes back the revenue counted at booking."""
+        carol = Passenger("Carol", 50, "F", "3333333333", "carol@example.com")
+        booking = self.system.book_ticket("T001", carol, days_ahead(22))
+        self.system.trains["T001"].price = 80.0
+        self.system.cancel_booking(booking.booking_id)
+        self.assertEqual(self.analytics.generate_daily_report()["total_revenue"], 100.0)
+
+    def test_date_only_booking_dates_skip_the_hour(self):
+        """Test that a booking date without a time is counted but not given an hour."""
+        booking = Booking("T001", Passenger("Dee", 20, "F", "4", "dee@example.com"), "2025-08-01", days_ahead(20))
+        self.system.aggregates.record_booking(booking, self.system.trains["T001"])
+        self.assertEqual(self.system.aggregates.by_day["2025-08-01"]["bookings"], 1)
+        self.assertEqual(sum(self.analytics.predict_peak_times()["hourly_distribution"].values()), 3)
+
+    @unittest.skipUnless(np is not None, "NumPy not installed")
+    def test_columnar_reports_match_aggregates(self):
+        """Test that columnar reports agree with the maintained aggregates."""
+        snapshot = ColumnarBookingSnapshot.from_system(self.system)
+        self.assertEqual(len(snapshot), 3)
+        self.assertCountEqual(snapshot.route_performance(), self.analytics.get_route_performance())
+        
+        peaks = self.analytics.predict_peak_times()
+        columnar_peaks = snapshot.peak_times()
+        self.assertEqual(columnar_peaks["hourly_distribution"], peaks["hourly_distribution"])
+        self.assertEqual(columnar_peaks["daily_distribution"], peaks["daily_distribution"])
+        
+        today = datetime.now().strftime("%Y-%m-%d")
+        self.assertEqual(snapshot.revenue_trend(today, today), [{"date": today, "revenue": 100.0}])
+        self.assertEqual(snapshot.train_utilization(days_ahead(20))["T001"]["occupied_seats"], 1)
+        self.assertEqual(snapshot.train_utilization()["E001"]["occupied_seats"], 0)
+
+class TestSeatInventory(unittest.TestCase):
+    
+    def test_reserve_and_release(self):
+        """Test per-day reservations against capacity."""
+        inventory = SeatInventory(2, horizon_days=30)
+        day = journey_day(days_ahead(49))
+        self.assertTrue(inventory.reserve(day))
+        self.assertTrue(inventory.reserve(day))
+        self.assertFalse(inventory.reserve(day))
+        self.assertEqual(inventory.available(day + 1), 2)
+        inventory.release(day)
+        self.assertEqual(inventory.available(day), 1)
+        self.assertEqual(inventory.min_available(), 1)
+    
+    def test_colliding_days_do_not_share_counters(self):
+        """Test that two live days mapping to the same slot stay separate."""
+        inventory = SeatInventory(3, horizon_days=30)
+        day = journey_day(days_ahead(49))
+        self.assertTrue(inventory.reserve(day, 2))
+        self.assertTrue(inventory.reserve(day + 30))
+        self.assertEqual(inventory.available(day), 1)
+        self.assertEqual(inventory.available(day + 30), 2)
+        inventory.release(day + 30)
+        self.assertEqual(inventory.available(day + 30), 3)
+        self.assertEqual(inventory.available(day), 1)
+
+class TestJourneyPlanner(unittest.TestCase):
+    
+    def setUp(self):
+        """Build a small timetable with a connection at Bridgeton."""
+        self.trains = [
+            Train("P001", "Morning Link", "Ashford", "Bridgeton", "08:00", "10:00", 10, 50.0),
+            Train("P002", "Tight Link", "Bridgeton", "Carlow", "10:20", "12:00", 10, 30.0),
+            Train("P003", "Noon Link", "Bridgeton", "Carlow", "11:00", "13:00", 1, 30.0),
+            Train("P004", "Direct", "Ashford", "Carlow", "09:00", "14:00", 10, 100.0),
+            Train("P005", "Night Direct", "Ashford", "Carlow", "22:00", "06:00+1", 10, 40.0),
+            Train("P006", "Long Haul", "Carlow", "Dunmore", "18:55", "06:50+2", 10, 10.0),
+        ]
+        self.planner = JourneyPlanner(self.trains)
+    
+    def test_pareto_journeys(self):
+        """Test that each result is best on arrival, price or transfers."""
+        journeys = self.planner.plan("ashford", "Carlow", departure_after="07:00")
+        self.assertEqual([j["trains"] for j in journeys], [["P001", "P003"], ["P004"], ["P005"]])
+        self.assertEqual(journeys[0]["connection_time"], "1:00:00")
+        self.assertEqual(journeys[0]["total_price"], 80.0)
+        self.assertEqual(journeys[2]["arrival"], "06:00+1")
+    
+    def test_day_offsets_and_transfer_limit(self):
+        """Test multi-day arrivals and capping the number of transfers."""
+        journeys = self.planner.plan("Ashford", "Dunmore", departure_after="07:00")
+        fastest = journeys[0]
+        self.assertEqual(fastest["arrival"], "06:50+2")
+        self.assertEqual(fastest["route"], "Ashford → Bridgeton → Carlow → Dunmore")
+        self.assertEqual(fastest["total_duration"], "46h 50m")
+        self.assertTrue(all(j["transfers"] <= 1
+                            for j in self.planner.plan("Ashford", "Dunmore", max_transfers=1)))
+    
+    def test_fewer_transfers_survive_later_rounds(self):
+        """Test a journey with fewer transfers isn't lost to a better label found in a later round."""
+        trains = [
+            Train("Y1", "Y1", "A", "Y", "06:00", "07:00", 10, 10.0),
+            Train("X1", "X1", "A", "X", "06:00", "10:00", 10, 100.0),
+            Train("YX", "YX", "Y", "X", "07:30", "08:30", 10, 10.0),
+            Train("XD", "XD", "X", "D", "11:00", "12:00", 10, 10.0),
+        ]
+        journeys = JourneyPlanner(trains, min_connection=10, max_transfers=2).plan("A", "D", None, "05:00")
+        self.assertEqual(sorted(j["trains"] for j in journeys), [["X1", "XD"], ["Y1", "YX", "XD"]])
+    
+    def test_sold_out_leg_is_skipped_on_that_date(self):
+        """Test that connections need seats on the date each leg departs."""
+        self.trains[2].seats.reserve(journey_day(days_ahead(40)))
+        journeys = self.planner.plan("Ashford", "Carlow", days_ahead(40), "07:00")
+        self.assertNotIn(["P001", "P003"], [j["trains"] for j in journeys])
+        self.assertEqual(self.planner.plan("Ashford", "Carlow", days_ahead(41), "07:00")[0]["legs"][1]["journey_date"],
+                         days_ahead(41))
+    
+    def test_suggest_alternative_routes(self):
+        """Test that suggestions are connecting journeys over the current timetable."""
+        test_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
+        test_file.close()
+        try:
+            system = EnhancedTrainBookingSystem(test_file.name)
+            self.assertEqual(system.suggest_alternative_routes("Ashford", "Carlow"), [])
+            for train in self.trains:
+                system.add_train(train)
+            alternatives = system.suggest_alternative_routes("Ashford", "Carlow")
+            self.assertEqual([a["trains"] for a in alternatives], [["P001", "P003"]])
+        finally:
+            os.unlink(test_file.name)
+
+class TestCityAutocomplete(unittest.TestCase):
+    
+    def test_ranking_and_accent_folding(self):
+        """Test exact, prefix, word-prefix and contains tiers with accent folding."""
+        index = AutocompleteIndex(["Eastlondon", "Toulon", "London", "New London", "São Paulo", "Lond"])
+        self.assertEqual(index.search("lond"), ["Lond", "London", "New London", "Eastlondon"])
+        self.assertEqual(index.search("sao"), ["São Paulo"])
+        self.assertEqual(index.search("ULON"), ["Toulon"])
+        self.assertEqual(index.search("lon", limit=2), ["London", "Lond"])
+        self.assertEqual(index.search("xyz"), [])
+    
+    def test_city_and_country_search(self):
+        """Test the module-level autocomplete helpers."""
+        self.assertEqual(search_cities("Sao P"), ["São Paulo"])
+        self.assertEqual(search_cities("york"), ["New York"])
+        self.assertEqual(search_countries("ger")[0], "Germany")
+        self.assertEqual(search_cities_in_country("Brazil", "sao luis"), ["São Luís"])
+        self.assertEqual(search_cities_in_country("Atlantis", "x"), [])
+
+    def test_reverse_lookups(self):
+        """Test city and country lookups, including cities in several countries."""
+        self.assertEqual(get_countries_for_city("Hamilton"), ("Canada", "New Zealand"))
+        self.assertEqual(get_country_for_city("sao paulo"), "Brazil")
+        self.assertIsNone(get_country_for_city("Atlantis"))
+        self.assertEqual(get_region_for_country("Kenya"), "Africa")
+        self.assertEqual(get_region_for_country("Atlantis"), "Other")
+        
+        rows = annotate_routes([{"source": "Mumbai", "destination": "Nowhere"}])
+        self.assertEqual((rows[0]["source_country"], rows[0]["source_region"]), ("India", "Asia"))
+        self.assertEqual((rows[0]["destination_country"], rows[0]["destination_region"]), (None, "Other"))
+
+@unittest.skipUnless(find_spec("flask"), "Flask not installed")
+class TestWebApp(unittest.TestCase):
+    
+    def setUp(self):
+        """Build an app around a temporary data file."""
+        from app import create_app
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app(os.path.join(self.test_dir, "web_test.json"))
+        self.client = self.app.test_client()
+    
+    def tearDown(self):
+        """Remove the data file."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_factory_builds_independent_apps(self):
+        """Test that each app gets its own booking system and the routes work."""
+        from app import create_app
+        other = create_app(os.path.join(self.test_dir, "other.json"), preload_cities=False)
+        self.assertIsNot(other.extensions["booking_system"], self.app.extensions["booking_system"])
+        
+        response = self.client.post("/api/bookings/batch", json={
+            "train_id": "T001", "journey_date": days_ahead(40),
+            "passengers": [{"name": "Web", "age": 30, "gender": "F", "phone": "5", "email": "web@example.com"}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.app.extensions["booking_system"].bookings), 1)
+        past = self.client.post("/api/bookings/batch", json={
+            "train_id": "T001", "journey_date": days_ahead(-1),
+            "passengers": [{"name": "Web", "age": 30, "gender": "F", "phone": "5", "email": "web@example.com"}]})
+        self.assertEqual(past.status_code, 400)
+        self.assertEqual(len(other.extensions["booking_system"].bookings), 0)
+        self.assertEqual(self.client.get("/api/cities/search?q=sao").get_json()[0], "São Paulo")
+
+    def test_cached_responses_revalidate_and_invalidate(self):
+        """Test ETag 304s and that a booking invalidates cached seat counts."""
+        first = self.client.get("/api/trains")
+        etag = first.headers["ETag"]
+        self.assertEqual(self.client.get("/api/trains", headers={"If-None-Match": etag}).status_code, 304)
+        
+        self.app.extensions["booking_system"].book_ticket(
+            "T001", Passenger("Cache", 30, "M", "6", "cache@example.com"), days_ahead(40))
+        second = self.client.get("/api/trains", headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 200)
+        seats = {train["train_id"]: train["available_seats"] for train in second.get_json()}
+        self.assertEqual(seats["T001"], 99)
+        
+        stats = self.app.extensions["response_cache"].get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+class TestCacheManager(unittest.TestCase):
+    
+    def test_lru_eviction_and_stats(self):
+        """Test that the least recently used entry is evicted and counted."""
+        cache = CacheManager(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        
+        stats = cache.get_stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]), (2, 3, 1, 1))
+    
+    def test_ttl_and_byte_limits(self):
+        """Test lazy expiry and evicting by estimated size."""
+        expired = CacheManager(max_size=10, ttl_seconds=0)
+        expired.set("a", 1)
+        self.assertIsNone(expired.get("a"))
+        self.assertEqual(expired.get_stats()["expirations"], 1)
+        
+        sized = CacheManager(max_size=10, max_bytes=3000)
+        for key in "abc":
+            sized.set(key, b"x" * 1000)
+        self.assertIsNone(sized.get("a"))
+        self.assertIsNotNone(sized.get("c"))
+        self.assertLessEqual(sized.get_stats()["bytes"], 3000)
+    
+    def test_concurrent_access(self):
+        """Test that sharded access from many threads keeps the cache consistent."""
+        cache = CacheManager(max_size=4096, shards=8)
+        
+        def worker(offset):
+            for i in range(2000):
+                cache.set((offset, i), i)
+                cache.get((offset, i // 2))
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats["size"], len(cache))
+        self.assertLessEqual(stats["size"], 4096)
+        self.assertEqual(stats["hits"] + stats["misses"], 16000)
+        self.assertEqual(stats["size"] + stats["evictions"], 16000)
+
+class TestSnapshotRecovery(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a temporary data directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "snapshot_test.json")
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def book(self, system, count):
+        """Make count bookings, each saved as its own snapshot generation."""
+        for i in range(count):
+            system.book_ticket("T001", Passenger(f"Gen {i}", 30, "F", "1234567890", f"gen{i}@example.com"),
+                               days_ahead(40))
+    
+    def test_snapshots_are_checksummed_generations(self):
+        """Test the snapshot header, generation numbers and legacy files."""
+        system = TrainBookingSystem(self.data_file)
+        self.book(system, 4)
+        with open(self.data_file, 'rb') as f:
+            header = json.loads(f.readline())
+        self.assertEqual(header["generation"], system.storage.generation)
+        self.assertEqual(header["generation"], 5)  # Sample trains, then one per booking
+        self.assertEqual(len(backup_files(self.data_file)), 3)
+        self.assertEqual(TrainBookingSystem(self.data_file).storage.generation, header["generation"])
+        
+        # Files from before snapshot headers still load
+        legacy = os.path.join(self.test_dir, "legacy.json")
+        with open(legacy, 'w') as f:
+            json.dump({"trains": {"T001": system.trains["T001"].to_dict()}, "bookings": {}}, f)
+        self.assertEqual(list(TrainBookingSystem(legacy).trains), ["T001"])
+    
+    def test_damaged_snapshot_falls_back_to_previous_generation(self):
+        """Test recovery from a torn snapshot and refusing to overwrite unreadable data."""
+        system = TrainBookingSystem(self.data_file)
+        self.book(system, 3)
+        with open(self.data_file, 'r+b') as f:
+            f.truncate(os.path.getsize(self.data_file) // 2)
+        
+        recovered = TrainBookingSystem(self.data_file)
+        self.assertEqual(len(recovered.bookings), 2)
+        self.assertEqual(recovered.storage.generation, system.storage.generation - 1)
+        
+        for path in [self.data_file] + backup_files(self.data_file):
+            with open(path, 'ab') as f:
+                f.write(b"garbage")
+        with self.assertRaises(CorruptSnapshotError):
+            TrainBookingSystem(self.data_file)
+    
+    def test_streamed_load_matches_saved_state(self):
+        """Test a reload builds the same bookings, shared passengers and seat counts."""
+        system = TrainBookingSystem(self.data_file)
+        regular = Passenger("Ana Diaz", 41, "F", "5550001111", "ana@example.com")
+        for date in (days_ahead(40), days_ahead(41), days_ahead(41)):
+            system.book_ticket("T001", regular, date)
+        self.book(system, 2)
+        system.cancel_booking(system.get_passenger_bookings("gen0@example.com")[0].booking_id)
+        
+        reloaded = TrainBookingSystem(self.data_file)
+        self.assertEqual([b.to_dict() for b in reloaded.bookings.values()],
+                         [b.to_dict() for b in system.bookings.values()])
+        self.assertEqual(reloaded.trains["T001"].bookings, system.trains["T001"].bookings)
+        self.assertEqual(reloaded.trains["T001"].seats_on(days_ahead(41)),
+                         system.trains["T001"].seats_on(days_ahead(41)))
+        self.assertEqual(len({id(b.passenger) for b in reloaded.get_passenger_bookings("ana@example.com")}), 1)
+    
+    def test_json_stream_reads_across_windows(self):
+        """Test the incremental parser with values split over tiny read windows."""
+        document = {"trains": {"T1": {"price": 12.5, "bookings": ["a", "b"]}},
+                    "bookings": {"b1": {"name": "Zoë \u00e9", "age": 30}, "b2": {"ok": True, "n": None}},
+                    "journal_seq": 1234567}
+        text = json.dumps(document, indent=2)
+        for chunk_size in (1, 3, 7, 64):
+            stream = _JsonStream(io.StringIO(text), chunk_size)
+            parsed = {}
+            for key in stream.keys():
+                parsed[key] = dict(stream.items()) if key == "bookings" else stream.value()
+            stream.end()
+            self.assertEqual(parsed, document)
+        
+        with self.assertRaises(ValueError):
+            stream = _JsonStream(io.StringIO('{"bookings": {"b1": {"age": 30} "b2": {}}}'), 8)
+            for key in stream.keys():
+                list(stream.items())
+
+    def test_json_stream_numbers_cut_by_the_window(self):
+        """Test floats and exponents split by a read window are read whole, as values and entries."""
+        for text in ('{"a": 0.1, "b": 1}', '{"x": {"y": 1.5, "z": 22}}',
+                     '{"e": 1e5, "f": -2.5E-3, "g": 10}', '{"n": 123.456}'):
+            document = json.loads(text)
+            for chunk_size in range(1, 9):
+                stream = _JsonStream(io.StringIO(text), chunk_size)
+                self.assertEqual({key: stream.value() for key in stream.keys()}, document)
+                stream.end()
+                stream = _JsonStream(io.StringIO(text), chunk_size)
+                self.assertEqual(dict(stream.items()), document)
+                stream.end()
+
+    def test_rotating_backups(self):
+        """Test backup_data keeps the newest copies and restore_data brings one back."""
+        source = os.path.join(self.test_dir, "notes.txt")
+        for version in range(3):
+            with open(source, 'w') as f:
+                f.write(f"version {version}")
+            self.assertTrue(backup_data(source, keep=2))
+        backups = backup_files(source)
+        self.assertEqual(len(backups), 2)
+        with open(backups[0]) as f:
+            self.assertEqual(f.read(), "version 2")
+        
+        self.assertTrue(restore_data(backups[1], source))
+        with open(source) as f:
+            self.assertEqual(f.read(), "version 1")
+
+class TestJournalStorage(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a system that persists through the write-ahead journal."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "journal_test.json")
+        self.system = TrainBookingSystem(self.data_file, storage_mode="journal")
+    
+    def tearDown(self):
+        """Remove the snapshot and journal files."""
+        self.system.storage.close()
+        shutil.rmtree(self.test_dir)
+    
+    def test_bookings_are_appended_not_rewritten(self):
+        """Test that a booking only appends one journal record."""
+        snapshot_mtime = os.path.getmtime(self.data_file)
+        passenger = Passenger("Jane Log", 31, "F", "1212121212", "jane@example.com")
+        booking = self.system.book_ticket("T001", passenger, days_ahead(20))
+        
+        with open(self.system.storage.journal_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['op'], 'book')
+        self.assertEqual(records[0]['booking']['booking_id'], booking.booking_id)
+        self.assertEqual(os.path.getmtime(self.data_file), snapshot_mtime)
+    
+    def test_replay_snapshot_and_journal(self):
+        """Test that a restart replays journaled bookings and cancellations."""
+        passenger = Passenger("Replay User", 45, "M", "3434343434", "replay@example.com")
+        kept = self.system.book_ticket("T001", passenger, days_ahead(20))
+        cancelled = self.system.book_ticket("T001", passenger, days_ahead(21))
+        self.system.cancel_booking(cancelled.booking_id)
+        self.system.storage.close()
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="journal")
+        self.assertEqual(restarted.get_booking(kept.booking_id).status, "Confirmed")
+        self.assertEqual(restarted.get_booking(cancelled.booking_id).status, "Cancelled")
+        self.assertEqual(restarted.trains["T001"].available_seats,
+                         self.system.trains["T001"].available_seats)
+        restarted.storage.close()
+    
+    def test_compaction_folds_journal_into_snapshot(self):
+        """Test threshold-triggered compaction and replay after it."""
+        self.system.storage.compact_threshold = 3
+        passenger = Passenger("Compact User", 29, "F", "5656565656", "compact@example.com")
+        bookings = [self.system.book_ticket("T001", passenger, days_ahead(20)) for _ in range(4)]
+        
+        with open(self.system.storage.journal_file) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.system.storage.close()
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="journal")
+        for booking in bookings:
+            self.assertIsNotNone(restarted.get_booking(booking.booking_id))
+        self.assertEqual(restarted.trains["T001"].available_seats, 96)
+        restarted.storage.close()
+    
+    def test_lone_write_is_fsynced_within_the_interval(self):
+        """Test that a record with no write after it is still fsynced once the interval is up."""
+        storage = JournalStorage(os.path.join(self.test_dir, "lone.json"), fsync_interval=0.5)
+        synced = threading.Event()
+        with mock.patch("storage.os.fsync", side_effect=lambda fd: synced.set()):
+            storage.append({'op': 'cancel', 'booking_id': "B1", 'train_id': "T001"})
+            self.assertFalse(synced.is_set())
+            self.assertTrue(synced.wait(5))
+        storage.close()
+    
+    def test_batch_booking_is_one_record(self):
+        """Test that a group booking is journaled as a single record."""
+        group = [Passenger(f"Member {i}", 40, "M", "1231231234", "corp@example.com") for i in range(5)]
+        bookings = self.system.book_tickets_batch("T002", group, days_ahead(20))
+        
+        with open(self.system.storage.journal_file) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.system.storage.close()
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="journal")
+        self.assertEqual(restarted.trains["T002"].seats_on(days_ahead(20)), 75)
+        self.assertEqual({b.booking_id for b in restarted.get_passenger_bookings("corp@example.com")},
+                         {b.booking_id for b in bookings})
+        restarted.storage.close()
+    
+    def test_torn_journal_tail_is_ignored(self):
+        """Test that a partially written final record does not break loading."""
+        passenger = Passenger("Torn User", 50, "M", "7878787878", "torn@example.com")
+        booking = self.system.book_ticket("T001", passenger, days_ahead(20))
+        self.system.storage.close()
+        with open(self.system.storage.journal_file, 'a') as f:
+            f.write('{"op": "book", "boo')
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="journal")
+        self.assertIsNotNone(restarted.get_booking(booking.booking_id))
+        self.assertEqual(len(restarted.bookings), 1)
+        
+        # Records appended after recovery must survive the next restart
+        later = restarted.book_ticket("T001", passenger, days_ahead(21))
+        restarted.storage.close()
+        again = TrainBookingSystem(self.data_file, storage_mode="journal")
+        self.assertIsNotNone(again.get_booking(later.booking_id))
+        again.storage.close()
+
+class TestSQLiteStorage(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a system backed by SQLite."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "sqlite_test.json")
+        self.system = TrainBookingSystem(self.data_file, storage_mode="sqlite")
+    
+    def tearDown(self):
+        """Close the database and remove it."""
+        self.system.storage.close()
+        shutil.rmtree(self.test_dir)
+    
+    def test_persist_and_reload(self):
+        """Test that bookings and cancellations survive a restart."""
+        passenger = Passenger("Sql User", 33, "F", "1231231234", "sql@example.com")
+        kept = self.system.book_ticket("T001", passenger, days_ahead(20))
+        cancelled = self.system.book_ticket("T001", passenger, days_ahead(21))
+        self.system.cancel_booking(cancelled.booking_id)
+        self.system.storage.close()
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="sqlite")
+        self.assertEqual(len(restarted.trains), len(self.system.trains))
+        self.assertEqual(restarted.get_booking(kept.booking_id).passenger.name, "Sql User")
+        self.assertEqual(restarted.get_booking(cancelled.booking_id).status, "Cancelled")
+        self.assertEqual(restarted.trains["T001"].available_seats, 99)
+        self.assertEqual(restarted.trains["T001"].bookings, [kept.booking_id])
+        restarted.storage.close()
+    
+    def test_migrate_from_json(self):
+        """Test the one-shot migrator from the JSON data file."""
+        json_file = os.path.join(self.test_dir, "legacy.json")
+        legacy = TrainBookingSystem(json_file)
+        passenger = Passenger("Legacy User", 60, "F", "4564564567", "legacy@example.com")
+        booking = legacy.book_ticket("T002", passenger, days_ahead(20))
+        
+        summary = migrate_json_to_sqlite(json_file)
+        self.assertEqual(summary["bookings"], 1)
+        
+        migrated = TrainBookingSystem(json_file, storage_mode="sqlite")
+        self.assertEqual(migrated.get_passenger_bookings("legacy@example.com")[0].booking_id,
+                         booking.booking_id)
+        self.assertEqual(migrated.trains["T002"].available_seats, legacy.trains["T002"].available_seats)
+        migrated.storage.close()
+
+class TestBinaryStorage(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a temporary data directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "binary_test.json")
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_round_trip_and_switch_from_json(self):
+        """Test a binary snapshot restores the JSON data it was converted from."""
+        system = TrainBookingSystem(self.data_file)
+        regular = Passenger("Bin User", 52, "M", "7897897890", "bin@example.com")
+        for date in (days_ahead(60), days_ahead(61)):
+            system.book_ticket("T001", regular, date)
+        system.book_ticket("E001", Passenger("Other", 19, "F", "1", "other@example.com"), days_ahead(60))
+        system.cancel_booking(system.get_passenger_bookings("bin@example.com")[0].booking_id)
+        
+        converted = TrainBookingSystem(self.data_file, storage_mode="binary")
+        self.assertFalse(os.path.exists(converted.storage.data_file))  # Read from the JSON file
+        converted.save_data()
+        restarted = TrainBookingSystem(self.data_file, storage_mode="binary")
+        self.assertEqual(restarted.storage.generation, 1)
+        self.assertEqual([b.to_dict() for b in restarted.bookings.values()],
+                         [b.to_dict() for b in system.bookings.values()])
+        self.assertEqual(restarted.trains["T001"].bookings, system.trains["T001"].bookings)
+        self.assertEqual(restarted.trains["T001"].seats_on(days_ahead(61)),
+                         system.trains["T001"].seats_on(days_ahead(61)))
+        self.assertEqual(len({id(b.passenger) for b in restarted.get_passenger_bookings("bin@example.com")}), 1)
+        self.assertLess(os.path.getsize(restarted.storage.data_file), os.path.getsize(self.data_file))
+    
+    def test_columns_of_any_json_values(self):
+        """Test columns that are not UUIDs or repeat strings still round trip exactly."""
+        bookings = {}
+        for i in range(6):
+            booking_id = f"custom-{i}" if i % 2 else f"{i:08x}-0000-4000-8000-00000000000{i}"
+            bookings[booking_id] = {
+                'booking_id': booking_id, 'train_id': "T001", 'booking_date': f"2025-08-01 10:00:0{i}",
+                'journey_date': days_ahead(90), 'status': [True, 1, 1.0][i % 3],
+                'passenger': {'passenger_id': "P1", 'name': "Zoë", 'age': [30, "30", None][i % 3],
+                              'gender': "F", 'phone': "1", 'email': "zoe@example.com"}
+            }
+        data = {'trains': {}, 'bookings': bookings, 'journal_seq': 7}
+        storage = BinaryStorage(self.data_file)
+        storage.save_snapshot(data)
+        self.assertEqual(BinaryStorage(self.data_file).load(), (data, []))
+        
+        with open(storage.data_file, 'r+b') as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b"bad")
+        with self.assertRaises(CorruptSnapshotError):
+            BinaryStorage(self.data_file).load()
+    
+class TestSharedTimetable(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a temporary data directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "timetable_test.json")
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_mapped_trains_match_and_recompile(self):
+        """Test mapped trains read like ordinary ones and follow timetable changes."""
+        plain = TrainBookingSystem(self.data_file)
+        shared = TrainBookingSystem(self.data_file, shared_timetable=True)
+        self.assertTrue(os.path.exists(shared.timetable_file))
+        self.assertEqual([t.to_dict() for t in shared.trains.values()], [t.to_dict() for t in plain.trains.values()])
+        self.assertEqual(shared.trains["AU002"].duration_minutes, plain.trains["AU002"].duration_minutes)
+        with self.assertRaises(AttributeError):
+            shared.trains["T001"].price = 1.0
+        
+        booking = shared.book_ticket("T001", Passenger("Map User", 30, "F", "1", "map@example.com"), days_ahead(120))
+        self.assertEqual(len(shared.search_trains("New York", "Boston")), 1)
+        shared.add_train(Train("Z001", "Added", "Oslo", "Bergen", "08:00", "14:30", 10, 90.0))
+        
+        restarted = TrainBookingSystem(self.data_file, shared_timetable=True)
+        self.assertEqual(restarted.trains["Z001"].duration_minutes, 390)  # Recompiled for the new train
+        self.assertEqual(restarted.trains["T001"].bookings, [booking.booking_id])
+        self.assertEqual(restarted.trains["T001"].seats_on(days_ahead(120)), plain.trains["T001"].total_seats - 1)
+
+@unittest.skipUnless(sys.platform != "win32", "shared seat counters need fcntl")
+class TestSharedSeats(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a database with one small train, partly booked."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "seats_test.json")
+        system = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False)
+        system.add_train(Train("Z100", "Stress", "Oslo", "Bergen", "08:00", "14:30", 30, 90.0))
+        for i in range(5):
+            system.book_ticket("Z100", Passenger(f"Early {i}", 30, "F", "1", f"early{i}@example.com"), days_ahead(150))
+        system.close()
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_processes_never_oversell(self):
+        """Test worker processes racing for the last seats sell each one exactly once."""
+        journey_date = days_ahead(150)
+        script = (
+            f"import sys\nsys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+            "from main import Passenger, TrainBookingSystem\n"
+            f"system = TrainBookingSystem({self.data_file!r}, storage_mode='sqlite', group_commit=False, "
+            "shared_seats=True)\n"
+            f"print(system.trains['Z100'].seats_on({journey_date!r}), flush=True)\n"
+            "sys.stdin.readline()\n"
+            "sold = 0\n"
+            "for i in range(12):\n"
+            "    passengers = [Passenger('Racer', 40, 'M', '2', 'racer@example.com')] * (1 + i % 2)\n"
+            f"    if system.book_tickets_batch('Z100', passengers, {journey_date!r}):\n"
+            "        sold += len(passengers)\n"
+            "print(sold)\n"
+        )
+        workers = [subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE, text=True) for _ in range(4)]
+        try:
+            self.assertEqual([int(worker.stdout.readline()) for worker in workers], [25] * 4)
+            for worker in workers:  # Start them all booking at once
+                worker.stdin.write("go\n")
+                worker.stdin.flush()
+            sold = [int(worker.communicate()[0]) for worker in workers]
+        finally:
+            for worker in workers:
+                worker.kill()
+                worker.wait()
+        self.assertEqual(sum(sold), 25)
+        
+        # Every worker's bookings were kept, not just the last one to save
+        reloaded = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False)
+        self.assertEqual(len(reloaded.trains["Z100"].bookings), 30)
+        self.assertEqual(reloaded.trains["Z100"].seats_on(journey_date), 0)
+        reloaded.close()
+    
+    def test_counters_shared_within_and_reset_between_runs(self):
+        """Test systems on one seat file share counters, and a fresh start reseeds them."""
+        first = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False, shared_seats=True)
+        second = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False, shared_seats=True)
+        self.assertIs(first.seat_store, second.seat_store)
+        first.book_ticket("Z100", Passenger("Seat", 22, "M", "3", "seat@example.com"), days_ahead(150))
+        self.assertEqual(second.trains["Z100"].seats_on(days_ahead(150)), 24)
+        self.assertEqual(second.trains["Z100"].available_seats, 24)
+        self.assertIsNone(second.book_tickets_batch("Z100", [Passenger("Big", 50, "F", "4", "big@example.com")] * 25,
+                                                    days_ahead(150)))
+        first.close()
+        second.close()
+        
+        restarted = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False, shared_seats=True)
+        self.assertEqual(restarted.trains["Z100"].seats_on(days_ahead(150)), 24)  # From the saved bookings
+        self.assertEqual(len(restarted.trains["Z100"].bookings), 6)
+        restarted.close()
+    
+    def test_one_cancellation_per_booking_across_workers(self):
+        """Test two workers cancelling the same booking give its seat back only once."""
+        first = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False, shared_seats=True)
+        first.add_train(Train("Z200", "Pair", "Oslo", "Lillehammer", "09:00", "11:00", 2, 40.0))
+        pair = first.book_tickets_batch("Z200", [Passenger("Pair", 30, "F", "5", "pair@example.com")] * 2,
+                                        days_ahead(150))
+        second = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False, shared_seats=True)
+
+        self.assertTrue(first.cancel_booking(pair[0].booking_id))
+        self.assertFalse(second.cancel_booking(pair[0].booking_id))
+        self.assertEqual(second.get_booking(pair[0].booking_id).status, "Cancelled")
+        self.assertEqual(second.trains["Z200"].seats_on(days_ahead(150)), 1)
+        rebook = [Passenger(f"Rebook {i}", 30, "M", "6", "rebook@example.com") for i in range(2)]
+        self.assertEqual([worker.book_ticket("Z200", passenger, days_ahead(150)) is not None
+                          for worker, passenger in zip((first, second), rebook)], [True, False])
+        first.close()
+        second.close()
+
+        reloaded = TrainBookingSystem(self.data_file, storage_mode="sqlite", group_commit=False)
+        self.assertEqual(len(reloaded.trains["Z200"].bookings), 2)
+        reloaded.close()
+
+    def test_refused_for_storage_that_overwrites_other_workers(self):
+        """Test shared seats need storage that merges every worker's bookings."""
+        for options in ({"storage_mode": "json"}, {"storage_mode": "journal"}, {"storage_mode": "binary"},
+                        {"storage_mode": "sqlite", "shard_by": "hash"}):
+            with self.assertRaises(ValueError):
+                TrainBookingSystem(self.data_file, group_commit=False, shared_seats=True, **options)
+
+class TestShardedStorage(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a temporary data directory with an unsharded data file."""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.test_dir, "shard_test.json")
+        system = TrainBookingSystem(self.data_file)
+        self.passenger = Passenger("Shard User", 33, "F", "1", "shard@example.com")
+        for train_id in ("T001", "E001", "A001"):
+            system.book_ticket(train_id, self.passenger, days_ahead(180))
+        self.bookings = {b: booking.to_dict() for b, booking in system.bookings.items()}
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def shard_file(self, name):
+        return os.path.join(self.test_dir, f"shard_test.shard-{name}.json")
+    
+    def test_region_shards_from_unsharded_file(self):
+        """Test region shards take over the data file and each write touches only its shard."""
+        system = TrainBookingSystem(self.data_file, shard_by="region")
+        self.assertEqual({b: booking.to_dict() for b, booking in system.bookings.items()}, self.bookings)
+        self.assertEqual(sorted(system.bookings.shards), ["asia", "europe", "north-america"])
+        system.book_ticket("E002", self.passenger, days_ahead(181))  # First write saves every shard
+        self.assertTrue(os.path.exists(self.shard_file("oceania")))
+        asia_generation = system.storage.shard("asia").generation
+        
+        booking = system.get_passenger_bookings("shard@example.com")[0]
+        self.assertTrue(system.cancel_booking(booking.booking_id))
+        self.assertEqual(system.storage.shard("asia").generation, asia_generation)
+        self.assertEqual(len(system.get_passenger_bookings("shard@example.com")), 3)
+        
+        restarted = TrainBookingSystem(self.data_file, shard_by="region")
+        self.assertEqual({b: x.to_dict() for b, x in restarted.bookings.items()},
+                         {b: x.to_dict() for b, x in system.bookings.items()})
+        self.assertEqual(restarted.bookings[booking.booking_id].status, "Cancelled")
+        self.assertEqual(restarted.trains["E002"].seats_on(days_ahead(181)), restarted.trains["E002"].total_seats - 1)
+        self.assertEqual(len(restarted.trains), len(system.trains))
+    
+    def test_layout_change_reshards_journaled_data(self):
+        """Test changing the shard layout reads the old shards and rewrites them in the new one."""
+        system = TrainBookingSystem(self.data_file, "journal", shard_by="region")
+        system.book_ticket("A002", self.passenger, days_ahead(182))  # Journaled after the full save
+        resharded = TrainBookingSystem(self.data_file, "journal", shard_by="hash", shards=3)
+        self.assertEqual(len(resharded.bookings), 4)
+        self.assertLessEqual(set(resharded.bookings.shards), {"0", "1", "2"})
+        self.assertTrue(resharded.storage.needs_compaction())
+        resharded.book_ticket("T002", self.passenger, days_ahead(183))
+        self.assertFalse(resharded.storage.needs_compaction())
+        
+        restarted = TrainBookingSystem(self.data_file, "journal", shard_by="hash", shards=3)
+        self.assertEqual({b: x.to_dict() for b, x in restarted.bookings.items()},
+                         {b: x.to_dict() for b, x in resharded.bookings.items()})
+
+class TestConcurrentBooking(unittest.TestCase):
+    
+    def setUp(self):
+        """Use a short thread switch interval to force interleaving."""
+        self.test_dir = tempfile.mkdtemp()
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+    
+    def tearDown(self):
+        """Restore the interpreter and remove data files."""
+        sys.setswitchinterval(self.switch_interval)
+        shutil.rmtree(self.test_dir)
+    
+    def hammer(self, storage_mode, seats=60, threads=12, attempts=15, compact_threshold=None,
+               group_commit=False):
+        """Book from many threads at once and check nothing is oversold or lost."""
+        data_file = os.path.join(self.test_dir, f"{storage_mode}.json")
+        system = TrainBookingSystem(data_file, storage_mode=storage_mode, group_commit=group_commit)
+        if compact_threshold is not None:
+            system.storage.compact_threshold = compact_threshold
+        system.add_train(Train("RUSH", "Rush Hour", "Here", "There", "08:00", "09:00", seats, 10.0))
+        system.add_train(Train("CALM", "Off Peak", "Here", "There", "10:00", "11:00", seats, 10.0))
+        results = []
+        
+        def worker(index):
+            passenger = Passenger(f"Rider {index}", 30, "M", "1234567890", f"rider{index}@example.com")
+            for attempt in range(attempts):
+                train_id = "RUSH" if attempt % 2 == 0 else "CALM"
+                results.append(system.book_ticket(train_id, passenger, days_ahead(20)))
+        
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        system.close()
+        
+        booked = [booking for booking in results if booking is not None]
+        self.assertEqual(len(booked), 2 * seats)
+        self.assertEqual(len({booking.booking_id for booking in booked}), 2 * seats)
+        for train_id in ("RUSH", "CALM"):
+            self.assertEqual(system.trains[train_id].available_seats, 0)
+            self.assertEqual(len(system.trains[train_id].bookings), seats)
+        
+        reloaded = TrainBookingSystem(data_file, storage_mode=storage_mode)
+        self.assertEqual(set(reloaded.bookings), {booking.booking_id for booking in booked})
+        self.assertEqual(reloaded.trains["RUSH"].available_seats, 0)
+        reloaded.storage.close()
+    
+    def test_concurrent_booking_json(self):
+        """Stress test full-snapshot persistence."""
+        self.hammer("json")
+    
+    def test_concurrent_booking_journal(self):
+        """Stress test journal persistence with compaction in the mix."""
+        self.hammer("journal", compact_threshold=25)
+    
+    def test_concurrent_booking_group_commit(self):
+        """Stress test the background writer with compaction in the mix."""
+        self.hammer("journal", compact_threshold=25, group_commit=True)
+    
+    def test_concurrent_cancellation_releases_once(self):
+        """Test that racing cancellations of one booking release one seat."""
+        system = TrainBookingSystem(os.path.join(self.test_dir, "cancel.json"))
+        passenger = Passenger("Racer", 30, "F", "1234567890", "racer@example.com")
+        booking = system.book_ticket("T001", passenger, days_ahead(20))
+        outcomes = []
+        
+        workers = [threading.Thread(target=lambda: outcomes.append(system.cancel_booking(booking.booking_id)))
+                   for _ in range(8)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        
+        self.assertEqual(outcomes.count(True), 1)
+        self.assertEqual(system.trains["T001"].available_seats, 100)
+
+class TestAsyncBooking(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a temporary data directory."""
+        self.test_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Remove data files."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_background_writer_groups_and_acks(self):
+        """Test sync and async acks with the group-commit writer thread."""
+        for storage_mode in ("json", "journal", "sqlite"):
+            data_file = os.path.join(self.test_dir, f"writer_{storage_mode}.json")
+            system = TrainBookingSystem(data_file, storage_mode=storage_mode, group_commit=True)
+            self.assertIsInstance(system.writer, BackgroundWriter)
+            
+            def book(i):
+                passenger = Passenger(f"Writer {i}", 30, "F", "1234567890", f"writer{i}@example.com")
+                return system.book_ticket("T001", passenger, days_ahead(40))
+            
+            workers = [threading.Thread(target=book, args=(i,)) for i in range(30)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            system.wait_durable(timeout=5)  # Sync ack
+            stats = system.writer.get_stats()
+            self.assertEqual((stats["records_written"], stats["pending"]), (30, 0))
+            self.assertLess(stats["groups_written"], 30)
+            
+            # Async ack: the cancellation is queued, and close() writes it
+            cancelled = next(iter(system.bookings))
+            self.assertTrue(system.cancel_booking(cancelled))
+            system.close()
+            self.assertIsNone(system.writer)
+            
+            reloaded = TrainBookingSystem(data_file, storage_mode=storage_mode)
+            self.assertEqual(len(reloaded.bookings), 30)
+            self.assertEqual(reloaded.bookings[cancelled].status, "Cancelled")
+            self.assertEqual(reloaded.trains["T001"].seats_on(days_ahead(40)), 71)
+            reloaded.close()
+    
+    def test_concurrent_bookings_share_group_commits(self):
+        """Test that awaited bookings are durable and written in groups."""
+        data_file = os.path.join(self.test_dir, "async.json")
+        system = TrainBookingSystem(data_file, storage_mode="journal")
+        service = AsyncBookingService(system, commit_window=0.01)
+        
+        async def run():
+            await service.start()
+            bookings = await asyncio.gather(*(
+                service.book_ticket("T001", Passenger(f"Async {i}", 30, "F", "1234567890",
+                                                      f"async{i}@example.com"), days_ahead(40))
+                for i in range(40)))
+            # Writes from a worker thread are picked up by the same writer
+            loop = asyncio.get_running_loop()
+            threaded = await loop.run_in_executor(None, lambda: system.book_ticket(
+                "T002", Passenger("Thread", 40, "M", "1234567890", "thread@example.com"), days_ahead(40)))
+            await loop.run_in_executor(None, system.wait_durable)
+            found = await service.search_trains("New York", "Boston", days_ahead(40))
+            await service.stop()
+            return bookings + [threaded], found
+        
+        bookings, found = asyncio.run(run())
+        self.assertIsNone(system.writer)
+        self.assertEqual(found[0].seats_on(days_ahead(40)), 60)
+        stats = service.get_stats()
+        self.assertEqual(stats["records_written"], 41)
+        self.assertLess(stats["groups_written"], 10)
+        
+        reloaded = TrainBookingSystem(data_file, storage_mode="journal")
+        self.assertEqual(set(reloaded.bookings), {booking.booking_id for booking in bookings})
+        reloaded.storage.close()
+        system.storage.close()
+    
+    @unittest.skipUnless(find_spec("flask"), "Flask not installed")
+    def test_asgi_app_serves_flask_routes(self):
+        """Test the ASGI bridge through lifespan, a search page and a booking."""
+        from asgi import create_asgi_app
+        asgi_app = create_asgi_app(os.path.join(self.test_dir, "asgi.json"))
+        
+        async def call(path, body, content_type):
+            sent = []
+            
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+            
+            async def send(message):
+                sent.append(message)
+            
+            await asgi_app({"type": "http", "method": "POST", "path": path, "query_string": b"",
+                            "headers": [(b"content-type", content_type)]}, receive, send)
+            return sent[0]["status"], sent[1]["body"]
+        
+        async def run():
+            lifespan = asyncio.Queue()
+            started = []
+            
+            async def send_lifespan(message):
+                started.append(message["type"])
+            
+            server = asyncio.ensure_future(asgi_app({"type": "lifespan"}, lifespan.get, send_lifespan))
+            await lifespan.put({"type": "lifespan.startup"})
+            while not started:
+                await asyncio.sleep(0.001)
+            booking = await call("/api/bookings/batch", json.dumps({
+                "train_id": "T001", "journey_date": days_ahead(40),
+                "passengers": [{"name": "Asgi", "age": 30, "gender": "F", "phone": "5",
+                                "email": "asgi@example.com"}]}).encode(), b"application/json")
+            search = await call("/search", f"source=New+York&destination=Boston&journey_date={days_ahead(40)}".encode(),
+                                b"application/x-www-form-urlencoded")
+            await lifespan.put({"type": "lifespan.shutdown"})
+            await server
+            return booking, search
+        
+        (booking_status, _), (search_status, page) = asyncio.run(run())
+        self.assertEqual(booking_status, 201)
+        self.assertEqual(search_status, 200)
+        self.assertIn(b"Express Mail", page)
+        self.assertEqual(asgi_app.service.get_stats()["records_written"], 1)
 
 def run_tests():
     """Run all tests."""
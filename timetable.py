@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Shared timetable for Train Booking System
+Compile the static part of every train into a file that worker processes
+map read-only, so the page cache holds one copy however many workers run
+"""
+
+import hashlib
+import json
+import mmap
+import struct
+from typing import Dict, Iterable, List, Optional
+
+from utils import atomic_file, journey_minutes, parse_timetable_time
+
+TIMETABLE_MAGIC = b"TBTIMES\n"
+TIMETABLE_VERSION = 1
+# magic, version, trains, strings, fingerprint of the train data it was compiled from
+_HEADER = struct.Struct("<8sHII32s")
+# Static fields of one train; strings are numbers in the string table
+_RECORD = struct.Struct("<IIIIIIiiiiId")
+_UINT = struct.Struct("<I")
+_NONE = -2 ** 31  # stands in for a time that could not be parsed
+
+# Record fields in order, and whether each is a string table reference
+TIMETABLE_FIELDS = (
+    ('train_id', True), ('name', True), ('source', True), ('destination', True),
+    ('departure_time', True), ('arrival_time', True), ('departure_minutes', False),
+    ('arrival_minutes', False), ('arrival_day_offset', False), ('duration_minutes', False),
+    ('total_seats', False), ('price', False)
+)
+# What a stored train dict needs for its timetable record
+_SOURCE_FIELDS = ('train_id', 'name', 'source', 'destination', 'departure_time', 'arrival_time',
+                  'total_seats', 'price')
+
+
+def timetable_fingerprint(trains: Iterable[Dict]) -> bytes:
+    """SHA-256 of the static fields of stored train dicts, in order"""
+    rows = [[train[field] for field in _SOURCE_FIELDS] for train in trains]
+    return hashlib.sha256(json.dumps(rows, separators=(',', ':')).encode('utf-8')).digest()
+
+
+def compile_timetable(trains: List[Dict], path: str, fingerprint: bytes = None):
+    """Write the timetable file for stored train dicts, replacing any old one atomically
+
+    Layout after the header: one fixed-size record per train in timetable
+    order, record numbers sorted by train ID for lookups, then the string
+    table as offsets into one UTF-8 blob. Station names and times that
+    several trains share are stored once.
+    """
+    strings = {}
+
+    def string(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    records = []
+    for train in trains:
+        departure = parse_timetable_time(train['departure_time'])
+        arrival = parse_timetable_time(train['arrival_time'])
+        duration = journey_minutes(train['departure_time'], train['arrival_time'])
+        records.append(_RECORD.pack(
+            string(train['train_id']), string(train['name']), string(train['source']),
+            string(train['destination']), string(train['departure_time']), string(train['arrival_time']),
+            departure[0] if departure else _NONE,
+            arrival[0] if arrival else _NONE,
+            arrival[1] if arrival else _NONE,
+            duration if duration is not None else _NONE,
+            train['total_seats'], train['price']
+        ))
+    by_id = sorted(range(len(trains)), key=lambda i: trains[i]['train_id'].encode('utf-8'))
+
+    blob = bytearray()
+    offsets = [0]
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+    with atomic_file(path) as f:
+        f.write(_HEADER.pack(TIMETABLE_MAGIC, TIMETABLE_VERSION, len(records), len(strings),
+                             fingerprint or timetable_fingerprint(trains)))
+        f.write(b''.join(records))
+        f.write(struct.pack(f"<{len(by_id)}I", *by_id))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(blob)
+
+
+class MappedTimetable:
+    """Read-only view of a compiled timetable file through mmap
+
+    Every lookup unpacks its value straight from the mapped buffer; nothing
+    is copied into the process up front.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < _HEADER.size:
+                raise ValueError(f"{path} is too short to be a timetable")
+            magic, version, self.count, strings, self.fingerprint = _HEADER.unpack_from(self._map)
+            if magic != TIMETABLE_MAGIC or version != TIMETABLE_VERSION:
+                raise ValueError(f"{path} is not a version {TIMETABLE_VERSION} timetable")
+            self._records = _HEADER.size
+            self._by_id = self._records + self.count * _RECORD.size
+            self._offsets = self._by_id + self.count * _UINT.size
+            self._blob = self._offsets + (strings + 1) * _UINT.size
+            if len(self._map) != self._blob + _UINT.unpack_from(self._map, self._blob - _UINT.size)[0]:
+                raise ValueError(f"{path} is truncated")
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+        # (struct, offset) to read one field of a record without unpacking the rest
+        self._fields = {}
+        offset = 0
+        for (name, is_string), code in zip(TIMETABLE_FIELDS, _RECORD.format[1:]):
+            self._fields[name] = (struct.Struct('<' + code), offset, is_string)
+            offset += struct.calcsize('<' + code)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def field(self, index: int, name: str):
+        """One field of the train in record index"""
+        reader, offset, is_string = self._fields[name]
+        (value,) = reader.unpack_from(self._map, self._records + index * _RECORD.size + offset)
+        if is_string:
+            return self.string(value)
+        return None if value == _NONE else value
+
+    def string(self, number: int) -> str:
+        start, end = struct.unpack_from("<II", self._map, self._offsets + number * _UINT.size)
+        return str(self._map[self._blob + start:self._blob + end], 'utf-8')
+
+    def find(self, train_id: str) -> Optional[int]:
+        """Record index of a train, by binary search over the sorted ID list"""
+        key = train_id.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            (index,) = _UINT.unpack_from(self._map, self._by_id + middle * _UINT.size)
+            found = self.field(index, 'train_id').encode('utf-8')
+            if found == key:
+                return index
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def close(self):
+        self._map.close()
+
+
+def open_timetable(path: str, trains: List[Dict]) -> MappedTimetable:
+    """Map the timetable for stored train dicts, compiling it first if missing or out of date
+
+    Workers starting together may all compile it; each writes a complete
+    file and renames it into place, so every one of them maps a valid copy.
+    """
+    fingerprint = timetable_fingerprint(trains)
+    try:
+        timetable = MappedTimetable(path)
+    except (OSError, ValueError):
+        timetable = None
+    if timetable is not None and timetable.fingerprint == fingerprint:
+        return timetable
+    if timetable is not None:
+        timetable.close()
+    compile_timetable(trains, path, fingerprint)
+    return MappedTimetable(path)
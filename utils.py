@@ -4,10 +4,16 @@ Utility functions for Train Booking System
 Contains helper functions and common operations
 """
 
+import gc
 import json
+import os
+import shutil
 import uuid
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
+
+from config import BACKUP_GENERATIONS
 
 def generate_booking_id() -> str:
     """Generate a unique booking ID"""
@@ -55,35 +61,42 @@ def format_time(time_str: str) -> str:
     except ValueError:
         return time_str
 
+def parse_timetable_time(time_str: str) -> Optional[Tuple[int, int]]:
+    """Parse a timetable time like "08:10" or "06:50+2" into (minutes past midnight, day offset)"""
+    try:
+        clock, _, offset = time_str.partition('+')
+        time_obj = datetime.strptime(clock, "%H:%M")
+        days = int(offset) if offset else 0
+    except (AttributeError, ValueError):
+        return None
+    if days < 0:
+        return None
+    return time_obj.hour * 60 + time_obj.minute, days
+
+def format_duration(minutes: int) -> str:
+    """Format a duration given in minutes as hours and minutes (330 -> 5h 30m)"""
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0 and minutes > 0:
+        return f"{hours}h {minutes}m"
+    elif hours > 0:
+        return f"{hours}h"
+    else:
+        return f"{minutes}m"
+
+def journey_minutes(departure: str, arrival: str) -> Optional[int]:
+    """Minutes from departure to arrival, honouring "+N" day offsets"""
+    departure, arrival = parse_timetable_time(departure), parse_timetable_time(arrival)
+    if departure is None or arrival is None:
+        return None
+    minutes = (arrival[1] - departure[1]) * 1440 + arrival[0] - departure[0]
+    if minutes < 0:
+        minutes += 1440  # Overnight arrival written without "+1"
+    return minutes
+
 def calculate_journey_duration(departure: str, arrival: str) -> str:
     """Calculate journey duration between departure and arrival times"""
-    try:
-        # Handle next day arrivals (marked with +1)
-        if arrival.endswith('+1'):
-            arrival_clean = arrival[:-2]
-            dep_time = datetime.strptime(departure, "%H:%M")
-            arr_time = datetime.strptime(arrival_clean, "%H:%M")
-            # Add 24 hours for next day
-            arr_time += timedelta(days=1)
-        else:
-            dep_time = datetime.strptime(departure, "%H:%M")
-            arr_time = datetime.strptime(arrival, "%H:%M")
-        
-        duration = arr_time - dep_time
-        hours = duration.seconds // 3600
-        minutes = (duration.seconds % 3600) // 60
-        
-        if duration.days > 0:
-            hours += duration.days * 24
-        
-        if hours > 0 and minutes > 0:
-            return f"{hours}h {minutes}m"
-        elif hours > 0:
-            return f"{hours}h"
-        else:
-            return f"{minutes}m"
-    except ValueError:
-        return "Unknown"
+    minutes = journey_minutes(departure, arrival)
+    return format_duration(minutes) if minutes is not None else "Unknown"
 
 def sanitize_input(input_str: str) -> str:
     """Sanitize user input by removing dangerous characters"""
@@ -108,22 +121,96 @@ def generate_ticket_number() -> str:
     random_part = str(uuid.uuid4())[:8].upper()
     return f"TKT-{timestamp}-{random_part}"
 
-def backup_data(source_file: str, backup_suffix: str = "backup") -> bool:
-    """Create a backup of the data file"""
+@contextmanager
+def atomic_file(path: str):
+    """Open a temp file for writing that replaces path (fsynced, by rename) once the block completes"""
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+@contextmanager
+def gc_paused():
+    """Suspend cyclic garbage collection for a block that builds many long-lived objects
+
+    Each collection triggered mid-build would rescan everything built so far,
+    so the time to load millions of bookings grows far faster than their number.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Replace a file via temp file, fsync and rename, so readers never see it half-written"""
+    with atomic_file(path) as f:
+        f.write(data)
+
+def fsync_directory(directory: str) -> None:
+    """Make a rename in directory durable (a no-op where directories can't be opened)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def backup_files(source_file: str, backup_suffix: str = "backup") -> List[str]:
+    """Existing rotating backups of a file, newest first"""
+    backups = []
+    generation = 1
+    while os.path.exists(f"{source_file}.{backup_suffix}.{generation}"):
+        backups.append(f"{source_file}.{backup_suffix}.{generation}")
+        generation += 1
+    return backups
+
+def backup_data(source_file: str, backup_suffix: str = "backup", keep: int = BACKUP_GENERATIONS,
+                link: bool = False) -> bool:
+    """Save the file as the newest of `keep` rotating backups (<file>.backup.1 is newest)
+    
+    With link=True the backup is a hard link instead of a copy; only use it
+    for files that are always replaced by rename, never rewritten in place.
+    """
     try:
-        import shutil
-        backup_file = f"{source_file}.{backup_suffix}"
-        shutil.copy2(source_file, backup_file)
+        base = f"{source_file}.{backup_suffix}"
+        for generation in range(keep - 1, 0, -1):
+            if os.path.exists(f"{base}.{generation}"):
+                os.replace(f"{base}.{generation}", f"{base}.{generation + 1}")
+        newest = f"{base}.1"
+        if os.path.exists(newest):
+            os.remove(newest)
+        if link:
+            try:
+                os.link(source_file, newest)
+                return True
+            except OSError:
+                pass  # No hard links on this file system: copy instead
+        shutil.copy2(source_file, newest)
         return True
     except Exception as e:
         print(f"Backup failed: {e}")
         return False
 
 def restore_data(backup_file: str, target_file: str) -> bool:
-    """Restore data from backup file"""
+    """Restore data from backup file, replacing the target atomically"""
     try:
-        import shutil
-        shutil.copy2(backup_file, target_file)
+        with open(backup_file, 'rb') as f:
+            atomic_write(target_file, f.read())
         return True
     except Exception as e:
         print(f"Restore failed: {e}")